@@ -4,6 +4,9 @@ Comedy Club AI - Modalità Orfeo con RAG Enhancement
 """
 
 import argparse
+import contextlib
+import json
+import random
 import sys
 import os
 
@@ -13,13 +16,63 @@ sys.path.append(os.path.dirname(__file__))
 
 from src.core.comedy_club_clean import ComedyClub
 from config.orfeo_config_new import get_ssh_command, is_orfeo_available
+from src.utils.tracing import enable_tracing, tracer
+from src.utils.profiling import SampledProfiler
+
+def report_telemetry(club, dump_path=None):
+    """Stampa il riepilogo della telemetria LLM e, se richiesto, la salva su file"""
+    telemetry = getattr(club.client, 'telemetry', None)
+    if telemetry is None or not telemetry.calls:
+        return
+    print("\n⏱️ TELEMETRIA LLM:")
+    for line in telemetry.format_report():
+        print(f"   {line}")
+    if dump_path:
+        telemetry.dump(dump_path)
+        print(f"💾 Telemetria salvata in {dump_path}")
+
+def report_trace(trace_path):
+    """Stampa il tempo per fase della pipeline e salva la traccia in formato Chrome"""
+    if not tracer.enabled:
+        return
+    lines = tracer.format_summary()
+    if lines:
+        print("\n🔬 FASI DELLA PIPELINE (per tempo self):")
+        for line in lines:
+            print(f"   {line}")
+    events = tracer.export(trace_path)
+    print(f"💾 Traccia ({events} span) salvata in {trace_path} - apri con chrome://tracing o ui.perfetto.dev")
+
+def run_batch(club, args):
+    """Modalità batch: griglia spettacoli x temi x comici, risultati in streaming su file"""
+    from src.core.batch_runner import BatchRunner
+    
+    topics = [t.strip() for t in args.topics.split(',')] if args.topics else None
+    comedians = [c.strip().capitalize() for c in args.comedians.split(',')] if args.comedians else None
+    runner = BatchRunner(club, args.output, shows=args.shows, topics=topics, comedians=comedians,
+                         concurrency=args.concurrency)
+    
+    # Headless: le stampe di generazione vanno scartate, l'avanzamento va su stderr
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        summary = runner.run()
+    print(f"✅ Batch completato: {json.dumps(summary)}")
 
 def main():
     parser = argparse.ArgumentParser(description='Comedy Club AI con Orfeo + RAG')
-    parser.add_argument('--mode', choices=['interactive', 'show', 'test', 'joke'], default='interactive',
+    parser.add_argument('--mode', choices=['interactive', 'show', 'test', 'joke', 'batch'], default='interactive',
                         help='Modalità di esecuzione')
     parser.add_argument('--rounds', type=int, default=2,
                         help='Numero di round per lo spettacolo')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Battute generate in parallelo in modalità show e batch (default: 4)')
+    parser.add_argument('--shows', type=int, default=1,
+                        help='Modalità batch: numero di spettacoli sulla griglia temi x comici')
+    parser.add_argument('--topics',
+                        help='Modalità batch: temi separati da virgola (default: tutti i temi del club)')
+    parser.add_argument('--comedians',
+                        help='Modalità batch: comici separati da virgola (default: tutti)')
+    parser.add_argument('--output', default='logs/batch_jokes.jsonl',
+                        help='Modalità batch: file risultati .jsonl o .parquet (ripresa automatica)')
     parser.add_argument('--comedian', 
                         help='Comico specifico (Jerry, Penny, Raven, Cosmic)')
     parser.add_argument('--topic', 
@@ -28,22 +81,78 @@ def main():
                         help='Disabilita ricerca web per contesto attuale')
     parser.add_argument('--offline', action='store_true',
                         help='Disabilita tutte le funzionalità web (equivale a --no-web-search)')
+    parser.add_argument('--cache', choices=['off', 'read_through', 'replay'],
+                        help='Cache risposte LLM: off, read_through o replay (solo cache, nessun backend)')
+    parser.add_argument('--cache-dir',
+                        help='Directory della cache risposte (default: logs/llm_cache)')
+    parser.add_argument('--multi-backend', action='store_true',
+                        help='Distribuisce le richieste su tutti i backend Orfeo configurati')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Con --multi-backend, duplica le richieste lente su un altro backend')
+    parser.add_argument('--candidates', type=int, default=1,
+                        help='Battute candidate per richiesta, viene scelta la migliore '
+                             '(default: 1; N>1 costa N volte i token decodificati)')
+    parser.add_argument('--pool', type=int, default=0,
+                        help='Battute pronte in background per comico sul tema corrente (default: 0, disabilitato)')
+    parser.add_argument('--sessions', action='store_true',
+                        help='Persona di ogni comico come prefisso di sessione riusato (keep_alive)')
+    parser.add_argument('--adaptive-prompts', action='store_true',
+                        help='Aggiunge ai prompt il feedback appreso dai rating umani')
+    parser.add_argument('--stream', action='store_true',
+                        help='Usa lo streaming per misurare il time-to-first-token')
+    parser.add_argument('--telemetry-dump',
+                        help='Salva la telemetria delle chiamate LLM (JSON) a fine esecuzione')
+    parser.add_argument('--trace',
+                        help='Traccia le fasi di ogni battuta e salva gli span (formato Chrome trace) in questo file')
+    parser.add_argument('--profile-every', type=int, default=0,
+                        help='Profila una battuta ogni N (0 = disattivato)')
+    parser.add_argument('--profile-mode', choices=['sampler', 'cprofile'], default='sampler',
+                        help='Campionatore statistico (stack completi) o cProfile deterministico')
+    parser.add_argument('--profile-output', default='logs/profile',
+                        help='Prefisso dei file di profiling (.folded per flamegraph, .prof con cProfile)')
+    parser.add_argument('--db',
+                        help='Database SQLite per feedback, rating e miglioramenti (importa i JSON in logs/ alla prima apertura)')
+    parser.add_argument('--seed', type=int,
+                        help='Seed per scelte casuali (necessario per replay deterministici)')
     
     args = parser.parse_args()
     
-    # Controlla configurazione Orfeo
-    if not is_orfeo_available():
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.cache_dir:
+        os.environ['ORFEO_CACHE_DIR'] = args.cache_dir
+    if args.stream:
+        os.environ['ORFEO_STREAM'] = '1'
+    if args.trace:
+        enable_tracing()
+    
+    # Controlla configurazione Orfeo (non necessaria in replay)
+    if not is_orfeo_available() and args.cache != 'replay':
         print("❌ Configurazione Orfeo non trovata!")
         print(f"💡 Esegui prima: source config/set_env.sh")
         print(f"📡 Poi assicurati che sia attivo: {get_ssh_command()}")
         return 1
     
+    club = None
     try:
         # Determina impostazioni web search (default: True, disabilita con --no-web-search o --offline)
         use_web_search = not (args.offline or args.no_web_search)
+        if args.cache == 'replay' and use_web_search:
+            # Il contesto web cambia nel tempo e renderebbe i prompt (e le chiavi) non riproducibili
+            print("💾 Replay: ricerca web disabilitata per prompt riproducibili")
+            use_web_search = False
+        
+        profiler = None
+        if args.profile_every > 0:
+            profiler = SampledProfiler(every=args.profile_every, mode=args.profile_mode,
+                                       output=args.profile_output)
         
         # Crea il comedy club con configurazione RAG
-        club = ComedyClub(use_web_search=use_web_search)
+        club = ComedyClub(use_web_search=use_web_search, cache_mode=args.cache,
+                          multi_backend=args.multi_backend, hedge=args.hedge,
+                          num_candidates=args.candidates, use_sessions=args.sessions,
+                          pool_size=args.pool, profiler=profiler, db_path=args.db,
+                          adaptive_prompts=args.adaptive_prompts)
         
         print(f"🌐 Web search: {'✅ Abilitato' if use_web_search else '❌ Disabilitato'}")
         
@@ -53,7 +162,7 @@ def main():
             
         elif args.mode == 'show':
             print(f"\n🎪 Avvio spettacolo di {args.rounds} round...")
-            club.run_show(args.rounds)
+            club.run_show(args.rounds, concurrency=args.concurrency)
             
         elif args.mode == 'test':
             print("\n🧪 Modalità test - battuta singola:")
@@ -65,6 +174,10 @@ def main():
             joke = club.get_joke(comedian_name=args.comedian, topic=args.topic)
             print(f"🎤 {joke}")
             
+        elif args.mode == 'batch':
+            print("\n📦 Modalità batch headless:")
+            run_batch(club, args)
+            
     except KeyboardInterrupt:
         print("\n👋 Arrivederci!")
     except Exception as e:
@@ -75,6 +188,12 @@ def main():
         print("   3. Orfeo è raggiungibile")
         print("   4. Per RAG: python scripts/generate_embeddings.py")
         return 1
+    finally:
+        if club is not None:
+            club.close()
+            report_telemetry(club, args.telemetry_dump)
+        if args.trace:
+            report_trace(args.trace)
 
 if __name__ == "__main__":
     exit(main() or 0)
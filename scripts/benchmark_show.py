@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark di spettacoli completi contro il server mock Orfeo:
+misura throughput e percentili di latenza di ComedyClub.run_show
+"""
+import sys
+import os
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import contextlib
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+
+from mock_orfeo_server import MockOrfeoServer, add_mock_arguments, settings_from_args
+
+
+def percentile(samples, pct):
+    """Percentile per rango più vicino (samples non vuoto)"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(samples) -> dict:
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "max": max(samples)
+    }
+
+
+def instrument_club(club, joke_latencies, lock):
+    """Avvolge club.get_joke per registrare la latenza di ogni battuta"""
+    original_get_joke = club.get_joke
+
+    def timed_get_joke(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_get_joke(*args, **kwargs)
+        finally:
+            with lock:
+                joke_latencies.append(time.perf_counter() - start)
+
+    club.get_joke = timed_get_joke
+
+
+def run_benchmark(args) -> dict:
+    from src.core.comedy_club_clean import ComedyClub
+    from src.core.orfeo_client_new import OrfeoClient
+
+    server = None
+    if args.url:
+        client_config = {"model": args.model, "base_url": args.url, "api_key": "mock-token"}
+    else:
+        server = MockOrfeoServer(settings=settings_from_args(args)).start()
+        client_config = server.client_config()
+
+    joke_latencies = []
+    show_durations = []
+    lock = threading.Lock()
+    quiet = open(os.devnull, "w") if not args.verbose else None
+
+    try:
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            club = ComedyClub(use_web_search=False, use_rag=args.rag, use_rating=False,
+                              num_candidates=args.candidates, use_sessions=args.sessions,
+                              client=OrfeoClient(cache_mode="off", config=client_config))
+        instrument_club(club, joke_latencies, lock)
+
+        print(f"🏁 Benchmark: {args.shows} spettacoli x {args.rounds} round contro {client_config['base_url']}")
+        bench_start = time.perf_counter()
+        for show_index in range(args.shows):
+            show_start = time.perf_counter()
+            with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+                club.run_show(args.rounds, concurrency=args.concurrency, pause=args.pause)
+            show_durations.append(time.perf_counter() - show_start)
+            print(f"   Spettacolo {show_index + 1}/{args.shows}: {show_durations[-1]:.2f}s")
+        wall_time = time.perf_counter() - bench_start
+    finally:
+        if quiet:
+            quiet.close()
+        if server:
+            server.stop()
+
+    results = {
+        "shows": args.shows,
+        "rounds": args.rounds,
+        "wall_time_s": wall_time,
+        "jokes": len(joke_latencies),
+        "jokes_per_sec": len(joke_latencies) / wall_time if wall_time else 0.0,
+        "joke_latency_s": latency_summary(joke_latencies),
+        "show_duration_s": latency_summary(show_durations),
+        "server": server.stats() if server else None
+    }
+    return results
+
+
+def print_report(results: dict):
+    print("\n" + "=" * 60)
+    print("📊 RISULTATI BENCHMARK")
+    print("=" * 60)
+    print(f"   Tempo totale: {results['wall_time_s']:.2f}s")
+    print(f"   Battute: {results['jokes']} ({results['jokes_per_sec']:.2f} battute/s)")
+    for label, key in (("Latenza battuta", "joke_latency_s"), ("Durata spettacolo", "show_duration_s")):
+        summary = results[key]
+        if summary["count"]:
+            print(f"   {label}: p50 {summary['p50']:.3f}s | p90 {summary['p90']:.3f}s | "
+                  f"p99 {summary['p99']:.3f}s | max {summary['max']:.3f}s")
+    if results["server"]:
+        print(f"   Server mock: {results['server']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark spettacoli Comedy Club contro il mock Orfeo')
+    parser.add_argument('--shows', type=int, default=3, help='Numero di spettacoli')
+    parser.add_argument('--rounds', type=int, default=2, help='Round per spettacolo')
+    parser.add_argument('--concurrency', type=int, default=4, help='Battute generate in parallelo per round')
+    parser.add_argument('--pause', type=float, default=0.0, help='Pausa tra i comici in secondi')
+    parser.add_argument('--candidates', type=int, default=1, help='Candidate per battuta')
+    parser.add_argument('--sessions', action='store_true', help='Persona come prefisso di sessione riusato')
+    parser.add_argument('--rag', action='store_true', help='Abilita il RAG locale (richiede embeddings)')
+    parser.add_argument('--url', help='Usa un server già avviato invece del mock in-process')
+    parser.add_argument('--model', default='mock-llama3.3', help='Modello da richiedere con --url')
+    parser.add_argument('--seed', type=int, help='Seed per scelte casuali')
+    parser.add_argument('--output', help='Salva i risultati in JSON')
+    parser.add_argument('--workdir', help='Directory di lavoro per i log (default: temporanea)')
+    parser.add_argument('--verbose', action='store_true', help="Mostra l'output degli spettacoli")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    # I sistemi di feedback scrivono in logs/ relativo: isola il benchmark dai log reali
+    workdir = args.workdir or tempfile.mkdtemp(prefix="comedy_bench_")
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    if args.rag and not os.path.exists(os.path.join(workdir, "datasets")):
+        os.symlink(os.path.join(REPO_ROOT, "datasets"), os.path.join(workdir, "datasets"))
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(workdir)
+    print(f"📁 Log del benchmark in: {workdir}")
+
+    results = run_benchmark(args)
+    print_report(results)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Risultati salvati in {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
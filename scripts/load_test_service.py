@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Load test del servizio Comedy Club: N client contemporanei per una durata fissa,
+misura richieste/s sostenute e percentili di latenza
+"""
+import sys
+import os
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    print("❌ Il load test richiede aiohttp: pip install aiohttp")
+    sys.exit(1)
+
+from benchmark_show import latency_summary
+from mock_orfeo_server import MockOrfeoServer, add_mock_arguments, settings_from_args
+
+
+class InProcessService:
+    """Servizio avviato su un thread con il proprio event loop, contro il mock Orfeo"""
+
+    def __init__(self, args):
+        self.args = args
+        self.mock = None
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        from src.core.comedy_club_clean import ComedyClub
+        from src.core.orfeo_client_new import OrfeoClient
+        from src.service.comedy_service import ComedyService
+
+        self.mock = MockOrfeoServer(settings=settings_from_args(self.args)).start()
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            club = ComedyClub(use_web_search=False, use_rag=self.args.rag, use_rating=True,
+                              num_candidates=self.args.candidates, use_sessions=self.args.sessions,
+                              client=OrfeoClient(cache_mode="off", config=self.mock.client_config()))
+        self.service = ComedyService(club, max_inflight=self.args.max_inflight)
+        self._thread = threading.Thread(target=self._run, name="comedy-service", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.service.make_app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        if self._loop:
+            future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+            future.result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        if self.mock:
+            self.mock.stop()
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def record(self, latency, status):
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+
+
+async def _timed(stats, coro):
+    start = time.perf_counter()
+    try:
+        status = await coro
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        stats.errors[type(e).__name__] += 1
+        return None
+    stats.record(time.perf_counter() - start, status)
+    return status
+
+
+async def _post(http, url, payload):
+    async with http.post(url, json=payload) as response:
+        await response.read()
+        return response.status
+
+
+async def joke_worker(http, base_url, stats, deadline, args):
+    while time.perf_counter() < deadline:
+        await _timed(stats, _post(http, f"{base_url}/joke", {"topic": random.choice(args.topics)}))
+
+
+async def session_worker(http, base_url, stats, deadline, args):
+    async with http.post(f"{base_url}/sessions", json={"topic": random.choice(args.topics)}) as response:
+        session = await response.json()
+    session_url = f"{base_url}/sessions/{session['session_id']}"
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        async with http.post(f"{session_url}/joke", json={}) as response:
+            body = await response.json() if response.status == 200 else None
+        stats.record(time.perf_counter() - start, response.status)
+        if body and random.random() < args.rate_fraction:
+            await _timed(stats, _post(http, f"{session_url}/rate", {
+                "joke": body["joke"], "comedian": body["comedian"], "rating": random.choice(["like", "meh", "love"])
+            }))
+    await http.delete(session_url)
+
+
+async def show_worker(http, base_url, stats, deadline, args):
+    """Uno spettacolo WebSocket dopo l'altro; ogni atto ricevuto conta come una risposta"""
+    while time.perf_counter() < deadline:
+        async with http.post(f"{base_url}/sessions", json={"topic": random.choice(args.topics)}) as response:
+            session = await response.json()
+        url = f"{base_url}/sessions/{session['session_id']}/show?rounds={args.rounds}"
+        last = time.perf_counter()
+        try:
+            async with http.ws_connect(url) as ws:
+                async for msg in ws:
+                    act = msg.json()
+                    now = time.perf_counter()
+                    stats.record(now - last, act["kind"])
+                    last = now
+                    if act["kind"] == "show_end":
+                        break
+        except aiohttp.ClientError as e:
+            stats.errors[type(e).__name__] += 1
+        await http.delete(f"{base_url}/sessions/{session['session_id']}")
+
+
+WORKERS = {"joke": joke_worker, "session": session_worker, "show": show_worker}
+
+
+async def run_load(base_url, args) -> dict:
+    stats = LoadStats()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as http:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(WORKERS[args.mode](http, base_url, stats, deadline, args)
+                               for _ in range(args.concurrency)))
+        wall_time = time.perf_counter() - start
+        async with http.get(f"{base_url}/health") as response:
+            health = await response.json()
+    # Esito: codice HTTP, o tipo di atto per gli spettacoli WebSocket
+    ok = sum(count for status, count in stats.statuses.items() if status in (200, 201)
+             or (isinstance(status, str) and status != "error"))
+    return {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "wall_time_s": wall_time,
+        "requests": len(stats.latencies),
+        "ok": ok,
+        "requests_per_sec": len(stats.latencies) / wall_time if wall_time else 0.0,
+        "latency_s": latency_summary(stats.latencies),
+        "statuses": {str(k): v for k, v in stats.statuses.items()},
+        "errors": dict(stats.errors),
+        "service": {k: health.get(k) for k in ("sessions", "jokes_served", "native_async_client")}
+    }
+
+
+def print_report(results: dict):
+    print("\n" + "=" * 60)
+    print(f"📊 LOAD TEST ({results['mode']}, {results['concurrency']} client)")
+    print("=" * 60)
+    print(f"   Durata: {results['wall_time_s']:.2f}s")
+    print(f"   Richieste: {results['requests']} ({results['requests_per_sec']:.2f} richieste/s sostenute)")
+    summary = results["latency_s"]
+    if summary["count"]:
+        print(f"   Latenza: p50 {summary['p50']:.3f}s | p90 {summary['p90']:.3f}s | "
+              f"p99 {summary['p99']:.3f}s | max {summary['max']:.3f}s")
+    print(f"   Esiti: {results['statuses']}")
+    if results["errors"]:
+        print(f"   Errori client: {results['errors']}")
+    print(f"   Servizio: {results['service']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test del servizio Comedy Club')
+    parser.add_argument('--url', help='Servizio già avviato (default: servizio in-process contro il mock)')
+    parser.add_argument('--mode', choices=sorted(WORKERS), default='joke',
+                        help='joke: POST /joke; session: battute e voti in sessione; show: spettacoli WebSocket')
+    parser.add_argument('--concurrency', type=int, default=16, help='Client contemporanei')
+    parser.add_argument('--duration', type=float, default=20.0, help='Durata del test in secondi')
+    parser.add_argument('--rounds', type=int, default=1, help='Round per spettacolo (mode show)')
+    parser.add_argument('--rate-fraction', type=float, default=0.2,
+                        help='Frazione di battute votate (mode session)')
+    parser.add_argument('--topics', default='technology,coffee,work,social media',
+                        help='Temi richiesti, separati da virgola')
+    parser.add_argument('--candidates', type=int, default=1, help='Candidate per battuta (servizio in-process)')
+    parser.add_argument('--sessions', action='store_true', help='Persona come prefisso di sessione (in-process)')
+    parser.add_argument('--rag', action='store_true', help='Abilita il RAG locale (in-process)')
+    parser.add_argument('--max-inflight', type=int, default=32, help='Generazioni contemporanee (in-process)')
+    parser.add_argument('--output', help='Salva i risultati in JSON')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    args.topics = [t.strip() for t in args.topics.split(',') if t.strip()]
+
+    output = os.path.abspath(args.output) if args.output else None
+    service = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        # Il club scrive feedback e rating in logs/ relativo: isola il test dai log reali
+        workdir = tempfile.mkdtemp(prefix="comedy_load_")
+        os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+        if args.rag:
+            os.symlink(os.path.join(REPO_ROOT, "datasets"), os.path.join(workdir, "datasets"))
+        os.chdir(workdir)
+        print(f"📁 Log del load test in: {workdir}")
+        service = InProcessService(args).start()
+        base_url = service.url
+
+    print(f"🏁 Load test {args.mode}: {args.concurrency} client per {args.duration:.0f}s contro {base_url}")
+    try:
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            results = asyncio.run(run_load(base_url, args))
+    finally:
+        if service:
+            with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+                service.stop()
+    print_report(results)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Risultati salvati in {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
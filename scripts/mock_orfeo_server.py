@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Server mock locale che imita Orfeo (Open WebUI /chat/completions e Ollama /generate)
+per benchmark di carico e latenza senza il cluster reale
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_JOKES = [
+    "I told my smartphone a joke about privacy. It laughed, then sold the punchline to advertisers.",
+    "My wife thinks I'm addicted to coffee. I told her I can quit anytime, I just need a double espresso first.",
+    "According to my research, 73% of meetings could be emails, and 100% of emails could be naps.",
+    "Dating apps are like fridges: you keep opening them hoping something new appeared since five minutes ago.",
+    "Have you ever noticed that the weather app is the only job where being wrong daily gets you promoted?",
+    "Kids today can't read a clock, but they can tell you the exact second the Wi-Fi dropped.",
+    "Scientifically speaking, my houseplants are thriving because they've stopped expecting anything from me.",
+    "Let's be honest here, social media is just a diary we leave open on purpose.",
+]
+
+MOCK_REFUSALS = [
+    "I'm sorry, but I can't create jokes about that topic. Is there something else I can help you with?",
+    "I don't feel comfortable making jokes about this subject.",
+]
+
+
+@dataclass
+class MockSettings:
+    """Parametri di comportamento del server mock"""
+    latency_dist: str = "lognormal"   # fixed, uniform, lognormal
+    latency_ms: float = 400.0         # latenza media prima del primo token
+    latency_sigma: float = 0.5        # dispersione (lognormal) o semi-ampiezza relativa (uniform)
+    tokens_per_sec: float = 40.0      # velocità di decodifica simulata
+    error_rate: float = 0.0           # probabilità di HTTP 503
+    refusal_rate: float = 0.0         # probabilità di rispondere con un rifiuto
+    disable_chat: bool = False        # 404 su /chat/completions per forzare il fallback Ollama
+    model: str = "mock-llama3.3"
+
+
+class _Stats:
+    """Contatori thread-safe delle richieste servite"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.refusals = 0
+        self.completion_tokens = 0
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "refusals": self.refusals,
+                "completion_tokens": self.completion_tokens
+            }
+
+
+class MockOrfeoHandler(BaseHTTPRequestHandler):
+    """Handler HTTP: /chat/completions (anche streaming SSE) e /generate (Ollama, anche NDJSON)"""
+
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = MockSettings()
+    stats: _Stats = None
+
+    def log_message(self, format, *args):
+        # Silenzioso: il server serve per benchmark, non per debug
+        pass
+
+    # --- simulazione -----------------------------------------------------
+
+    def _first_token_delay(self) -> float:
+        s = self.settings
+        mean = s.latency_ms / 1000.0
+        if s.latency_dist == "fixed":
+            return mean
+        if s.latency_dist == "uniform":
+            return max(0.0, random.uniform(mean * (1 - s.latency_sigma), mean * (1 + s.latency_sigma)))
+        # lognormal con media pari a latency_ms
+        if mean <= 0:
+            return 0.0
+        mu = math.log(mean) - s.latency_sigma ** 2 / 2
+        return random.lognormvariate(mu, s.latency_sigma)
+
+    def _completion_text(self, max_tokens: int):
+        if random.random() < self.settings.refusal_rate:
+            with self.stats.lock:
+                self.stats.refusals += 1
+            text = random.choice(MOCK_REFUSALS)
+        else:
+            text = random.choice(MOCK_JOKES)
+        words = text.split()[:max(1, max_tokens)]
+        return words
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.settings.tokens_per_sec if self.settings.tokens_per_sec > 0 else 0.0
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        with self.stats.lock:
+            self.stats.requests += 1
+        if random.random() < self.settings.error_rate:
+            with self.stats.lock:
+                self.stats.errors += 1
+            self._send_json(503, {"error": "mock backend overloaded"})
+            return True
+        return False
+
+    # --- endpoint --------------------------------------------------------
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat_completions()
+        elif path.endswith("/generate"):
+            self._ollama_generate()
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def _chat_completions(self):
+        request = self._read_json()
+        if self.settings.disable_chat:
+            self._send_json(404, {"error": "chat completions disabled"})
+            return
+        if self._maybe_fail():
+            return
+
+        max_tokens = int(request.get("max_tokens") or 150)
+        n = max(1, int(request.get("n") or 1))
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        time.sleep(self._first_token_delay())
+
+        if request.get("stream"):
+            words = self._completion_text(max_tokens)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, word in enumerate(words):
+                chunk = {
+                    "object": "chat.completion.chunk",
+                    "model": self.settings.model,
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                 "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self._token_delay())
+            final = {
+                "object": "chat.completion.chunk",
+                "model": self.settings.model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)}
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self.close_connection = True
+            with self.stats.lock:
+                self.stats.completion_tokens += len(words)
+            return
+
+        choices = [self._completion_text(max_tokens) for _ in range(n)]
+        # Le n scelte sono decodificate in batch: conta la più lunga
+        time.sleep(max(len(words) for words in choices) * self._token_delay())
+        completion_tokens = sum(len(words) for words in choices)
+        with self.stats.lock:
+            self.stats.completion_tokens += completion_tokens
+        self._send_json(200, {
+            "object": "chat.completion",
+            "model": self.settings.model,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": " ".join(words)},
+                 "finish_reason": "stop"}
+                for i, words in enumerate(choices)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    def _ollama_generate(self):
+        request = self._read_json()
+        if self._maybe_fail():
+            return
+
+        options = request.get("options", {})
+        max_tokens = int(options.get("num_predict") or 150)
+        prompt_tokens = len(str(request.get("prompt", "")).split())
+        time.sleep(self._first_token_delay())
+        words = self._completion_text(max_tokens)
+        with self.stats.lock:
+            self.stats.completion_tokens += len(words)
+
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, word in enumerate(words):
+                line = {"model": self.settings.model, "response": word if i == 0 else " " + word, "done": False}
+                self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self._token_delay())
+            final = {"model": self.settings.model, "response": "", "done": True,
+                     "prompt_eval_count": prompt_tokens, "eval_count": len(words), "context": [1, 2, 3]}
+            self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        time.sleep(len(words) * self._token_delay())
+        self._send_json(200, {
+            "model": self.settings.model,
+            "response": " ".join(words),
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(words),
+            "context": [1, 2, 3]
+        })
+
+
+class MockOrfeoServer:
+    """Server mock avviabile in-process (thread) o da riga di comando"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: MockSettings = None):
+        handler = type("BoundMockOrfeoHandler", (MockOrfeoHandler,), {
+            "settings": settings or MockSettings(),
+            "stats": _Stats()
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.handler = handler
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def client_config(self) -> dict:
+        """Configurazione da passare a OrfeoClient(config=...)"""
+        return {
+            "model": self.handler.settings.model,
+            "base_url": self.base_url,
+            "api_key": "mock-token",
+            "ssh_command": "n/a (mock)"
+        }
+
+    def stats(self) -> dict:
+        return self.handler.stats.snapshot()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """Aggiunge le opzioni del server mock a un parser (condivise con il benchmark)"""
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'lognormal'], default='lognormal',
+                        help='Distribuzione della latenza prima del primo token')
+    parser.add_argument('--latency-ms', type=float, default=400.0,
+                        help='Latenza media prima del primo token (ms)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help='Dispersione della latenza (sigma lognormal / ampiezza relativa uniform)')
+    parser.add_argument('--tokens-per-sec', type=float, default=40.0,
+                        help='Velocità di decodifica simulata')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Probabilità di errore HTTP 503')
+    parser.add_argument('--refusal-rate', type=float, default=0.0,
+                        help='Probabilità di risposta di rifiuto')
+    parser.add_argument('--disable-chat', action='store_true',
+                        help='Disabilita /chat/completions per esercitare il fallback Ollama')
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(
+        latency_dist=args.latency_dist,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        refusal_rate=args.refusal_rate,
+        disable_chat=args.disable_chat
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server mock Orfeo per benchmark locali')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOrfeoServer(args.host, args.port, settings_from_args(args))
+    print(f"🎭 Mock Orfeo in ascolto su {server.base_url}")
+    print(f"   Latenza: {args.latency_dist} ~{args.latency_ms:.0f}ms, {args.tokens_per_sec:g} token/s")
+    print(f"   Errori: {args.error_rate:.0%}, Rifiuti: {args.refusal_rate:.0%}")
+    print(f"💡 Usa ORFEO_BASE_URL={server.base_url} per puntare il client al mock")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 Statistiche: {server.stats()}")
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 # Core module
-from .comedy_club_clean import ComedyClub
-from .orfeo_client_new import OrfeoClient
+try:
+    from .comedy_club_clean import ComedyClub
+    from .orfeo_client_new import OrfeoClient
+    from .orfeo_multi_client import MultiBackendOrfeoClient
+    CORE_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Core non disponibile: {e}")
+    CORE_AVAILABLE = False
 
-__all__ = ['ComedyClub', 'OrfeoClient']
+__all__ = []
+if CORE_AVAILABLE:
+    __all__.extend(['ComedyClub', 'OrfeoClient', 'MultiBackendOrfeoClient'])
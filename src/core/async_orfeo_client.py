@@ -0,0 +1,168 @@
+"""
+Client asincrono per Orfeo: richieste native con aiohttp se disponibile, altrimenti
+il client sincrono eseguito in un thread (asyncio.to_thread)
+"""
+
+import asyncio
+import time
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+from src.core.orfeo_client_new import OrfeoClient
+from src.utils.console import log
+from src.utils.tracing import span
+
+
+class AsyncOrfeoClient:
+    """Interfaccia async sopra un OrfeoClient esistente
+
+    Condivide configurazione, cache delle risposte, sessioni persona e telemetria con il
+    client sincrono, così le due API restano intercambiabili. Le richieste sono native
+    (aiohttp, una connessione keep-alive per event loop) solo per un OrfeoClient semplice:
+    i client multi-backend mantengono il loro instradamento e girano in un thread.
+    """
+
+    def __init__(self, client: OrfeoClient, max_connections: int = 32):
+        """
+        Args:
+            client: client sincrono da cui prendere configurazione, cache e sessioni
+            max_connections: connessioni HTTP contemporanee per event loop (solo aiohttp)
+        """
+        self.client = client
+        self.max_connections = max_connections
+        self.native = (AIOHTTP_AVAILABLE and type(client) is OrfeoClient
+                       and bool(client.config.get("base_url")))
+        self._http = None
+        self._http_loop = None
+
+    @property
+    def telemetry(self):
+        return self.client.telemetry
+
+    def _get_http(self):
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.closed or self._http_loop is not loop:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+            self._http_loop = loop
+        return self._http
+
+    async def aclose(self):
+        """Chiude la sessione HTTP dell'event loop corrente"""
+        if self._http is not None and not self._http.closed and self._http_loop is asyncio.get_running_loop():
+            await self._http.close()
+        self._http = None
+        self._http_loop = None
+
+    async def agenerate(self, prompt, max_tokens=None, temperature=None, session=None, stop=None):
+        """Equivalente async di OrfeoClient.generate"""
+        return (await self._agenerate(prompt, 1, max_tokens, temperature, session, stop))[0]
+
+    async def agenerate_candidates(self, prompt, n=3, max_tokens=None, temperature=None, session=None,
+                                   stop=None):
+        """Equivalente async di OrfeoClient.generate_candidates (sotto-richieste mancanti in parallelo)"""
+        return await self._agenerate(prompt, max(1, n), max_tokens, temperature, session, stop)
+
+    async def _agenerate(self, prompt, n, max_tokens, temperature, session, stop):
+        """Stesso flusso di OrfeoClient.generate_candidates: cache, richiesta, sotto-richieste"""
+        client = self.client
+        temperature, max_tokens = client._resolve_params(temperature, max_tokens)
+        prompt_session = client._get_prompt_session(session)
+
+        key, cached = client._cache_lookup(prompt, temperature, max_tokens, n, prompt_session, stop)
+        if cached is not None:
+            return cached if n > 1 else [cached]
+
+        call, start = {}, time.perf_counter()
+        with span("llm.generate", n=n, max_tokens=max_tokens, native=self.native) as llm_span:
+            try:
+                candidates = await self._choices(prompt, max_tokens, temperature, n, call, prompt_session, stop)
+            except Exception:
+                client._record_call(call, start, success=False)
+                raise
+
+            missing = n - len(candidates)
+            if missing > 0:
+                log(f"🔀 Backend ha restituito {len(candidates)}/{n} candidate, {missing} sotto-richieste parallele...")
+                sub_calls = [{} for _ in range(missing)]
+                results = await asyncio.gather(
+                    *(self._choices(prompt, max_tokens, temperature, 1, sub_call, prompt_session, stop)
+                      for sub_call in sub_calls),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        log(f"⚠️ Sotto-richiesta fallita: {result}")
+                    else:
+                        candidates.append(result[0])
+                client._merge_sub_calls(call, sub_calls)
+            llm_span.set(endpoint=call.get("endpoint"), completion_tokens=call.get("completion_tokens"))
+        client._record_call(call, start)
+
+        if candidates:
+            client._cache_store(key, candidates if n > 1 else candidates[0], temperature, max_tokens, n)
+        return candidates
+
+    async def _choices(self, prompt, max_tokens, temperature, n, call, prompt_session, stop):
+        if not self.native:
+            return await asyncio.to_thread(self.client._generate_choices_uncached, prompt, max_tokens,
+                                           temperature, n, call, prompt_session, stop)
+        try:
+            return await self._arequest(prompt, max_tokens, temperature, n, call, prompt_session, stop)
+        except aiohttp.ClientConnectionError:
+            error_msg = "⚠️ Impossibile connettersi a Orfeo - verifica connessione di rete"
+            log(f"❌ {error_msg}")
+            raise Exception(error_msg)
+        except asyncio.TimeoutError:
+            error_msg = "⚠️ Timeout connessione Orfeo"
+            log(f"❌ {error_msg}")
+            raise Exception(error_msg)
+
+    async def _arequest(self, prompt, max_tokens, temperature, n, call, prompt_session, stop):
+        """Stessa richiesta di OrfeoClient._request (chat completions con fallback Ollama) via aiohttp"""
+        client = self.client
+        config = client.config
+        http = self._get_http()
+        stream = client.stream and n == 1
+        start = time.perf_counter()
+
+        data = client._chat_payload(config, prompt, max_tokens, temperature, n=n,
+                                    prompt_session=prompt_session, stop=stop, stream=stream)
+        headers = client._headers(config)
+        endpoint = f"{config['base_url']}/chat/completions"
+        call["endpoint"] = endpoint
+        async with http.post(endpoint, json=data, headers=headers) as response:
+            if response.status == 200 and stream:
+                return [await self._read_chat_stream(response, call, start)]
+            if response.status == 200:
+                return client._parse_chat_result(await response.json(content_type=None), n, call)
+
+        # Fallback: endpoint Ollama diretto
+        log(f"🔄 Fallback: provo endpoint Ollama diretto...")
+        call["retries"] = call.get("retries", 0) + 1
+        call["endpoint"] = f"{config['base_url']}/generate"
+        # Il context viene riusato se già elaborato dal client sincrono, senza nuovo prefill
+        context = prompt_session["contexts"].get(config["base_url"]) if prompt_session else None
+        data_direct = client._ollama_payload(config, prompt, max_tokens, temperature, stop=stop,
+                                             prompt_session=prompt_session, context=context)
+
+        async with http.post(call["endpoint"], json=data_direct, headers=headers) as response:
+            if response.status != 200:
+                error_msg = f"⚠️ Errore API Orfeo: {response.status} - {await response.text()}"
+                log(f"❌ {error_msg}")
+                raise Exception(error_msg)
+            return client._parse_ollama_result(await response.json(content_type=None), call)
+
+    async def _read_chat_stream(self, response, call, start):
+        """Legge una risposta SSE di chat completions misurando il time-to-first-token"""
+        parts = []
+        async for raw_line in response.content:
+            if not self.client._parse_stream_line(raw_line.decode("utf-8").strip(), call, start, parts):
+                break
+        return "".join(parts)
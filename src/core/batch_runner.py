@@ -0,0 +1,182 @@
+"""
+Simulatore headless ad alto throughput: genera battute valutate su una griglia
+spettacoli x temi x comici e le salva in streaming (JSONL, opzionalmente Parquet)
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from typing import Dict, List, Optional, Set
+
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+
+def batch_key(show: int, topic: str, comedian: str) -> str:
+    """Chiave stabile di un elemento della griglia (usata per la ripresa)"""
+    return f"{show}|{topic}|{comedian}"
+
+
+def load_completed_keys(path: str) -> Set[str]:
+    """Chiavi già completate con successo in un file JSONL (righe troncate ignorate)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # ultima riga scritta a metà da un'interruzione
+            if record.get("key") and not record.get("error"):
+                done.add(record["key"])
+    return done
+
+
+class BatchRunner:
+    """Esegue la griglia con concorrenza limitata, senza stampe né pause
+
+    Ogni battuta diventa una riga JSONL scritta appena pronta (flush immediato), quindi
+    un'interruzione perde al più le battute in corso; rilanciando con lo stesso output
+    le chiavi già completate vengono saltate. Con output .parquet le righe vanno in
+    streaming su un file .jsonl accanto e il Parquet viene scritto alla fine.
+    """
+
+    def __init__(self, club, output: str, shows: int = 1, topics: Optional[List[str]] = None,
+                 comedians: Optional[List[str]] = None, concurrency: int = 4,
+                 enhanced_tv_search: bool = False):
+        self.club = club
+        self.output = output
+        self.shows = shows
+        self.topics = topics or list(club.topics)
+        self.comedians = comedians or list(club.comedians)
+        self.concurrency = max(1, concurrency)
+        self.enhanced_tv_search = enhanced_tv_search
+
+        self.parquet = output.endswith(".parquet")
+        if self.parquet and not PANDAS_AVAILABLE:
+            raise ValueError("Output Parquet richiede pandas e pyarrow: pip install pandas pyarrow")
+        self.stream_path = output + ".jsonl" if self.parquet else output
+        self._write_lock = threading.Lock()
+
+    def grid(self) -> List[Dict]:
+        return [
+            {"key": batch_key(show, topic, comedian), "show": show, "topic": topic, "comedian": comedian}
+            for show in range(1, self.shows + 1)
+            for topic in self.topics
+            for comedian in self.comedians
+        ]
+
+    def _run_item(self, item: Dict) -> Dict:
+        record = dict(item)
+        telemetry = getattr(self.club.client, 'telemetry', None)
+        start = time.perf_counter()
+        with telemetry.capture() if telemetry else contextlib.nullcontext([]) as calls:
+            try:
+                joke = self.club.generate_joke(item["comedian"], item["topic"], self.enhanced_tv_search)
+                record.update({
+                    "joke": joke.text,
+                    "joke_topic": joke.topic,  # può differire dopo un rifiuto
+                    "source": joke.source,
+                    "refusal": self.club._is_ai_refusal(joke.text),
+                    "analysis": asdict(joke.analysis) if joke.analysis else None,
+                    "audience_score": self._audience_score(joke),
+                    "error": None
+                })
+            except Exception as e:
+                record["error"] = str(e)
+        record["latency_s"] = time.perf_counter() - start
+        record["llm_calls"] = len(calls)
+        record["llm_latency_s"] = sum(c.latency_s for c in calls)
+        record["ttft_s"] = next((c.ttft_s for c in calls if c.ttft_s is not None), None)
+        record["prompt_tokens"] = sum(c.prompt_tokens or 0 for c in calls)
+        record["completion_tokens"] = sum(c.completion_tokens or 0 for c in calls)
+        record["cached"] = bool(calls) and all(c.cached for c in calls)
+        record["timestamp"] = time.time()
+        return record
+
+    def _audience_score(self, joke) -> Optional[float]:
+        """Reazione simulata del pubblico, senza salvare nello storico dei feedback"""
+        feedback = self.club.feedback_system
+        if not feedback or joke.analysis is None:
+            return None
+        return feedback.simulate_audience_reaction(joke.text, joke.comedian, joke.topic, joke.analysis)
+
+    def _write(self, f, record: Dict):
+        with self._write_lock:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def run(self, progress=None) -> Dict:
+        """Esegue gli elementi mancanti della griglia
+
+        Args:
+            progress: stream per l'avanzamento (default: stderr)
+        """
+        progress = progress or sys.stderr
+        items = self.grid()
+        done = load_completed_keys(self.stream_path)
+        todo = [item for item in items if item["key"] not in done]
+        progress.write(f"📦 Batch: {len(items)} battute, {len(done)} già completate, {len(todo)} da generare "
+                       f"(concorrenza {self.concurrency}) -> {self.output}\n")
+
+        ok = errors = 0
+        start = time.perf_counter()
+        self._terminate_partial_line()
+        with open(self.stream_path, 'a', encoding='utf-8') as f, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="comedy-batch") as executor:
+            futures = [executor.submit(self._run_item, item) for item in todo]
+            try:
+                for count, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    self._write(f, record)
+                    if record["error"]:
+                        errors += 1
+                    else:
+                        ok += 1
+                    elapsed = time.perf_counter() - start
+                    progress.write(f"\r   {count}/{len(todo)} ({errors} errori) - {count / elapsed:.2f} battute/s")
+                    progress.flush()
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                progress.write("\n⏸️ Interrotto: rilancia lo stesso comando per riprendere\n")
+                raise
+        progress.write("\n")
+
+        if self.parquet:
+            self._write_parquet()
+
+        return {"total": len(items), "skipped": len(done), "ok": ok, "errors": errors,
+                "wall_time_s": time.perf_counter() - start}
+
+    def _terminate_partial_line(self):
+        """Chiude con un a capo l'eventuale riga troncata da un'interruzione, così la
+        prima riga aggiunta in ripresa non viene incollata ai suoi resti"""
+        if not os.path.exists(self.stream_path) or os.path.getsize(self.stream_path) == 0:
+            return
+        with open(self.stream_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _write_parquet(self):
+        """Converte lo stream JSONL in Parquet (ultima riga per chiave)"""
+        records = {}
+        with open(self.stream_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["key"]] = record
+        frame = pd.json_normalize(list(records.values()))
+        frame.to_parquet(self.output, index=False)
@@ -2,17 +2,30 @@
 Comedy Club Simulator - Solo modalità Orfeo con RAG Enhancement
 """
 
+import asyncio
 import sys
 import os
 import random
+import threading
 import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Optional
 
 # Aggiungi path per imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(current_dir, '..', '..'))
 
 from src.core.orfeo_client_new import OrfeoClient
+from src.core.async_orfeo_client import AsyncOrfeoClient
+from src.core.show_engine import run_ordered
+from src.core.joke_pool import JokePool
 from config.orfeo_config_new import is_orfeo_available
+from src.utils.generation_profiles import GenerationProfiles
+from src.utils.console import log, quiet_output
+from src.utils.storage import WriteBehindWriter
+from src.utils.tracing import span
 
 # Importa RAG system se disponibile
 try:
@@ -31,17 +44,69 @@ except ImportError:
     RATING_AVAILABLE = False
     print("Sistema di rating non disponibile")
 
+@dataclass
+class GeneratedJoke:
+    """Battuta generata e valutata, non ancora presentata al pubblico"""
+    comedian: str
+    topic: str
+    text: str
+    analysis: Optional[Any] = None  # ComedyAnalysis
+    source: str = "rag"  # 'rag' o 'fallback'
+    pooled: bool = False  # servita dal pool di battute pronte
+
+
 class ComedyClub:
     """Simulatore comedy club - modalità Orfeo con RAG Enhancement"""
     
-    def __init__(self, use_web_search: bool = True, use_rag: bool = True, use_rating: bool = True):
-        """Inizializza il comedy club con supporto RAG e rating system"""
+    def __init__(self, use_web_search: bool = True, use_rag: bool = True, use_rating: bool = True,
+                 cache_mode: str = None, multi_backend: bool = False, hedge: bool = False,
+                 num_candidates: int = 1, client=None, use_sessions: bool = False,
+                 pool_size: int = 0, profiler=None, db_path: str = None,
+                 feedback_system=None, rating_system=None, adaptive_prompts: bool = False):
+        """Inizializza il comedy club con supporto RAG e rating system
+        
+        Args:
+            cache_mode: modalità cache risposte LLM ('off', 'read_through', 'replay');
+                        in 'replay' il backend Orfeo non è necessario
+            multi_backend: distribuisce le richieste su tutti i backend Orfeo configurati
+            hedge: con multi_backend, duplica le richieste lente su un secondo backend
+            num_candidates: battute candidate richieste per ogni joke (best-of-n in un solo round-trip,
+                            ma N volte i token decodificati; default 1 = nessuna selezione)
+            client: client LLM già configurato (es. OrfeoClient verso il server mock)
+            use_sessions: durante uno spettacolo apre una sessione client per comico con la
+                          persona come prefisso stabile (prefill pagato una volta per show)
+            pool_size: battute pronte tenute in background per comico sul tema corrente
+                       (0 = nessun pool, ogni battuta attende il modello)
+            profiler: SampledProfiler che profila una battuta ogni N (None = disattivato)
+            db_path: database SQLite per feedback, rating e miglioramenti (default: env
+                     COMEDY_DB; None = file JSON in logs/, importati alla prima apertura del db)
+            feedback_system: ComedyFeedbackSystem già aperto da condividere (es. con la GUI);
+                             None = il club ne crea uno proprio
+            rating_system: HumanRatingSystem già aperto da condividere; None = creato se use_rating
+            adaptive_prompts: aggiunge ai prompt il feedback appreso dai rating umani; di default
+                              i rating producono solo i miglioramenti salvati, i prompt non cambiano
+        """
         
-        if not is_orfeo_available():
+        cache_mode = cache_mode or os.getenv("ORFEO_CACHE_MODE", "off")
+        if client is None and not is_orfeo_available() and cache_mode != "replay":
             raise ValueError("Token non configurato. Esegui: source config/set_env.sh")
         
-        self.client = OrfeoClient()
+        if client is not None:
+            self.client = client
+        elif multi_backend:
+            from src.core.orfeo_multi_client import MultiBackendOrfeoClient
+            self.client = MultiBackendOrfeoClient(cache_mode=cache_mode, hedge=hedge)
+        else:
+            self.client = OrfeoClient(cache_mode=cache_mode)
         self.use_web_search = use_web_search
+        self.num_candidates = max(1, num_candidates)
+        self.use_sessions = use_sessions
+        self.adaptive_prompts = adaptive_prompts
+        self._persona_sessions = {}  # comico -> id sessione client
+        self.profiler = profiler
+        self._async_client = None  # AsyncOrfeoClient creato alla prima chiamata async
+        self._session_users = 0  # spettacoli/servizi che usano le sessioni persona
+        self._session_users_lock = threading.Lock()
         
         # Inizializza sistema RAG se disponibile
         self.enhanced_rag = None
@@ -58,19 +123,39 @@ class ComedyClub:
             except Exception as e:
                 print(f"Errore caricamento RAG: {e}")
                 
+        # Scritture su disco di feedback, rating e miglioramenti in background
+        self.writer = WriteBehindWriter(name="comedy-club-writer")
+        self._owns_feedback_system = feedback_system is None
+        
+        # Store SQLite opzionale condiviso da feedback, rating e miglioramenti
+        self.storage = None
+        db_path = db_path or os.getenv("COMEDY_DB")
+        if db_path and not (feedback_system and rating_system):  # i sistemi condivisi hanno già il loro
+            try:
+                from src.utils.comedy_db import open_comedy_db
+                self.storage = open_comedy_db(db_path)
+                print(f"🗄️ Storage SQLite: {db_path}")
+            except Exception as e:
+                print(f"⚠️ Storage SQLite non disponibile, uso i file JSON: {e}")
+        
         # Inizializza sistema di rating e apprendimento adattivo
         self.rating_system = None
         self.adaptive_system = None
-        if use_rating and RATING_AVAILABLE:
+        if rating_system is not None and RATING_AVAILABLE:
+            self.rating_system = rating_system
+            self.adaptive_system = AdaptiveComedySystem(storage=rating_system.storage, writer=self.writer)
+        elif use_rating and RATING_AVAILABLE:
             try:
-                self.rating_system = HumanRatingSystem()
-                self.adaptive_system = AdaptiveComedySystem()
+                self.rating_system = HumanRatingSystem(storage=self.storage, writer=self.writer)
+                self.adaptive_system = AdaptiveComedySystem(storage=self.storage, writer=self.writer)
                 print("Sistema di rating e apprendimento adattivo caricato")
             except Exception as e:
                 print(f"Errore caricamento sistema rating: {e}")
                 self.rating_system = None
                 self.adaptive_system = None
                 self.enhanced_rag = None
+        if self.adaptive_system:
+            self.adaptive_system.attach(self.rating_system)
         
         # Comedy Tools per ragionamento avanzato
         try:
@@ -87,7 +172,7 @@ class ComedyClub:
         # Sistema di Feedback per miglioramento iterativo
         try:
             from src.utils.comedy_feedback import ComedyFeedbackSystem
-            self.feedback_system = ComedyFeedbackSystem()
+            self.feedback_system = feedback_system or ComedyFeedbackSystem(storage=self.storage, writer=self.writer)
             print("📊 Sistema di Feedback caricato per miglioramento iterativo")
         except ImportError as e:
             print(f"Sistema di Feedback non disponibile: {e}")
@@ -96,6 +181,14 @@ class ComedyClub:
             print(f"Errore caricamento Sistema di Feedback: {e}")
             self.feedback_system = None
         
+        # Profili di generazione: max_tokens appresi dalle lunghezze osservate e stop sequence
+        self.generation_profiles = GenerationProfiles.from_history(
+            self.feedback_system.feedback_history if self.feedback_system else None,
+            self.rating_system.ratings if self.rating_system else None
+        )
+        for line in self.generation_profiles.describe():
+            print(f"   Profilo {line}")
+        
         self.comedians = {
             "Dave": {
                 "name": "Dave",
@@ -139,13 +232,73 @@ class ComedyClub:
             "technology", "everyday life", "social media", "food", 
             "work", "relationships", "travel", "weather", "coffee", "smartphones"
         ]
+        self.current_topic = None
+        
+        # Pool di battute pre-generate (riempito in background quando si imposta un tema)
+        self.joke_pool = JokePool(self, size=pool_size) if pool_size > 0 else None
         
         print(f"🎭 Comedy Club inizializzato con Orfeo")
         print(f"   Comici: {len(self.comedians)}")
         print(f"   RAG: {'✅ Attivo' if self.enhanced_rag else '❌ Non disponibile'}")
         print(f"   Web Search: {'✅ Attivo' if self.use_web_search else '❌ Disabilitato'}")
         print(f"   Rating System: {'⭐ Attivo' if self.rating_system else '❌ Non disponibile'}")
-        print(f"   Adaptive Learning: {'🧠 Attivo' if self.adaptive_system else '❌ Non disponibile'}")
+        print(f"   Adaptive Learning: {'🧠 Attivo' if self.adaptive_system else '❌ Non disponibile'}"
+              f"{' (prompt adattivi)' if self.adaptive_system and self.adaptive_prompts else ''}")
+        print(f"   Sessioni persona: {'✅ Attive' if self.use_sessions else '❌ Disabilitate'}")
+        print(f"   Pool battute: {f'⚡ {pool_size} per comico' if self.joke_pool else '❌ Disabilitato'}")
+    
+    def start_persona_sessions(self) -> bool:
+        """Apre una sessione client per comico con la persona come prefisso di sistema
+        
+        Returns:
+            True se le sessioni sono state aperte ora (False se disabilitate o già aperte)
+        """
+        if not self.use_sessions or self._persona_sessions or not self.comedy_tools:
+            return False
+        if not hasattr(self.client, 'open_session'):
+            return False
+        
+        show_id = int(time.time() * 1000)
+        for name, info in self.comedians.items():
+            session_id = f"{name}-{show_id}"
+            self.client.open_session(session_id, self.comedy_tools.get_persona_preamble(info['style'], info))
+            self._persona_sessions[name] = session_id
+        print(f"🔥 Sessioni persona aperte per {len(self._persona_sessions)} comici")
+        return True
+    
+    def end_persona_sessions(self):
+        """Chiude le sessioni aperte con start_persona_sessions"""
+        for session_id in self._persona_sessions.values():
+            self.client.close_session(session_id)
+        self._persona_sessions = {}
+    
+    @contextmanager
+    def persona_sessions(self):
+        """Sessioni persona aperte per la durata del blocco
+        
+        Spettacoli (sync e async), servizio e GUI possono sovrapporsi sullo stesso club:
+        le sessioni si aprono col primo utente e si chiudono quando esce l'ultimo.
+        """
+        with self._session_users_lock:
+            if self._session_users == 0:
+                self.start_persona_sessions()
+            self._session_users += 1
+        try:
+            yield
+        finally:
+            with self._session_users_lock:
+                self._session_users -= 1
+                if self._session_users == 0:
+                    self.end_persona_sessions()
+    
+    def generation_profile(self, prompt_type):
+        """Profilo di generazione (max_tokens, stop) per 'rag_joke', 'fallback_joke',
+        'refusal_retry' o 'debate'"""
+        return self.generation_profiles.get(prompt_type)
+    
+    def persona_session(self, comedian_name):
+        """Id della sessione client del comico, None se non c'è una sessione aperta"""
+        return self._persona_sessions.get(comedian_name)
     
     def _is_ai_refusal(self, response: str) -> bool:
         """Rileva se l'AI ha rifiutato di creare contenuto"""
@@ -168,124 +321,227 @@ class ComedyClub:
         response_lower = response.lower()
         return any(pattern.lower() in response_lower for pattern in refusal_patterns)
         
+    def _select_best_candidate(self, candidates):
+        """Scarta i rifiuti e sceglie la candidata con il punteggio di qualità più alto
+        
+        Returns:
+            (risposta, analisi) oppure (None, None) se tutte le candidate sono rifiuti
+        """
+        with span("refusal_check", candidates=len(candidates)):
+            valid = [c for c in candidates if not self._is_ai_refusal(c)]
+        if len(valid) < len(candidates):
+            log(f"   Candidate valide: {len(valid)}/{len(candidates)} (rifiuti scartati)")
+        if not valid:
+            return None, None
+        if not self.comedy_tools:
+            return valid[0], None
+        
+        with span("quality_analysis", candidates=len(valid)):
+            scored = [(self.comedy_tools.analyze_joke_quality(c), c) for c in valid]
+        analysis, best = max(scored, key=lambda pair: pair[0].overall_score)
+        if len(scored) > 1:
+            log(f"   Migliore di {len(scored)} candidate: {analysis.overall_score:.2f}/1.0")
+        return best, analysis
+    
     def get_joke(self, comedian_name=None, topic=None, enhanced_tv_search=False):
         """Get a joke from a comedian with RAG and advanced reasoning support
         
         Args:
             comedian_name: Name of the comedian
-            topic: Topic for the joke
+            topic: Topic for the joke (default: current topic, otherwise random)
             enhanced_tv_search: Use specialized search for TV shows, memes, debates
         """
         
         comedian_name = comedian_name or random.choice(list(self.comedians.keys()))
-        topic = topic or random.choice(self.topics)
+        topic = topic or self.current_topic or random.choice(self.topics)
         
         if comedian_name not in self.comedians:
             raise ValueError(f"Comedian {comedian_name} not found!")
         
-        comedian_info = self.comedians[comedian_name]
+        with span("get_joke", comedian=comedian_name, topic=topic) as joke_span, \
+                self._profiled(comedian_name):
+            joke = self._obtain_joke(comedian_name, topic, enhanced_tv_search)
+            joke_span.set(pooled=joke.pooled)
+            return self._present_joke(joke)
+    
+    def _obtain_joke(self, comedian_name, topic, enhanced_tv_search=False) -> "GeneratedJoke":
+        """Battuta pronta dal pool se c'è, altrimenti generata ora; non ancora presentata"""
+        joke = self._take_pooled(comedian_name, topic, enhanced_tv_search)
+        return joke or self.generate_joke(comedian_name, topic, enhanced_tv_search)
+    
+    def _take_pooled(self, comedian_name, topic, enhanced_tv_search=False) -> Optional["GeneratedJoke"]:
+        """Battuta pronta dal pool (può attendere una battuta in preparazione), None se assente"""
+        if not self.joke_pool:
+            return None
+        joke = self.joke_pool.take(comedian_name, topic, enhanced_tv_search)
+        if joke is not None:
+            print(f"⚡ {comedian_name}: battuta dal pool su {joke.topic}")
+            joke.pooled = True
+        return joke
+    
+    def generate_joke(self, comedian_name, topic, enhanced_tv_search=False,
+                      quiet=False) -> "GeneratedJoke":
+        """Genera e valuta una battuta senza registrarla (usato da get_joke e dal pool)
+        
+        Con quiet=True i messaggi di avanzamento della generazione (client, RAG, scelta
+        delle candidate) non vengono stampati, es. per le battute preparate in background.
+        """
+        with span("generate_joke", comedian=comedian_name, topic=topic) as joke_span, \
+                self._profiled(comedian_name), quiet_output(quiet):
+            joke = self._generate_joke(comedian_name, topic, enhanced_tv_search)
+            joke_span.set(source=joke.source)
+            return joke
+    
+    def _profiled(self, comedian_name):
+        """Profila la battuta se il profiler è attivo e la campiona"""
+        return self.profiler.profile(comedian_name) if self.profiler else nullcontext()
+    
+    def _generate_joke(self, comedian_name, topic, enhanced_tv_search):
+        steps = self._joke_steps(comedian_name, topic, enhanced_tv_search)
+        result, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                if step[0] == "rag":
+                    result = self._build_rag_prompt(*step[1:])
+                else:
+                    result = self.client.generate_candidates(step[1], **self._candidate_options(*step[2:]))
+            except Exception as e:
+                error = e
+    
+    def _candidate_options(self, prompt_type, session_id):
+        """Argomenti di generate_candidates per un tipo di prompt"""
+        profile = self.generation_profile(prompt_type)
+        return {"n": self.num_candidates, "max_tokens": profile.max_tokens, "stop": profile.stop,
+                "session": session_id}
+    
+    def _joke_steps(self, comedian_name, topic, enhanced_tv_search):
+        """Generazione di una battuta come sequenza di passi, indipendente dall'I/O
+        
+        Generatore condiviso da _generate_joke (thread corrente) e _agenerate_joke (event
+        loop): produce le operazioni da eseguire, ("rag", ...) per il prompt con RAG e
+        ricerca web e ("llm", prompt, tipo di prompt, sessione) per le candidate, e riceve
+        i risultati; gli errori delle operazioni vengono rilanciati qui. Restituisce la
+        GeneratedJoke.
+        """
+        session_id = self.persona_session(comedian_name)
         
         # Use RAG enhanced if available and topic provided
         if self.enhanced_rag and topic:
             try:
-                rag_result = self.enhanced_rag.retrieve_jokes_with_context(
-                    comedian_info['style'], 
-                    topic, 
-                    use_web_search=self.use_web_search,
-                    top_k=3,
-                    enhanced_tv_search=enhanced_tv_search,
-                    comedian_name=comedian_name
-                )
-                
-                sample_jokes = rag_result["jokes"]
-                web_context = rag_result["web_context"]
-                tv_meme_context = rag_result.get("tv_meme_context", {})
-                
-                # Use advanced reasoning system if available
-                if self.comedy_tools:
-                    comedy_prompt = self.comedy_tools.generate_comedy_prompt(
-                        topic, comedian_info['style'], comedian_info, tv_meme_context, self.adaptive_system
-                    )
-                    base_prompt = comedy_prompt
-                    
-                    # Add examples from dataset
-                    if sample_jokes:
-                        base_prompt += f"\n\nEXAMPLES FROM DATASET for inspiration:\n"
-                        for i, joke in enumerate(sample_jokes[:2], 1):  # Only 2 examples to avoid overloading
-                            base_prompt += f"{i}. {joke}\n"
-                    
-                    base_prompt += f"\nNow generate YOUR original joke about '{topic}' following the process above. RESPOND ONLY IN ENGLISH:"
-                    
-                else:
-                    # Fallback to improved traditional prompt
-                    base_prompt = f"You are {comedian_name}, a comedian with a {comedian_info['tone']} style. "
-                    base_prompt += f"You specialize in {comedian_info['style']}. "
-                    
-                    # Add style examples from dataset
-                    if sample_jokes:
-                        base_prompt += f"Here are examples of your comedy style:\n"
-                        for i, joke in enumerate(sample_jokes[:3], 1):
-                            base_prompt += f"{i}. {joke}\n"
-                        base_prompt += "\n"
-                    
-                    # Add characteristic phrases
-                    if comedian_info.get('catchphrases'):
-                        phrase = random.choice(comedian_info['catchphrases'])
-                        base_prompt += f"Use your signature style (like '{phrase}...'). "
-                    
-                    base_prompt += f"Now create ONE short, funny joke about {topic}. "
-                    base_prompt += "Keep it under 30 words. Make it genuinely hilarious and memorable. "
-                    base_prompt += "RESPOND ONLY IN ENGLISH. "
-                    
-                    if web_context:
-                        base_prompt += f"Current context: {web_context[:150]}. "
-                        
-                    base_prompt += f"\nTopic: {topic}\nYour joke:"
+                base_prompt = yield ("rag", comedian_name, topic, enhanced_tv_search, session_id)
                 
-                print(f"🎤 {comedian_name} sta raccontando una battuta su {topic} (con RAG)...")
-                response = self.client.generate(base_prompt, max_tokens=200)
+                log(f"🎤 {comedian_name} sta raccontando una battuta su {topic} (con RAG)...")
+                candidates = yield ("llm", base_prompt, "rag_joke", session_id)
+                response, analysis = self._select_best_candidate(candidates)
                 
-                # Gestisci rifiuti dell'AI per argomenti sensibili
-                if self._is_ai_refusal(response):
-                    print(f"{comedian_name} ha rifiutato l'argomento, provo con topic alternativo...")
-                    alternative_topics = ["technology", "relationships", "everyday life", "social media", "coffee"]
-                    import random
-                    alt_topic = random.choice(alternative_topics)
-                    
-                    # Prompt alternativo più generale
-                    comedian_info = self.comedians[comedian_name]
-                    alt_prompt = f"You are {comedian_name}, a {comedian_info['style']} comedian. Make a joke about {alt_topic}:"
-                    response = self.client.generate(alt_prompt, max_tokens=200)
-                    print(f"Switched to alternative topic: {alt_topic}")
+                # Gestisci rifiuti dell'AI per argomenti sensibili (solo se tutte le candidate sono rifiuti)
+                if response is None:
+                    log(f"{comedian_name} ha rifiutato l'argomento, provo con topic alternativo...")
+                    alt_topic, alt_prompt = self._build_alternative_prompt(comedian_name)
+                    alt_candidates = yield ("llm", alt_prompt, "refusal_retry", None)
+                    response, analysis = self._select_best_candidate(alt_candidates)
+                    if response is None:
+                        response = alt_candidates[0] if alt_candidates else ""
+                    log(f"Switched to alternative topic: {alt_topic}")
                     topic = alt_topic  # Update topic for feedback
                 
-                # Valuta la qualità della battuta se gli strumenti sono disponibili
-                if self.comedy_tools and response:
-                    analysis = self.comedy_tools.analyze_joke_quality(response)
-                    print(f"   Qualità battuta: {analysis.overall_score:.2f}/1.0")
-                    print(f"   Tipo: {analysis.humor_type}")
-                    print(f"   Setup: {analysis.setup_strength:.2f}, Punchline: {analysis.punchline_impact:.2f}")
-                    
-                    # Sistema di feedback per apprendimento
-                    if self.feedback_system:
-                        feedback = self.feedback_system.provide_feedback(response, comedian_name, topic, analysis)
-                        print(f"Reazione pubblico: {feedback.audience_score:.2f}/1.0")
-                        print(f"Feedback salvato per {comedian_name} su '{topic}'")
-                        if feedback.feedback_notes:
-                            print(f"{feedback.feedback_notes[0]}")  # Mostra solo il primo feedback
-                    
-                    # Se la qualità è bassa, suggerisci miglioramenti
-                    if analysis.overall_score < 0.6:
-                        suggestions = self.comedy_tools.suggest_improvements(response, analysis)
-                        print(f"Suggerimenti: {', '.join(suggestions[:2])}")
-                
-                return f"{comedian_name}: {response}"
+                return self._finish_joke(comedian_name, topic, response, analysis, source="rag")
                 
             except Exception as e:
-                print(f"RAG retrieval fallito, uso metodo standard: {e}")
+                log(f"RAG retrieval fallito, uso metodo standard: {e}")
                 # Fallback al metodo originale
         
         # Metodo originale come fallback migliorato
+        prompt = self._build_fallback_prompt(comedian_name, topic)
+        
+        log(f"🎤 {comedian_name} sta raccontando una battuta su {topic}...")
+        candidates = yield ("llm", prompt, "fallback_joke", None)
+        response, analysis = self._select_best_candidate(candidates)
+        if response is None:
+            response = candidates[0] if candidates else ""
+        
+        return self._finish_joke(comedian_name, topic, response, analysis, source="fallback")
+    
+    def _build_rag_prompt(self, comedian_name, topic, enhanced_tv_search, session_id):
+        """Recupera esempi e contesto dal RAG e costruisce il prompt della battuta"""
+        comedian_info = self.comedians[comedian_name]
+        with span("rag.retrieve"):
+            rag_result = self.enhanced_rag.retrieve_jokes_with_context(
+                comedian_info['style'], 
+                topic, 
+                use_web_search=self.use_web_search,
+                top_k=3,
+                enhanced_tv_search=enhanced_tv_search,
+                comedian_name=comedian_name
+            )
+        
+        sample_jokes = rag_result["jokes"]
+        web_context = rag_result["web_context"]
+        tv_meme_context = rag_result.get("tv_meme_context", {})
+        
+        with span("prompt.build"):
+            # Use advanced reasoning system if available
+            if self.comedy_tools:
+                # Con una sessione aperta la persona è già il prefisso di sistema
+                comedy_prompt = self.comedy_tools.generate_comedy_prompt(
+                    topic, comedian_info['style'], comedian_info, tv_meme_context,
+                    self.adaptive_system if self.adaptive_prompts else None,
+                    include_persona=session_id is None
+                )
+                base_prompt = comedy_prompt
+                
+                # Add examples from dataset
+                if sample_jokes:
+                    base_prompt += f"\n\nEXAMPLES FROM DATASET for inspiration:\n"
+                    for i, joke in enumerate(sample_jokes[:2], 1):  # Only 2 examples to avoid overloading
+                        base_prompt += f"{i}. {joke}\n"
+                
+                base_prompt += f"\nNow generate YOUR original joke about '{topic}' following the process above. RESPOND ONLY IN ENGLISH:"
+                
+            else:
+                # Fallback to improved traditional prompt
+                base_prompt = f"You are {comedian_name}, a comedian with a {comedian_info['tone']} style. "
+                base_prompt += f"You specialize in {comedian_info['style']}. "
+                
+                # Add style examples from dataset
+                if sample_jokes:
+                    base_prompt += f"Here are examples of your comedy style:\n"
+                    for i, joke in enumerate(sample_jokes[:3], 1):
+                        base_prompt += f"{i}. {joke}\n"
+                    base_prompt += "\n"
+                
+                # Add characteristic phrases
+                if comedian_info.get('catchphrases'):
+                    phrase = random.choice(comedian_info['catchphrases'])
+                    base_prompt += f"Use your signature style (like '{phrase}...'). "
+                
+                base_prompt += f"Now create ONE short, funny joke about {topic}. "
+                base_prompt += "Keep it under 30 words. Make it genuinely hilarious and memorable. "
+                base_prompt += "RESPOND ONLY IN ENGLISH. "
+                
+                if web_context:
+                    base_prompt += f"Current context: {web_context[:150]}. "
+                    
+                base_prompt += f"\nTopic: {topic}\nYour joke:"
+        return base_prompt
+    
+    def _build_alternative_prompt(self, comedian_name):
+        """Tema alternativo e prompt più generale dopo un rifiuto del modello"""
+        alternative_topics = ["technology", "relationships", "everyday life", "social media", "coffee"]
+        alt_topic = random.choice(alternative_topics)
+        
+        # Prompt alternativo più generale
+        comedian_info = self.comedians[comedian_name]
+        alt_prompt = f"You are {comedian_name}, a {comedian_info['style']} comedian. Make a joke about {alt_topic}:"
+        return alt_topic, alt_prompt
+    
+    def _build_fallback_prompt(self, comedian_name, topic):
+        """Prompt senza RAG, con le frasi caratteristiche del comico"""
         comedian_info = self.comedians[comedian_name]
         
         # Usa frasi caratteristiche anche nel fallback
@@ -293,31 +549,87 @@ class ComedyClub:
         if comedian_info.get('catchphrases'):
             catchphrase = f"Use your signature style (like '{random.choice(comedian_info['catchphrases'])}...'). "
         
-        prompt = f"""You are {comedian_name}, a comedian with a {comedian_info['tone']} style specializing in {comedian_info['style']}.
+        return f"""You are {comedian_name}, a comedian with a {comedian_info['tone']} style specializing in {comedian_info['style']}.
 
 {catchphrase}Create ONE short, hilarious joke about {topic}. Keep it under 30 words. Make it genuinely funny and memorable.
 
 Topic: {topic}
 Your joke:"""
+    
+    def _finish_joke(self, comedian_name, topic, response, analysis, source):
+        """Valuta la qualità della battuta scelta se non è già stata analizzata"""
+        if self.comedy_tools and response and analysis is None:
+            with span("quality_analysis", candidates=1):
+                analysis = self.comedy_tools.analyze_joke_quality(response)
+        return GeneratedJoke(comedian_name, topic, response, analysis, source=source)
+    
+    def _present_joke(self, joke: "GeneratedJoke") -> str:
+        """Mostra la valutazione, registra il feedback e restituisce la battuta formattata"""
+        analysis = joke.analysis
+        if self.comedy_tools and joke.text and analysis is not None:
+            if joke.source != "rag":
+                print(f"Qualità battuta: {analysis.overall_score:.2f}/1.0 (fallback)")
+            else:
+                print(f"   Qualità battuta: {analysis.overall_score:.2f}/1.0")
+                print(f"   Tipo: {analysis.humor_type}")
+                print(f"   Setup: {analysis.setup_strength:.2f}, Punchline: {analysis.punchline_impact:.2f}")
+                
+                # Sistema di feedback per apprendimento
+                if self.feedback_system:
+                    with span("feedback"):
+                        feedback = self.feedback_system.provide_feedback(joke.text, joke.comedian, joke.topic, analysis)
+                    print(f"Reazione pubblico: {feedback.audience_score:.2f}/1.0")
+                    print(f"Feedback salvato per {joke.comedian} su '{joke.topic}'")
+                    if feedback.feedback_notes:
+                        print(f"{feedback.feedback_notes[0]}")  # Mostra solo il primo feedback
+                
+                # Se la qualità è bassa, suggerisci miglioramenti
+                if analysis.overall_score < 0.6:
+                    suggestions = self.comedy_tools.suggest_improvements(joke.text, analysis)
+                    print(f"Suggerimenti: {', '.join(suggestions[:2])}")
         
-        print(f"🎤 {comedian_name} sta raccontando una battuta su {topic}...")
-        response = self.client.generate(prompt, max_tokens=80)  # Ancora più corto
-        
-        # Valuta la qualità anche nel fallback
-        if self.comedy_tools and response:
-            analysis = self.comedy_tools.analyze_joke_quality(response)
-            print(f"Qualità battuta: {analysis.overall_score:.2f}/1.0 (fallback)")
-        
-        return f"{comedian_name}: {response}"
+        return f"{joke.comedian}: {joke.text}"
+    
+    def set_topic(self, topic, enhanced_tv_search=False):
+        """Imposta il tema corrente; con il pool attivo invalida le battute pronte e lo riempie"""
+        self.current_topic = topic
+        if self.joke_pool and topic:
+            self.joke_pool.set_topic(topic, enhanced_tv_search)
     
-    def run_show(self, rounds=2):
-        """Esegui uno spettacolo completo"""
+    def run_show(self, rounds=2, concurrency=4, pause=0.0):
+        """Esegui uno spettacolo completo
+        
+        Args:
+            concurrency: battute generate in parallelo per round (1 = una alla volta)
+            pause: pausa in secondi tra un comico e l'altro durante la presentazione
+        """
         
         print("\n" + "="*60)
         print("🎭 BENVENUTI AL COMEDY CLUB AI ! 🎭")
         print("   Stasera abbiamo 4 fantastici comici AI!")
         print("="*60)
         
+        with self.persona_sessions():
+            self._run_rounds(rounds, concurrency, pause)
+        
+        print(f"\n" + "="*60)
+        print("🎭 Grazie a tutti! Spettacolo terminato!")
+        print("="*60)
+        
+        # Mostra statistiche se disponibili
+        if self.feedback_system:
+            print("\n📊 STATISTICHE DELLA SERATA:")
+            top_performers = self.feedback_system.get_top_performers()
+            for i, performer in enumerate(top_performers, 1):
+                print(f"   {i}° {performer['comedian']}: {performer['average_score']:.2f}/1.0 "
+                      f"({performer['performances']} performance)")
+    
+    def _run_rounds(self, rounds, concurrency, pause):
+        """Esegue i round: tutti i comici generano in parallelo, presentati nell'ordine di scena
+        
+        Solo la generazione gira nei thread del round: valutazione, feedback e stampa
+        avvengono qui, un comico alla volta, appena arriva il suo turno.
+        """
         for round_num in range(1, rounds + 1):
             print(f"\n🎪 ROUND {round_num}")
             print("-" * 40)
@@ -329,33 +641,137 @@ Your joke:"""
             comedians_order = list(self.comedians.keys())
             random.shuffle(comedians_order)
             
-            for comedian in comedians_order:
-                print(f"\n🎤 Sul palco: {comedian}!")
-                try:
-                    joke = self.get_joke(comedian, topic)
-                    print(f"   {joke}")
-                    
-                    # Reazione del pubblico
-                    reactions = ["👏 Grandi risate!", "🎉 Applausi!", "⭐ Fantastico!", "😂 Il pubblico impazzisce!"]
-                    print(f"   {random.choice(reactions)}")
+            tasks = [partial(self._obtain_joke, comedian, topic) for comedian in comedians_order]
+            with run_ordered(tasks, concurrency) as results:
+                for index, joke, error in results:
+                    comedian = comedians_order[index]
+                    print(f"\n🎤 Sul palco: {comedian}!")
+                    if error is not None:
+                        print(f"   ⚠️ {comedian} ha avuto problemi tecnici: {error}")
+                    else:
+                        print(f"   {self._present_joke(joke)}")
+                        
+                        # Reazione del pubblico
+                        reactions = ["👏 Grandi risate!", "🎉 Applausi!", "⭐ Fantastico!", "😂 Il pubblico impazzisce!"]
+                        print(f"   {random.choice(reactions)}")
                     
-                except Exception as e:
-                    print(f"   ⚠️ {comedian} ha avuto problemi tecnici: {e}")
+                    if pause:
+                        time.sleep(pause)  # Pausa tra performance
+
+    # --- API async ----------------------------------------------------------
+    
+    @property
+    def async_client(self):
+        """Client async che condivide cache, sessioni e telemetria con self.client"""
+        if self._async_client is None:
+            self._async_client = AsyncOrfeoClient(self.client)
+        return self._async_client
+    
+    async def agenerate_joke(self, comedian_name, topic, enhanced_tv_search=False) -> "GeneratedJoke":
+        """Versione async di generate_joke: l'LLM è atteso sull'event loop, RAG e ricerca
+        web (librerie bloccanti) girano in un thread"""
+        with span("generate_joke", comedian=comedian_name, topic=topic) as joke_span, \
+                self._profiled(comedian_name):
+            joke = await self._agenerate_joke(comedian_name, topic, enhanced_tv_search)
+            joke_span.set(source=joke.source)
+            return joke
+    
+    async def _agenerate_joke(self, comedian_name, topic, enhanced_tv_search):
+        steps = self._joke_steps(comedian_name, topic, enhanced_tv_search)
+        result, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as done:
+                return done.value
+            result, error = None, None
+            try:
+                if step[0] == "rag":
+                    result = await asyncio.to_thread(self._build_rag_prompt, *step[1:])
+                else:
+                    result = await self.async_client.agenerate_candidates(
+                        step[1], **self._candidate_options(*step[2:]))
+            except Exception as e:
+                error = e
+    
+    async def aget_joke(self, comedian_name=None, topic=None, enhanced_tv_search=False):
+        """Versione async di get_joke (stesso risultato, nessun thread occupato durante l'LLM)"""
+        comedian_name = comedian_name or random.choice(list(self.comedians.keys()))
+        topic = topic or self.current_topic or random.choice(self.topics)
+        
+        if comedian_name not in self.comedians:
+            raise ValueError(f"Comedian {comedian_name} not found!")
+        
+        with span("get_joke", comedian=comedian_name, topic=topic) as joke_span, \
+                self._profiled(comedian_name):
+            joke = None
+            if self.joke_pool:
+                # take può attendere una battuta in preparazione: fuori dall'event loop
+                joke = await asyncio.to_thread(self._take_pooled, comedian_name, topic, enhanced_tv_search)
+            if joke is None:
+                joke = await self.agenerate_joke(comedian_name, topic, enhanced_tv_search)
+            joke_span.set(pooled=joke.pooled)
+            # Il feedback scrive su disco
+            return await asyncio.to_thread(self._present_joke, joke)
+    
+    async def aget_joke_for_gui(self, comedian_name=None, topic=None, enhanced_tv_search=False):
+        """Versione async di get_joke_for_gui"""
+        joke = await self.aget_joke(comedian_name, topic, enhanced_tv_search)
+        return {
+            'joke': joke,
+            'comedian': comedian_name or 'Random',
+            'topic': topic or 'Random',
+            'timestamp': time.time()
+        }
+    
+    async def arun_show(self, rounds=2, pause=0.0):
+        """Versione async di run_show: i comici di un round generano insieme sull'event loop
+        
+        Più spettacoli possono girare in parallelo sullo stesso loop e sullo stesso club;
+        le sessioni persona restano aperte finché l'ultimo utente non termina (persona_sessions).
+        """
+        print("\n" + "="*60)
+        print("🎭 BENVENUTI AL COMEDY CLUB AI ! 🎭")
+        print("   Stasera abbiamo 4 fantastici comici AI!")
+        print("="*60)
+        
+        with self.persona_sessions():
+            for round_num in range(1, rounds + 1):
+                print(f"\n🎪 ROUND {round_num}")
+                print("-" * 40)
+                
+                topic = random.choice(self.topics)
+                print(f"🎯 Tema di stasera: {topic.upper()}")
+                
+                comedians_order = list(self.comedians.keys())
+                random.shuffle(comedians_order)
                 
-                time.sleep(1)  # Pausa tra performance
+                results = await asyncio.gather(
+                    *(self.aget_joke(comedian, topic) for comedian in comedians_order),
+                    return_exceptions=True
+                )
+                for comedian, joke in zip(comedians_order, results):
+                    print(f"\n🎤 Sul palco: {comedian}!")
+                    if isinstance(joke, Exception):
+                        print(f"   ⚠️ {comedian} ha avuto problemi tecnici: {joke}")
+                    else:
+                        print(f"   {joke}")
+                        reactions = ["👏 Grandi risate!", "🎉 Applausi!", "⭐ Fantastico!", "😂 Il pubblico impazzisce!"]
+                        print(f"   {random.choice(reactions)}")
+                    
+                    if pause:
+                        await asyncio.sleep(pause)
         
         print(f"\n" + "="*60)
         print("🎭 Grazie a tutti! Spettacolo terminato!")
         print("="*60)
-        
-        # Mostra statistiche se disponibili
-        if self.feedback_system:
-            print("\n📊 STATISTICHE DELLA SERATA:")
-            top_performers = self.feedback_system.get_top_performers()
-            for i, performer in enumerate(top_performers, 1):
-                print(f"   {i}° {performer['comedian']}: {performer['average_score']:.2f}/1.0 "
-                      f"({performer['performances']} performance)")
-
+    
+    async def aclose(self):
+        """Chiude le connessioni async dell'event loop corrente e poi il club"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self.close()
+    
     def show_comedian_stats(self, comedian_name: str = None):
         """Mostra statistiche dettagliate di un comico"""
         if not self.feedback_system:
@@ -393,6 +809,9 @@ Your joke:"""
         print("  - 'show' per uno spettacolo completo")
         print("  - 'show 3' per uno spettacolo di 3 round")
         print("  - nome_comico per una battuta di quel comico")
+        print("  - 'topic nome' per cambiare tema ('topic' da solo: tema casuale)")
+        if self.joke_pool:
+            print("  - 'pool' per lo stato del pool di battute pronte")
         if self.enhanced_rag:
             print("  - 'web on/off' per abilitare/disabilitare ricerca web")
             print("  - 'rag status' per vedere lo stato del sistema RAG")
@@ -402,6 +821,10 @@ Your joke:"""
         print("  - 'quit' per uscire")
         print("-" * 50)
         
+        if self.joke_pool and not self.current_topic:
+            self.set_topic(random.choice(self.topics))
+            print(f"🎯 Tema corrente: {self.current_topic} (battute in preparazione...)")
+        
         while True:
             try:
                 user_input = input(f"\n🎪 Cosa vuoi fare? {'[RAG: ON]' if self.enhanced_rag else ''} ").strip().lower()
@@ -424,6 +847,15 @@ Your joke:"""
                         self.run_show(rounds)
                     except Exception as e:
                         print(f"Errore durante lo spettacolo: {e}")
+                elif user_input == 'topic' or user_input.startswith('topic '):
+                    new_topic = user_input[len('topic'):].strip() or random.choice(self.topics)
+                    self.set_topic(new_topic)
+                    print(f"🎯 Tema corrente: {new_topic}")
+                elif user_input == 'pool' and self.joke_pool:
+                    stats = self.joke_pool.stats()
+                    print(f"⚡ Pool su '{stats['topic']}': pronte {stats['ready']}, in preparazione {stats['pending']}")
+                    print(f"   Servite dal pool: {stats['hits']}, generate al momento: {stats['misses']}, "
+                          f"scartate: {stats['discarded']}")
                 elif user_input == 'web on':
                     self.use_web_search = True
                     print("🌐 Ricerca web abilitata")
@@ -456,6 +888,31 @@ Your joke:"""
             except Exception as e:
                 print(f"Errore: {e}")
     
+    def close(self):
+        """Ferma il pool di battute, chiude le sessioni aperte, sincronizza i log e salva il profiling"""
+        if self.joke_pool:
+            self.joke_pool.close()
+        self.end_persona_sessions()
+        if self.feedback_system and self._owns_feedback_system:
+            self.feedback_system.close()
+        if self.adaptive_system:
+            self.adaptive_system.process_pending()
+            self.adaptive_system.detach()
+            self.adaptive_system.close()
+            if self.adaptive_system.prompt_cache_misses:
+                print(f"🧠 Cache prompt adattivi: {self.adaptive_system.describe_prompt_cache()}")
+        self.writer.close()
+        if self.writer.written:
+            print(f"💾 Salvataggi in background: {self.writer.describe()}")
+        if self.storage:
+            self.storage.close()
+            self.storage = None
+        if self.profiler:
+            written = self.profiler.close()
+            print(f"🔍 Profiling: {self.profiler.describe()}")
+            for path in written:
+                print(f"💾 Profilo salvato in {path}")
+    
     def rate_joke(self, joke: str, comedian: str, topic: str, rating: str, comment: str = None) -> bool:
         """Rate a joke and update the learning system"""
         if not self.rating_system:
@@ -463,9 +920,9 @@ Your joke:"""
             
         success = self.rating_system.add_rating(joke, comedian, topic, rating, comment)
         
-        # Update adaptive system with new patterns
+        # Il voto arriva all'adaptive system come evento: si rianalizza solo quel comico
         if success and self.adaptive_system:
-            self.adaptive_system.analyze_comedian_performance(self.rating_system)
+            self.adaptive_system.process_pending()
             
         return success
     
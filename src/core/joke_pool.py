@@ -0,0 +1,154 @@
+"""
+Pool di battute pre-generate: k battute pronte e già valutate per (comico, tema corrente),
+riempite in background così che le richieste vengano servite senza attendere il modello
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JokePool:
+    """Buffer di battute pronte per comico, legato al tema corrente
+
+    Le battute sono generate e valutate (ComedyTools) in background da
+    ComedyClub.generate_joke; i rifiuti del modello vengono scartati e non arrivano mai
+    all'utente. Cambiare tema (o modalità di ricerca) invalida tutto il pool; le
+    generazioni ancora in corso per il tema precedente vengono ignorate all'arrivo.
+    """
+
+    def __init__(self, club, size: int = 2, workers: int = 2, wait_timeout: float = 30.0,
+                 quiet: bool = True):
+        """
+        Args:
+            club: ComedyClub che genera le battute
+            size: battute pronte da mantenere per ogni comico
+            workers: generazioni in background contemporanee
+            wait_timeout: attesa massima di una battuta già in preparazione quando il buffer è vuoto
+            quiet: genera in background senza messaggi di avanzamento (generate_joke(quiet=True)),
+                   che in modalità interattiva si mescolerebbero al prompt dell'utente
+        """
+        self.club = club
+        self.size = max(1, size)
+        self.wait_timeout = wait_timeout
+        self.quiet = quiet
+        self._buffers = {}  # comico -> deque di GeneratedJoke
+        self._pending = {}  # comico -> generazioni in corso
+        self._key = None  # (tema, enhanced_tv_search) del pool corrente
+        self._generation = 0  # incrementato a ogni invalidazione
+        self._closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="joke-pool")
+
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def set_topic(self, topic: str, enhanced_tv_search: bool = False):
+        """Imposta il tema corrente e avvia il riempimento per tutti i comici"""
+        with self._lock:
+            if self._closed:
+                return
+            self._set_key_unlocked((topic, enhanced_tv_search))
+            for comedian in self.club.comedians:
+                self._refill_unlocked(comedian)
+
+    def _set_key_unlocked(self, key):
+        if key == self._key:
+            return
+        if self._key is not None:
+            stale = sum(len(buffer) for buffer in self._buffers.values())
+            self.discarded += stale
+        self._key = key
+        self._generation += 1
+        self._buffers = {}
+        self._pending = {}
+        self._ready.notify_all()
+
+    def take(self, comedian: str, topic: str, enhanced_tv_search: bool = False):
+        """Battuta pronta per il comico sul tema, None se non ce n'è una valida
+
+        Un tema diverso da quello corrente invalida il pool. Se il buffer è vuoto ma una
+        battuta è già in preparazione la si attende (fino a wait_timeout) invece di
+        avviarne un'altra; il buffer del comico viene poi riempito di nuovo in background.
+        """
+        key = (topic, enhanced_tv_search)
+        with self._ready:
+            if self._closed:
+                return None
+            self._set_key_unlocked(key)
+            self._refill_unlocked(comedian)
+            self._ready.wait_for(
+                lambda: self._key != key or self._buffers.get(comedian) or not self._pending.get(comedian),
+                timeout=self.wait_timeout
+            )
+            buffer = self._buffers.get(comedian) if self._key == key else None
+            joke = buffer.popleft() if buffer else None
+            if joke is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._refill_unlocked(comedian)
+        return joke
+
+    def _refill_unlocked(self, comedian: str):
+        if self._key is None or self._closed:
+            return
+        buffer = self._buffers.setdefault(comedian, deque())
+        missing = self.size - len(buffer) - self._pending.get(comedian, 0)
+        if missing <= 0:
+            return
+        self._pending[comedian] = self._pending.get(comedian, 0) + missing
+        topic, enhanced_tv_search = self._key
+        for _ in range(missing):
+            self._executor.submit(self._produce, comedian, topic, enhanced_tv_search, self._generation)
+
+    def _produce(self, comedian, topic, enhanced_tv_search, generation):
+        joke = None
+        try:
+            if generation == self._generation:
+                joke = self.club.generate_joke(comedian, topic, enhanced_tv_search, quiet=self.quiet)
+        except Exception:
+            joke = None
+
+        with self._ready:
+            if self._closed:
+                return
+            if generation != self._generation:
+                # Tema cambiato nel frattempo: la battuta non serve più
+                self.discarded += joke is not None
+                return
+            self._pending[comedian] = max(0, self._pending.get(comedian, 0) - 1)
+            if joke is None or self.club._is_ai_refusal(joke.text):
+                self.discarded += 1
+            else:
+                self._buffers.setdefault(comedian, deque()).append(joke)
+            self._ready.notify_all()
+
+    def ready(self, comedian: str = None) -> int:
+        """Battute pronte (per un comico o in totale)"""
+        with self._lock:
+            if comedian:
+                return len(self._buffers.get(comedian, ()))
+            return sum(len(buffer) for buffer in self._buffers.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "topic": self._key[0] if self._key else None,
+                "ready": {c: len(b) for c, b in self._buffers.items()},
+                "pending": dict(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded
+            }
+
+    def close(self):
+        """Ferma il riempimento (le generazioni in coda vengono annullate)"""
+        with self._ready:
+            self._closed = True
+            self._generation += 1
+            self._key = None
+            self._ready.notify_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -6,87 +6,454 @@ import requests
 import json
 import sys
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Aggiungi config al path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from config.orfeo_config_new import get_config_list, is_orfeo_available
+from src.core.response_cache import ResponseCache
+from src.core.telemetry import (ClientTelemetry, CallRecord, make_session,
+                                reset_connect_time, read_connect_time)
+from src.utils.console import log, bind_quiet
+from src.utils.tracing import span
 
 class OrfeoClient:
     """Client per comunicare con il modello llama3.3:latest su cluster Orfeo"""
     
-    def __init__(self):
-        """Inizializza il client Orfeo"""
+    def __init__(self, cache_mode: str = None, cache_dir: str = None, config: dict = None,
+                 stream: bool = None):
+        """Inizializza il client Orfeo
         
-        if not is_orfeo_available():
+        Args:
+            cache_mode: 'off', 'read_through' o 'replay' (default: env ORFEO_CACHE_MODE o 'off')
+            cache_dir: directory della cache risposte (default: env ORFEO_CACHE_DIR o logs/llm_cache)
+            config: configurazione esplicita del backend (model, base_url, api_key), ad es.
+                    per puntare al server mock locale; se assente usa config/orfeo_config_new
+            stream: usa lo streaming SSE di chat completions per misurare il time-to-first-token
+                    (default: env ORFEO_STREAM=1)
+        
+        Le sessioni (open_session) mantengono il modello caricato con keep_alive
+        (default: env ORFEO_KEEP_ALIVE o 30m).
+        """
+        
+        cache_mode = cache_mode or os.getenv("ORFEO_CACHE_MODE", "off")
+        cache_dir = cache_dir or os.getenv("ORFEO_CACHE_DIR", "logs/llm_cache")
+        self.cache = ResponseCache(cache_dir=cache_dir, mode=cache_mode)
+        self.stream = stream if stream is not None else os.getenv("ORFEO_STREAM", "0") == "1"
+        self.telemetry = ClientTelemetry()
+        self._session = make_session()  # keep-alive + misura tempi di connessione
+        self.keep_alive = os.getenv("ORFEO_KEEP_ALIVE", "30m")
+        self._prompt_sessions = {}
+        self._prompt_sessions_lock = threading.Lock()
+        
+        if config:
+            self.config = {"ssh_command": "n/a", **config}
+        elif is_orfeo_available():
+            self.config = get_config_list()[0]
+        elif self.cache.replay_only:
+            # In replay non serve il backend: basta il nome del modello per le chiavi della cache
+            self.config = {
+                "model": os.getenv("ORFEO_MODEL", "llama3.3:latest"),
+                "base_url": None,
+                "api_key": None,
+                "ssh_command": "n/a (replay)"
+            }
+        else:
             raise ValueError("⚠️ Orfeo non configurato correttamente - controlla TOKEN in .env")
-            
-        self.config = get_config_list()[0]
         
         print("🚀 OrfeoClient inizializzato:")
         print(f"   Modello: {self.config['model']}")
         print(f"   URL: {self.config['base_url']}")
         print(f"   SSH: {self.config['ssh_command']}")
+        if self.cache.enabled:
+            print(f"   Cache risposte: {self.cache.mode} ({self.cache.cache_dir})")
     
-    def generate(self, prompt, max_tokens=None, temperature=None):
-        """Genera una risposta usando il modello su Orfeo via Open WebUI"""
+    def open_session(self, session_id, system_prompt, keep_alive=None):
+        """Apre una sessione con un prefisso di sistema stabile (es. la persona del comico)
         
-        try:
-            # Prepara payload nel formato Open WebUI standard
-            data = {
-                "model": self.config["model"],
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": temperature or self.config.get("temperature", 0.7),
-                "max_tokens": max_tokens or 150
+        Le richieste con session=session_id inviano il prefisso come messaggio di sistema
+        separato e sempre identico, così il backend riusa il prefill invece di ricalcolarlo
+        a ogni battuta; sul fallback Ollama il prefisso viene elaborato una sola volta e
+        riusato tramite il campo `context`. keep_alive mantiene il modello caricato.
+        """
+        with self._prompt_sessions_lock:
+            self._prompt_sessions[session_id] = {
+                "system": system_prompt,
+                "keep_alive": keep_alive or self.keep_alive,
+                "contexts": {},  # base_url -> context Ollama del prefisso
+                "lock": threading.Lock()
             }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.config['api_key']}"
+    
+    def close_session(self, session_id):
+        """Chiude una sessione aperta con open_session"""
+        with self._prompt_sessions_lock:
+            self._prompt_sessions.pop(session_id, None)
+    
+    def _get_prompt_session(self, session_id):
+        if session_id is None:
+            return None
+        with self._prompt_sessions_lock:
+            prompt_session = self._prompt_sessions.get(session_id)
+        if prompt_session is None:
+            log(f"⚠️ Sessione {session_id} non aperta, richiesta senza prefisso")
+        return prompt_session
+    
+    def generate(self, prompt, max_tokens=None, temperature=None, session=None, stop=None):
+        """Genera una risposta usando il modello su Orfeo via Open WebUI
+        
+        Se la cache è attiva la risposta viene cercata prima su disco, con chiave
+        (modello, prompt, temperature, max_tokens) già risolti ai valori di default.
+        Con session la richiesta usa il prefisso di sistema della sessione; stop è una
+        lista di sequenze che interrompono la generazione (parte della chiave di cache).
+        """
+        
+        temperature, max_tokens = self._resolve_params(temperature, max_tokens)
+        prompt_session = self._get_prompt_session(session)
+        
+        key, cached = self._cache_lookup(prompt, temperature, max_tokens, 1, prompt_session, stop)
+        if cached is not None:
+            return cached
+        
+        call, start = {}, time.perf_counter()
+        with span("llm.generate", n=1, max_tokens=max_tokens) as llm_span:
+            try:
+                response = self._generate_uncached(prompt, max_tokens, temperature, call=call,
+                                                   prompt_session=prompt_session, stop=stop)
+            except Exception:
+                self._record_call(call, start, success=False)
+                raise
+            llm_span.set(endpoint=call.get("endpoint"), completion_tokens=call.get("completion_tokens"))
+        self._record_call(call, start)
+        
+        self._cache_store(key, response, temperature, max_tokens, 1)
+        return response
+    
+    def generate_candidates(self, prompt, n=3, max_tokens=None, temperature=None, session=None,
+                            stop=None):
+        """Genera n risposte candidate per lo stesso prompt con un solo round-trip
+        
+        Usa il parametro `n` di chat completions; se il backend restituisce meno scelte
+        (es. fallback Ollama) le mancanti arrivano da sotto-richieste parallele.
+        """
+        
+        temperature, max_tokens = self._resolve_params(temperature, max_tokens)
+        if n <= 1:
+            return [self.generate(prompt, max_tokens=max_tokens, temperature=temperature, session=session,
+                                  stop=stop)]
+        prompt_session = self._get_prompt_session(session)
+        
+        key, cached = self._cache_lookup(prompt, temperature, max_tokens, n, prompt_session, stop)
+        if cached is not None:
+            return cached
+        
+        call, start = {}, time.perf_counter()
+        with span("llm.generate", n=n, max_tokens=max_tokens) as llm_span:
+            try:
+                candidates = self._generate_choices_uncached(prompt, max_tokens, temperature, n, call=call,
+                                                             prompt_session=prompt_session, stop=stop)
+            except Exception:
+                self._record_call(call, start, success=False)
+                raise
+        
+            missing = n - len(candidates)
+            if missing > 0:
+                log(f"🔀 Backend ha restituito {len(candidates)}/{n} candidate, {missing} sotto-richieste parallele...")
+                sub_calls = [{} for _ in range(missing)]
+                with ThreadPoolExecutor(max_workers=missing) as executor:
+                    futures = [executor.submit(bind_quiet(self._generate_uncached), prompt, max_tokens, temperature,
+                                               sub_call, prompt_session, stop)
+                               for sub_call in sub_calls]
+                    for future in futures:
+                        try:
+                            candidates.append(future.result())
+                        except Exception as e:
+                            log(f"⚠️ Sotto-richiesta fallita: {e}")
+                self._merge_sub_calls(call, sub_calls)
+            llm_span.set(endpoint=call.get("endpoint"), completion_tokens=call.get("completion_tokens"))
+        self._record_call(call, start)
+        
+        if candidates:
+            self._cache_store(key, candidates, temperature, max_tokens, n)
+        return candidates
+    
+    # --- Parti comuni al client sincrono e a AsyncOrfeoClient ---------------
+    
+    def _resolve_params(self, temperature, max_tokens):
+        """temperature e max_tokens risolti ai valori di default (fanno parte della chiave di cache)"""
+        return temperature or self.config.get("temperature", 0.7), max_tokens or 150
+    
+    def _cache_lookup(self, prompt, temperature, max_tokens, n, prompt_session, stop):
+        """Chiave di cache della richiesta e risposta già salvata (None se assente o cache spenta)
+        
+        n entra nella chiave solo per più candidate, così generate e generate_candidates(n=1)
+        condividono le risposte. In replay un miss solleva CacheMiss.
+        """
+        if not self.cache.enabled:
+            return None, None
+        system = prompt_session["system"] if prompt_session else None
+        key = ResponseCache.make_key(self.config["model"], prompt, temperature, max_tokens,
+                                     n=n if n > 1 else None, system=system, stop=stop)
+        cached = self.cache.get(key)
+        if cached is not None:
+            log(f"💾 {len(cached)} candidate servite dalla cache" if n > 1 else "💾 Risposta servita dalla cache")
+            self.telemetry.record(CallRecord(endpoint="cache", latency_s=0.0, cached=True))
+        return key, cached
+    
+    def _cache_store(self, key, value, temperature, max_tokens, n):
+        """Salva la risposta (o le candidate se n > 1) con la chiave di _cache_lookup"""
+        if key is None:
+            return
+        self.cache.put(key, value, {
+            "model": self.config["model"],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **({"n": n} if n > 1 else {})
+        })
+    
+    @staticmethod
+    def _merge_sub_calls(call, sub_calls):
+        """I token delle sotto-richieste appartengono alla stessa chiamata logica"""
+        for sub_call in sub_calls:
+            for name in ("prompt_tokens", "completion_tokens"):
+                if sub_call.get(name) is not None:
+                    call[name] = (call.get(name) or 0) + sub_call[name]
+    
+    @staticmethod
+    def _headers(config):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {config['api_key']}"
+        }
+    
+    @staticmethod
+    def _chat_payload(config, prompt, max_tokens, temperature, n=1, prompt_session=None, stop=None,
+                      stream=False):
+        """Payload chat completions nel formato Open WebUI standard"""
+        data = {
+            "model": config["model"],
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if prompt_session:
+            # Prefisso identico a ogni richiesta: il backend ne riusa il prefill
+            data["messages"].insert(0, {"role": "system", "content": prompt_session["system"]})
+            data["keep_alive"] = prompt_session["keep_alive"]
+        if n > 1:
+            data["n"] = n
+        if stop:
+            data["stop"] = list(stop)
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+        return data
+    
+    @staticmethod
+    def _ollama_payload(config, prompt, max_tokens, temperature, stop=None, prompt_session=None,
+                        context=None):
+        """Payload dell'endpoint Ollama diretto; con un context di sessione il prefisso non
+        viene rielaborato, altrimenti viaggia come system"""
+        data = {
+            "model": config["model"],
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
             }
+        }
+        if stop:
+            data["options"]["stop"] = list(stop)
+        if prompt_session:
+            data["keep_alive"] = prompt_session["keep_alive"]
+            if context:
+                data["context"] = context
+            else:
+                data["system"] = prompt_session["system"]
+        return data
+    
+    @staticmethod
+    def _parse_chat_result(result, n, call):
+        """Scelte di una risposta chat completions (formato OpenAI-compatible), con i token"""
+        usage = result.get("usage") or {}
+        call["prompt_tokens"] = usage.get("prompt_tokens")
+        call["completion_tokens"] = usage.get("completion_tokens")
+        if "choices" in result and len(result["choices"]) > 0:
+            return [choice["message"]["content"] for choice in result["choices"][:n]]
+        elif "response" in result:
+            return [result["response"]]
+        return [str(result)]
+    
+    @staticmethod
+    def _parse_ollama_result(result, call):
+        """Risposta dell'endpoint Ollama diretto, con i token"""
+        call["prompt_tokens"] = result.get("prompt_eval_count")
+        call["completion_tokens"] = result.get("eval_count")
+        return [result["response"]] if "response" in result else [str(result)]
+    
+    @staticmethod
+    def _parse_stream_line(line, call, start, parts):
+        """Elabora una riga SSE di chat completions; False alla fine dello stream
+        
+        Accumula il testo in parts, i token in call e il time-to-first-token al primo delta.
+        """
+        if not line or not line.startswith("data:"):
+            return True
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return False
+        chunk = json.loads(payload)
+        if chunk.get("usage"):
+            call["prompt_tokens"] = chunk["usage"].get("prompt_tokens")
+            call["completion_tokens"] = chunk["usage"].get("completion_tokens")
+        for choice in chunk.get("choices", []):
+            content = choice.get("delta", {}).get("content")
+            if content:
+                if "ttft_s" not in call:
+                    call["ttft_s"] = time.perf_counter() - start
+                parts.append(content)
+        return True
+    
+    def _record_call(self, call, start, success=True):
+        """Registra nella telemetria le misure raccolte durante una chiamata"""
+        self.telemetry.record(CallRecord(
+            endpoint=call.get("endpoint", "n/a"),
+            latency_s=time.perf_counter() - start,
+            connect_s=call.get("connect_s"),
+            ttft_s=call.get("ttft_s"),
+            prompt_tokens=call.get("prompt_tokens"),
+            completion_tokens=call.get("completion_tokens"),
+            retries=call.get("retries", 0),
+            success=success
+        ))
+    
+    def _generate_uncached(self, prompt, max_tokens, temperature, call=None, prompt_session=None,
+                           stop=None):
+        """Esegue la richiesta verso il backend configurato"""
+        return self._generate_choices_uncached(prompt, max_tokens, temperature, 1, call=call,
+                                               prompt_session=prompt_session, stop=stop)[0]
+    
+    def _generate_choices_uncached(self, prompt, max_tokens, temperature, n, call=None,
+                                   prompt_session=None, stop=None):
+        """Richiede fino a n scelte al backend configurato"""
+        return self._request(self.config, prompt, max_tokens, temperature, n=n, call=call,
+                             prompt_session=prompt_session, stop=stop)
+    
+    def _read_chat_stream(self, response, call, start):
+        """Legge una risposta SSE di chat completions misurando il time-to-first-token"""
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not self._parse_stream_line(line, call, start, parts):
+                break
+        return "".join(parts)
+    
+    def _prime_ollama_context(self, config, prompt_session, http, headers):
+        """Elabora il prefisso di sessione una sola volta per backend e ne restituisce il context
+        
+        Il context Ollama è la codifica del prefisso già elaborato: le richieste successive
+        lo riusano invece di ripetere il prefill. None se il backend non lo restituisce.
+        """
+        base_url = config["base_url"]
+        with prompt_session["lock"]:
+            if base_url in prompt_session["contexts"]:
+                return prompt_session["contexts"][base_url]
+            context = None
+            try:
+                log("🔥 Prefill del prefisso di sessione (Ollama)...")
+                response = http.post(
+                    f"{base_url}/generate",
+                    json={
+                        "model": config["model"],
+                        "system": prompt_session["system"],
+                        "prompt": "Stay in character for the whole show. Reply only: OK",
+                        "stream": False,
+                        "keep_alive": prompt_session["keep_alive"],
+                        "options": {"num_predict": 2}
+                    },
+                    headers=headers,
+                    timeout=30
+                )
+                if response.status_code == 200:
+                    context = response.json().get("context")
+            except requests.exceptions.RequestException as e:
+                log(f"⚠️ Prefill sessione fallito: {e}")
+            prompt_session["contexts"][base_url] = context
+            return context
+    
+    def _request(self, config, prompt, max_tokens, temperature, session=None, n=1, call=None,
+                 prompt_session=None, stop=None):
+        """Esegue la richiesta HTTP verso un backend Orfeo (chat completions con fallback Ollama)
+        
+        Args:
+            config: configurazione del backend (model, base_url, api_key)
+            session: requests.Session opzionale, chiudibile per annullare la richiesta
+            n: numero di scelte richieste (solo chat completions)
+            call: dizionario in cui raccogliere le misure per la telemetria
+            prompt_session: stato della sessione aperta con open_session (prefisso stabile)
+            stop: sequenze che interrompono la generazione
+        
+        Returns:
+            Lista delle risposte restituite (almeno una)
+        """
+        
+        http = session or self._session
+        call = call if call is not None else {}
+        stream = self.stream and n == 1
+        reset_connect_time()
+        start = time.perf_counter()
+        
+        try:
+            # Prepara payload nel formato Open WebUI standard
+            data = self._chat_payload(config, prompt, max_tokens, temperature, n=n,
+                                      prompt_session=prompt_session, stop=stop, stream=stream)
+            headers = self._headers(config)
             
-            print(f"🔄 Invio richiesta a Orfeo (Open WebUI standard)...")
+            log(f"🔄 Invio richiesta a Orfeo (Open WebUI standard)...")
             
             # Usa l'endpoint Open WebUI standard per chat completions
-            endpoint = f"{self.config['base_url']}/chat/completions"
-            print(f"🔄 Endpoint: {endpoint}")
+            endpoint = f"{config['base_url']}/chat/completions"
+            log(f"🔄 Endpoint: {endpoint}")
             
-            response = requests.post(
+            call["endpoint"] = endpoint
+            response = http.post(
                 endpoint,
                 json=data,
                 headers=headers,
-                timeout=30  # Ridotto da 120 a 30 secondi per maggiore reattività
+                timeout=30,  # Ridotto da 120 a 30 secondi per maggiore reattività
+                stream=stream
             )
             
+            if response.status_code == 200 and stream:
+                content = self._read_chat_stream(response, call, start)
+                call["connect_s"] = read_connect_time()
+                log("✅ Risposta ricevuta da Orfeo (stream)")
+                return [content]
+            
             if response.status_code == 200:
                 result = response.json()
-                print("✅ Risposta ricevuta da Orfeo")
-                
-                # Formato standard OpenAI-compatible
-                if "choices" in result and len(result["choices"]) > 0:
-                    return result["choices"][0]["message"]["content"]
-                elif "response" in result:
-                    return result["response"]
-                else:
-                    return str(result)
+                call["connect_s"] = read_connect_time()
+                log("✅ Risposta ricevuta da Orfeo")
+                return self._parse_chat_result(result, n, call)
             
             # Fallback: prova endpoint Ollama diretto se disponibile
-            print(f"🔄 Fallback: provo endpoint Ollama diretto...")
+            log(f"🔄 Fallback: provo endpoint Ollama diretto...")
+            response.close()
+            call["retries"] = call.get("retries", 0) + 1
+            call["endpoint"] = f"{config['base_url']}/generate"
             
-            data_direct = {
-                "model": self.config["model"],
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature or self.config.get("temperature", 0.7),
-                    "num_predict": max_tokens or 150
-                }
-            }
+            context = None
+            if prompt_session:
+                context = self._prime_ollama_context(config, prompt_session, http, headers)
+            data_direct = self._ollama_payload(config, prompt, max_tokens, temperature, stop=stop,
+                                               prompt_session=prompt_session, context=context)
             
-            response = requests.post(
-                f"{self.config['base_url']}/generate",
+            response = http.post(
+                f"{config['base_url']}/generate",
                 json=data_direct,
                 headers=headers,
                 timeout=30  # Ridotto da 120 a 30 secondi per maggiore reattività
@@ -94,25 +461,22 @@ class OrfeoClient:
             
             if response.status_code == 200:
                 result = response.json()
-                print("✅ Risposta ricevuta da Orfeo (Ollama)")
-                
-                if "response" in result:
-                    return result["response"]
-                else:
-                    return str(result)
+                call["connect_s"] = read_connect_time()
+                log("✅ Risposta ricevuta da Orfeo (Ollama)")
+                return self._parse_ollama_result(result, call)
             else:
                 error_msg = f"⚠️ Errore API Orfeo: {response.status_code} - {response.text}"
-                print(f"❌ {error_msg}")
+                log(f"❌ {error_msg}")
                 raise Exception(error_msg)
                 
         except requests.exceptions.ConnectionError:
             error_msg = "⚠️ Impossibile connettersi a Orfeo - verifica connessione di rete"
-            print(f"❌ {error_msg}")
+            log(f"❌ {error_msg}")
             raise Exception(error_msg)
         except requests.exceptions.Timeout:
             error_msg = "⚠️ Timeout connessione Orfeo"
-            print(f"❌ {error_msg}")
+            log(f"❌ {error_msg}")
             raise Exception(error_msg)
         except Exception as e:
-            print(f"❌ Errore: {e}")
+            log(f"❌ Errore: {e}")
             raise
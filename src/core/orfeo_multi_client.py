@@ -0,0 +1,233 @@
+"""
+Client multi-backend per Orfeo: bilanciamento per richieste in corso e richieste hedged
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config.orfeo_config_new import get_config_list, is_orfeo_available
+from src.core.orfeo_client_new import OrfeoClient
+from src.core.telemetry import make_session
+from src.utils.console import log, bind_quiet
+
+
+class _Backend:
+    """Stato di un singolo endpoint Orfeo"""
+
+    def __init__(self, config, pool_maxsize=10):
+        self.config = config
+        # Connessioni keep-alive riusate tra le richieste verso questo backend
+        self.session = make_session(pool_maxsize=pool_maxsize)
+        self.outstanding = 0
+        self.completed = 0
+        self.failures = 0
+
+
+class _Attempt:
+    """Un tentativo di richiesta su un backend (primario, hedge o failover)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.call = {}
+        self.sent = threading.Event()  # il worker ha iniziato la richiesta HTTP
+        self.sent_at = None
+        self.discarded = False  # hedge perdente: il risultato verrà ignorato
+
+
+class MultiBackendOrfeoClient(OrfeoClient):
+    """OrfeoClient che distribuisce le richieste su tutti gli endpoint configurati
+
+    Ogni richiesta va al backend con meno richieste in corso. Con hedge=True, se la
+    risposta tarda oltre il percentile di latenza osservato, parte una richiesta
+    duplicata su un altro backend: vince la prima risposta. La richiesta perdente non
+    viene interrotta (requests non può abortire una POST in corso): il backend la porta
+    a termine e il suo risultato viene solo scartato, senza contare nelle statistiche.
+    """
+
+    def __init__(self, cache_mode: str = None, cache_dir: str = None, hedge: bool = False,
+                 hedge_percentile: float = 95.0, hedge_min_samples: int = 20,
+                 latency_window: int = 200, configs: list = None, max_workers: int = None):
+        """Inizializza il client multi-backend
+
+        Args:
+            configs: configurazioni esplicite dei backend (es. più server mock locali);
+                     se assenti usa config/orfeo_config_new
+            hedge: abilita le richieste duplicate per le generazioni lente
+            hedge_percentile: percentile di latenza oltre il quale parte la richiesta hedged
+            hedge_min_samples: campioni minimi prima di stimare il percentile
+            latency_window: numero di latenze recenti usate per la stima
+            max_workers: richieste HTTP contemporanee (default: 16 per backend); i tentativi
+                         in coda non consumano la soglia di hedge, che parte dall'invio
+        """
+        super().__init__(cache_mode=cache_mode, cache_dir=cache_dir, config=configs[0] if configs else None)
+
+        if not configs:
+            configs = get_config_list() if is_orfeo_available() else [self.config]
+        max_workers = max_workers or 16 * len(configs)
+        self.backends = [_Backend(config, pool_maxsize=max_workers) for config in configs]
+        self.hedge = hedge and len(self.backends) > 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="orfeo-backend")
+
+        print(f"   Backend: {len(self.backends)} "
+              f"({', '.join(b.config['base_url'] or 'n/a' for b in self.backends)})")
+        print(f"   Hedging: {'✅ p' + format(hedge_percentile, 'g') if self.hedge else '❌ Disabilitato'}")
+
+    def _pick_backend(self, exclude=()) -> _Backend:
+        """Sceglie il backend con meno richieste in corso (parità risolta a caso), evitando
+        quelli in exclude finché ne resta almeno un altro"""
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+            least = min(b.outstanding for b in candidates)
+            backend = random.choice([b for b in candidates if b.outstanding == least])
+            backend.outstanding += 1
+            return backend
+
+    def _hedge_threshold(self):
+        """Soglia di latenza (secondi) oltre la quale inviare la richiesta duplicata"""
+        with self._lock:
+            return self._hedge_threshold_unlocked()
+
+    def _hedge_threshold_unlocked(self):
+        if len(self._latencies) < self.hedge_min_samples:
+            return None
+        samples = sorted(self._latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100.0))]
+
+    def _attempt(self, attempt, prompt, max_tokens, temperature, n, prompt_session=None, stop=None):
+        """Esegue una richiesta su un backend tenendo traccia di latenza e richieste in corso"""
+        backend = attempt.backend
+        attempt.sent_at = start = time.perf_counter()
+        attempt.sent.set()
+        try:
+            response = self._request(backend.config, prompt, max_tokens, temperature,
+                                     session=backend.session, n=n, call=attempt.call,
+                                     prompt_session=prompt_session, stop=stop)
+            # Un hedge perdente arriva comunque in fondo: non conta come completato e la sua
+            # latenza non deve alzare la soglia di hedge
+            if not attempt.discarded:
+                with self._lock:
+                    backend.completed += 1
+                    self._latencies.append(time.perf_counter() - start)
+            return response
+        except Exception:
+            # Gli errori di un hedge perdente non contano come errori del backend
+            if not attempt.discarded:
+                with self._lock:
+                    backend.failures += 1
+            raise
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+
+    def _launch(self, prompt, max_tokens, temperature, n, exclude=(), prompt_session=None, stop=None):
+        attempt = _Attempt(self._pick_backend(exclude=exclude))
+        future = self._executor.submit(bind_quiet(self._attempt), attempt, prompt, max_tokens,
+                                       temperature, n, prompt_session, stop)
+        future.add_done_callback(lambda f: f.cancelled() and self._release_backend(attempt.backend))
+        return future, attempt
+
+    def _release_backend(self, backend):
+        # Tentativo annullato prima di partire: _attempt non decrementerà outstanding
+        with self._lock:
+            backend.outstanding -= 1
+
+    def _wait_for_hedge(self, future, attempt, threshold):
+        """Attende la prima risposta fino a threshold secondi dall'invio effettivo
+
+        Il tempo passato in coda nell'executor non conta: con molte richieste
+        contemporanee farebbe partire hedge anche quando il backend risponde in tempo.
+        """
+        while not attempt.sent.wait(timeout=threshold):
+            if future.done():
+                return True
+        remaining = threshold - (time.perf_counter() - attempt.sent_at)
+        done, _ = wait([future], timeout=max(0.0, remaining))
+        return bool(done)
+
+    def _generate_choices_uncached(self, prompt, max_tokens, temperature, n, call=None,
+                                   prompt_session=None, stop=None):
+        """Invia la richiesta al backend meno carico, con eventuale hedge o failover"""
+        call = call if call is not None else {}
+        future, first = self._launch(prompt, max_tokens, temperature, n,
+                                     prompt_session=prompt_session, stop=stop)
+        attempts = {future: first}
+
+        threshold = self._hedge_threshold() if self.hedge else None
+        if threshold is not None and not self._wait_for_hedge(future, first, threshold):
+            # La prima richiesta è lenta: duplicala su un altro backend
+            log(f"⏱️ Richiesta lenta (> {threshold:.1f}s), invio hedge...")
+            hedge_future, hedge = self._launch(
+                prompt, max_tokens, temperature, n, exclude=(first.backend,),
+                prompt_session=prompt_session, stop=stop)
+            attempts[hedge_future] = hedge
+            with self._lock:
+                self.hedges_sent += 1
+
+        last_error = None
+        pending = set(attempts)
+        failed_over = False
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for finished in done:
+                try:
+                    response = finished.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+
+                if finished is not future:
+                    with self._lock:
+                        self.hedges_won += 1
+                # Le richieste perdenti non ancora partite vengono annullate; quelle già
+                # inviate finiscono sul backend e il loro risultato viene scartato
+                for loser in pending:
+                    attempts[loser].discarded = True
+                    loser.cancel()
+                # Misure del tentativo vincente; gli altri tentativi contano come retry
+                winner_call = attempts[finished].call
+                call.update(winner_call)
+                call["retries"] = winner_call.get("retries", 0) + len(attempts) - 1
+                return response
+
+            if not pending and not failed_over and len(self.backends) > 1:
+                # Tutti i tentativi falliti: un solo failover su un backend non ancora provato
+                failed_over = True
+                log("🔁 Failover su un altro backend Orfeo...")
+                retry_future, retry = self._launch(
+                    prompt, max_tokens, temperature, n,
+                    exclude={attempt.backend for attempt in attempts.values()},
+                    prompt_session=prompt_session, stop=stop)
+                attempts[retry_future] = retry
+                pending = {retry_future}
+
+        call["retries"] = len(attempts) - 1
+        raise last_error
+
+    def backend_stats(self) -> dict:
+        """Statistiche per backend e sugli hedge"""
+        with self._lock:
+            return {
+                "backends": [
+                    {
+                        "base_url": b.config["base_url"],
+                        "outstanding": b.outstanding,
+                        "completed": b.completed,
+                        "failures": b.failures
+                    }
+                    for b in self.backends
+                ],
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "hedge_threshold": self._hedge_threshold_unlocked()
+            }
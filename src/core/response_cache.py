@@ -0,0 +1,121 @@
+"""
+Cache su disco delle risposte LLM, indirizzata per contenuto
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from src.utils.console import log
+
+CACHE_MODES = ("off", "read_through", "replay")
+
+
+class CacheMiss(Exception):
+    """Sollevata in modalità replay quando la risposta non è in cache"""
+
+
+class ResponseCache:
+    """Cache content-addressed delle risposte di OrfeoClient
+
+    Modalità:
+        off          - nessuna lettura/scrittura
+        read_through - legge dalla cache, in caso di miss chiama il backend e salva
+        replay       - legge solo dalla cache, un miss solleva CacheMiss (nessun backend)
+    """
+
+    def __init__(self, cache_dir: str = "logs/llm_cache", mode: str = "off"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Modalità cache non valida: {mode} (valide: {', '.join(CACHE_MODES)})")
+
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.mode != "off":
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replay_only(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float, max_tokens: int, **extra) -> str:
+        """Calcola la chiave della cache dai parametri di generazione
+
+        I parametri extra (es. stop sequences) entrano nella chiave solo se valorizzati,
+        così le chiavi delle richieste semplici restano stabili.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        # Due livelli di directory per non avere migliaia di file in una sola cartella
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        """Restituisce la risposta in cache o None; in replay un miss solleva CacheMiss"""
+        if not self.enabled:
+            return None
+
+        path = self._path_for(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            with self._lock:
+                self.hits += 1
+            return entry["response"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            with self._lock:
+                self.misses += 1
+            if self.replay_only:
+                raise CacheMiss(f"Risposta non presente in cache (replay): {key[:12]}")
+            return None
+
+    def put(self, key: str, response, request: dict = None):
+        """Salva una risposta in cache (solo in read_through)"""
+        if self.mode != "read_through":
+            return
+
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "response": response,
+            "request": request or {},
+            "created": time.time(),
+        }
+        # Scrittura su file temporaneo + rename: mai voci troncate in cache
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log(f"⚠️ Errore salvataggio cache LLM: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> dict:
+        """Statistiche di utilizzo della cache"""
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
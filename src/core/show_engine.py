@@ -0,0 +1,54 @@
+"""
+Motore dei round: generazione concorrente delle battute con presentazione in ordine
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OrderedRun:
+    """Task in esecuzione parallela, iterabili nell'ordine di sottomissione
+
+    Iterando si ottengono tuple (indice, risultato, errore), ciascuna appena il task
+    corrispondente è pronto; errore è None se il task è riuscito. close() (o l'uscita
+    dal blocco with) annulla i task non ancora partiti, ad es. a spettacolo fermato.
+    """
+
+    def __init__(self, tasks, max_concurrency: int = 4):
+        self._executor = None
+        self._futures = []
+        if tasks:
+            workers = max(1, min(max_concurrency, len(tasks)))
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="comedy-round")
+            # I task partono subito, non alla prima iterazione
+            self._futures = [self._executor.submit(task) for task in tasks]
+
+    def __iter__(self):
+        for index, future in enumerate(self._futures):
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                yield index, None, e
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_ordered(tasks, max_concurrency: int = 4) -> OrderedRun:
+    """Avvia i task in parallelo (al più max_concurrency alla volta) e restituisce
+    i risultati nell'ordine dei task, ciascuno appena è pronto
+
+    Il tempo di un round diventa la latenza del task più lento invece della somma:
+    mentre si presenta il primo comico gli altri stanno già generando.
+
+    Args:
+        tasks: callable senza argomenti (es. functools.partial(club.get_joke, ...))
+        max_concurrency: numero massimo di task in esecuzione contemporanea
+    """
+    return OrderedRun(tasks, max_concurrency)
@@ -0,0 +1,189 @@
+"""
+Pipeline dello spettacolo: un produttore genera in anticipo battute e risposte
+mentre il consumatore (GUI) tiene sul palco l'atto corrente
+"""
+
+import queue
+import random
+import threading
+import time
+from functools import partial
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.core.show_engine import run_ordered
+
+# Tipi di atto prodotti dalla pipeline
+ROUND_START = "round_start"
+JOKE = "joke"
+DEBATE_START = "debate_start"
+RESPONSE = "response"
+DEBATE_END = "debate_end"
+ERROR = "error"
+SHOW_END = "show_end"
+
+
+@dataclass
+class Act:
+    """Un elemento pronto per il palco"""
+    kind: str
+    round_num: int = 0
+    comedian: Optional[str] = None
+    text: str = ""
+    responding_to: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def build_debate_prompt(club, topic: str, comedian: str, target_joke: str) -> str:
+    """Prompt per la replica di un comico alla battuta di un collega"""
+    return (f"React to this joke about {topic} from another comedian as a "
+            f"{club.comedians[comedian]['style']} comedian: '{target_joke}'. "
+            f"Give a witty comeback or build on it with your own joke style. Keep it to 1-2 sentences.")
+
+
+class ShowPipeline:
+    """Produttore/consumatore con coda di look-ahead limitata
+
+    Il thread produttore genera gli atti in ordine di scena (battute del round, poi le
+    repliche del dibattito) e li mette in una coda di profondità `depth`: mentre un
+    atto è sul palco i successivi sono già in generazione, e lo spettacolo procede al
+    ritmo del palco invece che alla somma di palco + latenza del modello.
+    """
+
+    def __init__(self, club, topic: str, comedians_order: List[str], rounds: int = 2,
+                 depth: int = 2, enhanced_tv_search: bool = False, debate: bool = True,
+                 debate_concurrency: int = 4):
+        """
+        Args:
+            club: ComedyClub già inizializzato
+            comedians_order: ordine di scena dei comici (uguale in ogni round)
+            depth: atti pronti che possono attendere in coda oltre a quello sul palco
+            debate: genera la fase di dibattito dopo ogni round
+            debate_concurrency: repliche del dibattito generate in parallelo
+        """
+        self.club = club
+        self.topic = topic
+        self.comedians_order = list(comedians_order)
+        self.rounds = rounds
+        self.depth = max(1, depth)
+        self.enhanced_tv_search = enhanced_tv_search
+        self.debate = debate
+        self.debate_concurrency = debate_concurrency
+
+        self._queue: "queue.Queue[Act]" = queue.Queue(maxsize=self.depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- consumatore ------------------------------------------------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._produce, name="show-pipeline", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Ferma il produttore (gli atti già in coda vengono scartati)"""
+        self._stop.set()
+        self._drain()  # libera un produttore bloccato su una coda piena
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        # Un put già in attesa può essere riuscito subito dopo il primo svuotamento
+        self._drain()
+
+    def _drain(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def next_act(self, timeout: float = 0.2) -> Optional[Act]:
+        """Prossimo atto pronto, None se nessuno è pronto entro timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    @property
+    def ready(self) -> int:
+        """Atti pronti in attesa del palco"""
+        return self._queue.qsize()
+
+    # --- produttore -------------------------------------------------------
+
+    def _put(self, act: Act) -> bool:
+        """Accoda un atto, attendendo se la coda è piena; False se la pipeline è ferma"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(act, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for round_num in range(1, self.rounds + 1):
+                if not self._put(Act(ROUND_START, round_num)):
+                    return
+                round_jokes = self._produce_jokes(round_num)
+                if round_jokes is None:
+                    return
+                if self.debate and len(round_jokes) > 1:
+                    if not self._produce_debate(round_num, round_jokes):
+                        return
+        finally:
+            self._put(Act(SHOW_END))
+
+    def _produce_jokes(self, round_num: int) -> Optional[List[Dict]]:
+        """Genera le battute del round; None se la pipeline è stata fermata"""
+        round_jokes = []
+        for comedian in self.comedians_order:
+            if self._stop.is_set():
+                return None
+            try:
+                if hasattr(self.club, 'get_joke_for_gui'):
+                    joke = self.club.get_joke_for_gui(comedian, self.topic,
+                                                      enhanced_tv_search=self.enhanced_tv_search)['joke']
+                else:
+                    joke = self.club.get_joke(comedian, self.topic, enhanced_tv_search=self.enhanced_tv_search)
+                act = Act(JOKE, round_num, comedian, joke)
+                round_jokes.append({'comedian': comedian, 'joke': joke})
+            except Exception as e:
+                act = Act(ERROR, round_num, comedian, f"{comedian} had technical difficulties: {e}")
+            if not self._put(act):
+                return None
+        return round_jokes
+
+    def _debate_pairs(self, round_jokes: List[Dict]) -> List[Dict]:
+        """Ogni comico risponde una volta alla battuta di un altro"""
+        pairs = []
+        for performer in round_jokes:
+            others = [j for j in round_jokes if j['comedian'] != performer['comedian']]
+            if others:
+                pairs.append({'comedian': performer['comedian'], 'target': random.choice(others)})
+        return pairs
+
+    def _debate_reply(self, comedian: str, target: Dict) -> str:
+        prompt = build_debate_prompt(self.club, self.topic, comedian, target['joke'])
+        profile = self.club.generation_profile("debate")
+        return self.club.client.generate(prompt, max_tokens=profile.max_tokens, stop=profile.stop,
+                                         session=self.club.persona_session(comedian))
+
+    def _produce_debate(self, round_num: int, round_jokes: List[Dict]) -> bool:
+        """Le repliche partono tutte insieme appena le battute del round esistono e vengono
+        accodate nell'ordine di scena: il dibattito costa una latenza di generazione, non quattro"""
+        pairs = self._debate_pairs(round_jokes)
+        tasks = [partial(self._debate_reply, pair['comedian'], pair['target']) for pair in pairs]
+        with run_ordered(tasks, self.debate_concurrency) as replies:
+            if not self._put(Act(DEBATE_START, round_num)):
+                return False
+            for index, reply, error in replies:
+                comedian, target = pairs[index]['comedian'], pairs[index]['target']
+                if error is not None:
+                    act = Act(ERROR, round_num, comedian, f"{comedian} couldn't respond: {error}")
+                else:
+                    act = Act(RESPONSE, round_num, comedian, reply, responding_to=target['comedian'])
+                if not self._put(act):
+                    return False
+            return self._put(Act(DEBATE_END, round_num))
@@ -0,0 +1,248 @@
+"""
+Telemetria per chiamata di OrfeoClient: tempi di connessione, time-to-first-token,
+latenza totale, token e retry, aggregati in istogrammi
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from src.utils.storage import atomic_write_json
+
+# Tempo di connessione accumulato dal thread corrente (azzerato prima di ogni richiesta)
+_connect_times = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_times.value = getattr(_connect_times, "value", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_times.value = getattr(_connect_times, "value", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter che misura il tempo di connessione TCP/TLS delle nuove connessioni"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def make_session(pool_maxsize: int = 10) -> requests.Session:
+    """Sessione HTTP keep-alive con misura dei tempi di connessione
+
+    pool_maxsize: connessioni keep-alive conservate per host (richieste contemporanee)
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def reset_connect_time():
+    _connect_times.value = 0.0
+
+
+def read_connect_time() -> float:
+    """Tempo di connessione del thread corrente dall'ultimo reset (0 se connessione riusata)"""
+    return getattr(_connect_times, "value", 0.0)
+
+
+@dataclass
+class CallRecord:
+    """Misure di una singola chiamata a generate/generate_candidates"""
+    endpoint: str
+    latency_s: float
+    connect_s: Optional[float] = None
+    ttft_s: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    retries: int = 0
+    cached: bool = False
+    success: bool = True
+    timestamp: float = field(default_factory=time.time)
+
+
+class Histogram:
+    """Istogramma a bucket esponenziali con stima dei percentili"""
+
+    def __init__(self, start: float, factor: float = 2.0, buckets: int = 16):
+        self.bounds = [start * factor ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)  # ultimo bucket: overflow
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Limite superiore del bucket che contiene il percentile richiesto"""
+        if not self.count:
+            return None
+        target = math.ceil(pct / 100.0 * self.count)
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": [
+                {"le": bound, "count": c} for bound, c in zip(self.bounds + [math.inf], self.counts) if c
+            ]
+        }
+
+
+class ClientTelemetry:
+    """Aggregatore thread-safe delle misure per chiamata"""
+
+    def __init__(self, keep_last: int = 500):
+        self._lock = threading.Lock()
+        self.keep_last = keep_last
+        self.recent: List[CallRecord] = []
+        self.calls = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.by_endpoint: Dict[str, int] = {}
+        self.histograms = {
+            "latency_s": Histogram(0.05),
+            "connect_s": Histogram(0.001),
+            "ttft_s": Histogram(0.05),
+            "prompt_tokens": Histogram(16),
+            "completion_tokens": Histogram(4),
+        }
+        self._capture = threading.local()
+
+    @contextmanager
+    def capture(self):
+        """Raccoglie le chiamate registrate dal thread corrente nel blocco with
+
+        Utile per attribuire latenza e token LLM a una singola battuta anche quando
+        più battute vengono generate in parallelo.
+        """
+        previous = getattr(self._capture, "records", None)
+        records = []
+        self._capture.records = records
+        try:
+            yield records
+        finally:
+            self._capture.records = previous
+
+    def record(self, record: CallRecord):
+        captured = getattr(self._capture, "records", None)
+        if captured is not None:
+            captured.append(record)
+        with self._lock:
+            self.calls += 1
+            self.recent.append(record)
+            if len(self.recent) > self.keep_last:
+                del self.recent[:len(self.recent) - self.keep_last]
+
+            if record.cached:
+                self.cache_hits += 1
+                return
+            if not record.success:
+                self.failures += 1
+            self.retries += record.retries
+            self.by_endpoint[record.endpoint] = self.by_endpoint.get(record.endpoint, 0) + 1
+
+            for name in ("latency_s", "connect_s", "ttft_s", "prompt_tokens", "completion_tokens"):
+                value = getattr(record, name)
+                if value is not None:
+                    self.histograms[name].observe(value)
+            self.prompt_tokens += record.prompt_tokens or 0
+            self.completion_tokens += record.completion_tokens or 0
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "cache_hits": self.cache_hits,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "by_endpoint": dict(self.by_endpoint),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()}
+            }
+
+    def format_report(self) -> List[str]:
+        """Righe di testo leggibili per CLI e finestra statistiche della GUI"""
+        summary = self.summary()
+        lines = [
+            f"Chiamate: {summary['calls']} (errori: {summary['failures']}, "
+            f"cache: {summary['cache_hits']}, retry: {summary['retries']})",
+            f"Token: {summary['prompt_tokens']} prompt / {summary['completion_tokens']} completion",
+        ]
+        labels = {
+            "latency_s": "Latenza totale",
+            "connect_s": "Connessione",
+            "ttft_s": "Primo token",
+        }
+        for name, label in labels.items():
+            h = summary["histograms"][name]
+            if h["count"]:
+                lines.append(f"{label}: p50 {h['p50']:.3f}s | p90 {h['p90']:.3f}s | "
+                             f"p99 {h['p99']:.3f}s | max {h['max']:.3f}s")
+        for endpoint, count in summary["by_endpoint"].items():
+            lines.append(f"Endpoint {endpoint}: {count}")
+        return lines
+
+    def dump(self, path: str):
+        """Salva riepilogo e ultime chiamate in JSON"""
+        data = self.summary()
+        with self._lock:
+            data["recent_calls"] = [asdict(r) for r in self.recent]
+        atomic_write_json(path, data, backup=False)
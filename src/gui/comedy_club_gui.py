@@ -6,6 +6,7 @@ Creates an animated visualization of the comedy club with joke rating capabiliti
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import json
+import os
 import threading
 import time
 from datetime import datetime
@@ -21,21 +22,54 @@ try:
 except ImportError:
     print("Human rating system not found. Some features may be limited.")
     HumanRatingSystem = None
+try:
+    from src.utils.comedy_feedback import ComedyFeedbackSystem, JokeFeedback
+except ImportError:
+    print("Feedback system not found. Statistics will be limited.")
+    ComedyFeedbackSystem = None
+from src.utils.storage import WriteBehindWriter
 
 class ComedyClubGUI:
     """Visual interface for the comedy club simulation with human rating"""
     
-    def __init__(self, root):
+    # Map clean comedian names to GUI widget names
+    GUI_NAMES = {
+        "Dave": "Dave_Observational",
+        "Mike": "Mike_Dark",
+        "Sarah": "Sarah_Wordplay",
+        "Lisa": "Lisa_Absurd"
+    }
+    
+    def __init__(self, root, pipeline_depth: int = None, pool_size: int = None,
+                 profile_every: int = None):
+        """
+        Args:
+            pipeline_depth: acts generated ahead while one is on stage
+                            (default: env COMEDY_PIPELINE_DEPTH or 2)
+            pool_size: ready jokes kept per comedian on the show topic
+                       (default: env COMEDY_POOL_SIZE or 0, disabled)
+            profile_every: profile one joke in N during the show
+                           (default: env COMEDY_PROFILE_EVERY or 0, disabled; mode from
+                           COMEDY_PROFILE_MODE, output prefix from COMEDY_PROFILE_OUTPUT)
+        """
         self.root = root
         self.root.title("AI Comedy Club Simulation with Rating")
         self.root.geometry("1400x900")
         self.root.configure(bg='#f3ece6')  # Light comedy club theme
         
-        # Initialize rating system
+        # Rating and feedback systems shared with every show; all disk writes go
+        # through a background writer so the Tk thread never blocks on file I/O
+        self.writer = WriteBehindWriter(name="gui-writer")
+        self.storage = None
+        if os.getenv("COMEDY_DB"):
+            from src.utils.comedy_db import open_comedy_db
+            self.storage = open_comedy_db(os.environ["COMEDY_DB"])
         if HumanRatingSystem:
-            self.rating_system = HumanRatingSystem()
+            self.rating_system = HumanRatingSystem(storage=self.storage, writer=self.writer)
         else:
             self.rating_system = None
+        self.feedback_system = (ComedyFeedbackSystem(storage=self.storage, writer=self.writer)
+                                if ComedyFeedbackSystem else None)
         
         # Simulation state
         self.is_running = False
@@ -43,6 +77,10 @@ class ComedyClubGUI:
         self.current_show_log = []
         self.current_performer = None
         self.current_joke_data = None  # Store current joke for rating
+        self.club = None  # ComedyClub of the running show (for live telemetry)
+        self.pipeline_depth = pipeline_depth or int(os.getenv("COMEDY_PIPELINE_DEPTH", "2"))
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv("COMEDY_POOL_SIZE", "0"))
+        self.profile_every = profile_every if profile_every is not None else int(os.getenv("COMEDY_PROFILE_EVERY", "0"))
         
         # Comedian colors for visual distinction
         self.comedian_colors = {
@@ -521,7 +559,16 @@ class ComedyClubGUI:
             
             # MODALITÀ COMPLETA: RAG e Web Search riabilitati
             use_web_search = True  # Riabilitato per contenuti freschi
-            club = ComedyClub(use_web_search=True, use_rag=True, use_rating=True)
+            profiler = None
+            if self.profile_every > 0:
+                from src.utils.profiling import SampledProfiler
+                profiler = SampledProfiler(every=self.profile_every,
+                                           mode=os.getenv("COMEDY_PROFILE_MODE", "sampler"),
+                                           output=os.getenv("COMEDY_PROFILE_OUTPUT", "logs/gui_profile"))
+            club = ComedyClub(use_web_search=True, use_rag=True, use_rating=True, use_sessions=True,
+                              pool_size=self.pool_size, profiler=profiler,
+                              feedback_system=self.feedback_system, rating_system=self.rating_system)
+            self.club = club
             
             # Check what systems are available
             systems_active = []
@@ -541,7 +588,12 @@ class ComedyClubGUI:
             self.show_info.config(text=f"Show started: {datetime.now().strftime('%H:%M:%S')}")
             
             # Start immediately without any delay
-            self.run_visual_show(club)
+            # Persona di ogni comico come prefisso di sessione: prefill una volta per show
+            try:
+                with club.persona_sessions():
+                    self.run_visual_show(club)
+            finally:
+                club.close()
             
         except Exception as e:
             self.update_current_performance("Error", f"System error: {e}")
@@ -550,7 +602,13 @@ class ComedyClubGUI:
                 self.stop_show()
     
     def run_visual_show(self, club):
-        """Run the show with visual updates and comedian debates"""
+        """Run the show with visual updates and comedian debates
+        
+        A ShowPipeline generates the upcoming jokes and debate replies in the background
+        (look-ahead of pipeline_depth acts) while the current act is on stage.
+        """
+        from src.core import show_pipeline
+        
         # Get the user-specified topic
         user_topic = self.topic_entry.get().strip() or "general comedy"
         
@@ -561,158 +619,91 @@ class ComedyClubGUI:
         # Opening - start immediately
         self.update_audience_reaction("🎤 Welcome to the AI Comedy Club!")
         self.update_current_performance("Show Manager", f"🎯 Topic: '{user_topic.upper()}' - Let's go!")
-        # No delay - start immediately
         
-        # Store jokes for debates
-        round_jokes = []
+        enhanced_tv_search = self.tv_meme_var.get()
+        # Warm pool: every comedian starts preparing jokes on the topic right away
+        club.set_topic(user_topic, enhanced_tv_search)
+        pipeline = show_pipeline.ShowPipeline(
+            club, user_topic, comedian_names, rounds=2, depth=self.pipeline_depth,
+            enhanced_tv_search=enhanced_tv_search
+        ).start()
         
-        # Main show with debates
-        for round_num in range(2):  # 2 rounds
-            if not self.is_running:
-                break
+        # Audience reactions per comedian style
+        reactions = {
+            'observational humor': ["😂 Big laughs!", "👏 Standing ovation!", "🤣 Audience loves it!"],
+            'dark humor': ["😬 Nervous laughter", "😨 Gasps then applause", "🖤 Dark humor appreciated"],
+            'wordplay and puns': ["🙄 Groans and laughs", "📚 Dad joke energy!", "🎯 Pun perfection!"],
+            'absurd and surreal humor': ["🤔 Confused laughter", "🌌 Mind = blown", "👽 What just happened?!"]
+        }
+        debate_reactions = ["🔥 Burn!", "😂 Great comeback!", "👏 Brilliant response!", "🎭 Comedy gold!"]
+        
+        try:
+            waiting_shown = False
+            while self.is_running:
+                act = pipeline.next_act()
+                if act is None:
+                    # Generation is slower than the stage: tell the audience once
+                    if not waiting_shown:
+                        self.update_current_performance("Show Manager", "🤔 Next act is getting ready...")
+                        waiting_shown = True
+                    continue
+                waiting_shown = False
                 
-            self.update_current_performance("Show Manager", f"🎭 ROUND {round_num + 1} - Topic: {user_topic}")
-            # Start round immediately
-            
-            # Each comedian performs on the user's topic
-            current_round_jokes = []
-            
-            for comedian_name in comedian_names:
-                if not self.is_running:
+                if act.kind == show_pipeline.SHOW_END:
                     break
                 
-                # Map GUI names to clean names
-                gui_name = comedian_name
-                if comedian_name == "Dave":
-                    gui_name = "Dave_Observational"
-                elif comedian_name == "Mike":
-                    gui_name = "Mike_Dark"
-                elif comedian_name == "Sarah":
-                    gui_name = "Sarah_Wordplay"
-                elif comedian_name == "Lisa":
-                    gui_name = "Lisa_Absurd"
-                else:
-                    # Fallback for unknown comedian
-                    gui_name = comedian_name
+                if act.kind == show_pipeline.ROUND_START:
+                    if act.round_num > 1:
+                        self.update_current_performance("Show Manager", "⏸️ Brief intermission...")
+                    self.update_current_performance("Show Manager", f"🎭 ROUND {act.round_num} - Topic: {user_topic}")
                 
-                # Update status
-                self.update_comedian_status(gui_name, "🎤 Performing")
+                elif act.kind == show_pipeline.DEBATE_START:
+                    self.update_current_performance("Show Manager", "💬 DEBATE TIME - Each comedian gets ONE response!")
                 
-                # Show that we're generating
-                self.update_current_performance(comedian_name, "🤔 Thinking of a joke...")
+                elif act.kind == show_pipeline.DEBATE_END:
+                    self.update_current_performance("Show Manager", "🎪 End of debate for this round!")
                 
-                # Get performance with user's topic and enhanced search option
-                try:
-                    enhanced_tv_search = self.tv_meme_var.get()
-                    
-                    # Use get_joke_for_gui if available for rating integration
-                    if hasattr(club, 'get_joke_for_gui'):
-                        joke_data = club.get_joke_for_gui(comedian_name, user_topic, enhanced_tv_search=enhanced_tv_search)
-                        joke = joke_data['joke']
-                        
-                        # Update joke data for rating
-                        self.update_joke_for_rating({
-                            'joke': joke,
-                            'comedian': comedian_name,
-                            'topic': user_topic,
-                            'timestamp': joke_data.get('timestamp', time.time())
-                        })
-                    else:
-                        joke = club.get_joke(comedian_name, user_topic, enhanced_tv_search=enhanced_tv_search)
-                    
-                    # Store joke for debates
-                    current_round_jokes.append({
-                        'comedian': comedian_name,
-                        'gui_name': gui_name,
-                        'joke': joke
+                elif act.kind == show_pipeline.ERROR:
+                    self.update_current_performance("Error", act.text)
+                
+                elif act.kind == show_pipeline.JOKE:
+                    gui_name = self.GUI_NAMES.get(act.comedian, act.comedian)
+                    self.update_comedian_status(gui_name, "🎤 Performing")
+                    self.update_joke_for_rating({
+                        'joke': act.text,
+                        'comedian': act.comedian,
+                        'topic': user_topic,
+                        'timestamp': act.timestamp
                     })
+                    self.update_current_performance(act.comedian, act.text)
+                    style = club.comedians[act.comedian]['style']
+                    self.update_audience_reaction(random.choice(reactions.get(style, ["👏 Polite applause"])))
                     
-                    # Display performance
-                    self.update_current_performance(comedian_name, joke)
-                    
-                    # Simulate audience reaction based on comedian style
-                    comedian_info = club.comedians[comedian_name]
-                    reactions = {
-                        'observational humor': ["😂 Big laughs!", "👏 Standing ovation!", "🤣 Audience loves it!"],
-                        'dark humor': ["😬 Nervous laughter", "😨 Gasps then applause", "🖤 Dark humor appreciated"],
-                        'wordplay and puns': ["🙄 Groans and laughs", "📚 Dad joke energy!", "🎯 Pun perfection!"],
-                        'absurd and surreal humor': ["🤔 Confused laughter", "🌌 Mind = blown", "👽 What just happened?!"]
-                    }
-                    
-                    reaction = random.choice(reactions.get(comedian_info['style'], ["👏 Polite applause"]))
-                    self.update_audience_reaction(reaction)
-                    
-                    # Tempo ridotto per tutte le battute - 5 secondi
-                    self.smart_sleep(5)  # 5 seconds for all jokes
-                    
-                except Exception as e:
-                    self.update_current_performance("Error", f"{comedian_name} had technical difficulties: {e}")
-                
-                finally:
+                    # Tempo ridotto per tutte le battute - 5 secondi (intanto si generano i prossimi atti)
+                    self.smart_sleep(5)
                     self.update_comedian_status(gui_name, "💤 Waiting")
-            
-            # Now the debate phase!
-            if len(current_round_jokes) > 1 and self.is_running:
-                self.update_current_performance("Show Manager", "💬 DEBATE TIME - Each comedian gets ONE response!")
-                # No delay - instant debate announcement
                 
-                # Each comedian responds to another's joke (ONE TIME ONLY)
-                for i, performer in enumerate(current_round_jokes):
-                    if not self.is_running:
-                        break
+                elif act.kind == show_pipeline.RESPONSE:
+                    gui_name = self.GUI_NAMES.get(act.comedian, act.comedian)
+                    self.update_comedian_status(gui_name, "💭 Responding")
+                    self.update_current_performance(f"{act.comedian} responds to {act.responding_to}", act.text)
                     
-                    # Pick someone else's joke to respond to
-                    other_jokes = [j for j in current_round_jokes if j['comedian'] != performer['comedian']]
-                    if other_jokes:
-                        target_joke = random.choice(other_jokes)
-                        
-                        # Update status
-                        self.update_comedian_status(performer['gui_name'], "💭 Responding")
-                        
-                        # Show that we're generating a response
-                        self.update_current_performance(f"{performer['comedian']}", "💭 Crafting a comeback...")
-                        
-                        try:
-                            # Create a debate prompt
-                            debate_prompt = f"React to this joke about {user_topic} from another comedian as a {club.comedians[performer['comedian']]['style']} comedian: '{target_joke['joke']}'. Give a witty comeback or build on it with your own joke style. Keep it to 1-2 sentences."
-                            
-                            response = club.client.generate(debate_prompt, max_tokens=100)
-                            
-                            self.update_current_performance(f"{performer['comedian']} responds to {target_joke['comedian']}", response)
-                            
-                            # Update joke data for rating the response too!
-                            self.update_joke_for_rating({
-                                'joke': response,
-                                'comedian': performer['comedian'],
-                                'topic': user_topic,
-                                'timestamp': time.time(),
-                                'type': 'response',  # Mark as response for better tracking
-                                'responding_to': target_joke['comedian']
-                            })
-                            
-                            # Audience loves debates!
-                            debate_reactions = ["🔥 Burn!", "😂 Great comeback!", "👏 Brilliant response!", "🎭 Comedy gold!"]
-                            reaction = random.choice(debate_reactions)
-                            self.update_audience_reaction(reaction)
-                            
-                            # Tempo ridotto per tutte le risposte - 5 secondi
-                            self.smart_sleep(5)  # 5 seconds for all responses
-                            
-                        except Exception as e:
-                            self.update_current_performance("Error", f"{performer['comedian']} couldn't respond: {e}")
-                        
-                        finally:
-                            self.update_comedian_status(performer['gui_name'], "💤 Waiting")
-                
-                # End debate phase explicitly
-                self.update_current_performance("Show Manager", "🎪 End of debate for this round!")
-                # No delay - instant end message
-            
-            round_jokes.extend(current_round_jokes)
-            
-            if round_num < 1 and self.is_running:  # Only pause between rounds, not after last
-                self.update_current_performance("Show Manager", "⏸️ Brief intermission...")
-                # No delay - instant intermission
+                    # Update joke data for rating the response too!
+                    self.update_joke_for_rating({
+                        'joke': act.text,
+                        'comedian': act.comedian,
+                        'topic': user_topic,
+                        'timestamp': act.timestamp,
+                        'type': 'response',  # Mark as response for better tracking
+                        'responding_to': act.responding_to
+                    })
+                    self.update_audience_reaction(random.choice(debate_reactions))
+                    
+                    # Tempo ridotto per tutte le risposte - 5 secondi
+                    self.smart_sleep(5)
+                    self.update_comedian_status(gui_name, "💤 Waiting")
+        finally:
+            pipeline.stop()
         
         # Closing
         if self.is_running:
@@ -782,8 +773,6 @@ class ComedyClubGUI:
             import os
             sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
             
-            from src.utils.comedy_feedback import ComedyFeedbackSystem
-            
             # Check if statistics window is already open
             if hasattr(self, 'stats_window') and self.stats_window.winfo_exists():
                 self.stats_window.lift()  # Bring to front
@@ -864,8 +853,6 @@ class ComedyClubGUI:
             import os
             sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
             
-            from src.utils.comedy_feedback import ComedyFeedbackSystem
-            
             # Store current scroll position
             scroll_position = self.stats_text.yview()
             
@@ -873,13 +860,15 @@ class ComedyClubGUI:
             self.stats_text.config(state='normal')
             self.stats_text.delete(1.0, tk.END)
             
-            # Load and display statistics
-            feedback_system = ComedyFeedbackSystem()
+            # Statistics from the shared in-memory feedback system (no disk access)
+            feedback_system = self.feedback_system
+            if feedback_system is None:
+                self.stats_text.insert('end', "Feedback system not available.\n")
+                self.stats_text.config(state='disabled')
+                return
             
             # DEBUG: Mostra tutti i comedian presenti nel feedback
-            all_comedians = set()
-            for feedback in feedback_system.feedback_history:
-                all_comedians.add(feedback.get('comedian', 'Unknown'))
+            all_comedians = set(feedback_system.comedian_aggregates)
             
             self.stats_text.insert('end', f"📋 DEBUG: Comedians found in feedback: {', '.join(sorted(all_comedians))}\n")
             self.stats_text.insert('end', f"📊 Total feedback entries: {len(feedback_system.feedback_history)}\n\n")
@@ -921,6 +910,30 @@ class ComedyClubGUI:
                         self.stats_text.insert('end', f"   Best Joke: {best_joke}\n")
                 
                 self.stats_text.insert('end', "\n")
+
+            # Human ratings: ring buffer of recent votes and per-comedian top-k (no full sorts)
+            if self.rating_system and self.rating_system.ratings:
+                self.stats_text.insert('end', "⭐ RECENT HUMAN RATINGS\n")
+                self.stats_text.insert('end', "-" * 30 + "\n")
+                for rating in self.rating_system.get_recent_ratings(5):
+                    joke = rating.joke[:60] + "..." if len(rating.joke) > 60 else rating.joke
+                    self.stats_text.insert('end', f"   {time.strftime('%H:%M', time.localtime(rating.timestamp))} "
+                                                 f"{rating.comedian} [{rating.rating}]: {joke}\n")
+                for comedian in comedians:
+                    top = self.rating_system.get_top_ratings(comedian, 1)
+                    if top and top[0].rating_score > 0:
+                        joke = top[0].joke[:60] + "..." if len(top[0].joke) > 60 else top[0].joke
+                        self.stats_text.insert('end', f"   🏅 {comedian} most loved: {joke}\n")
+                self.stats_text.insert('end', "\n")
+
+            # LLM call telemetry from the running (or last) show
+            telemetry = getattr(self.club.client, 'telemetry', None) if self.club else None
+            if telemetry is not None and telemetry.calls:
+                self.stats_text.insert('end', "⏱️ LLM TELEMETRY\n")
+                self.stats_text.insert('end', "-" * 30 + "\n")
+                for line in telemetry.format_report():
+                    self.stats_text.insert('end', f"   {line}\n")
+                self.stats_text.insert('end', "\n")
             
             # System info
             self.stats_text.insert('end', "🔧 SYSTEM INFO\n")
@@ -929,9 +942,10 @@ class ComedyClubGUI:
             self.stats_text.insert('end', "   Comedy Tools: ✅ Advanced Reasoning\n")
             self.stats_text.insert('end', "   Feedback System: ✅ Iterative Learning\n")
             self.stats_text.insert('end', f"   Web Search: {'✅ Enabled' if self.web_search_var.get() else '❌ Disabled'}\n")
+            if self.club and self.club.adaptive_system:
+                self.stats_text.insert('end', f"   Adaptive Prompt Cache: {self.club.adaptive_system.describe_prompt_cache()}\n")
             
             # Add last update timestamp
-            import time
             self.stats_text.insert('end', f"\n🕒 Last updated: {time.strftime('%H:%M:%S')}\n")
             
             self.stats_text.config(state='disabled')
@@ -981,13 +995,6 @@ class ComedyClubGUI:
         
         # AGGIUNTO: Salva anche nel sistema di feedback per le statistiche
         try:
-            import sys
-            import os
-            sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
-            from src.utils.comedy_feedback import ComedyFeedbackSystem
-            
-            feedback_system = ComedyFeedbackSystem()
-            
             # Converti rating umano a score numerico
             rating_scores = {
                 'love': 1.0,
@@ -998,10 +1005,6 @@ class ComedyClubGUI:
             }
             
             # Crea un feedback artificiale per le statistiche
-            from dataclasses import asdict
-            from src.utils.comedy_feedback import JokeFeedback
-            import time
-            
             fake_feedback = JokeFeedback(
                 joke=self.current_joke_data['joke'],
                 comedian=self.current_joke_data['comedian'],
@@ -1012,14 +1015,20 @@ class ComedyClubGUI:
                 timestamp=time.time()
             )
             
-            feedback_system.feedback_history.append(asdict(fake_feedback))
-            feedback_system._save_feedback_history()
+            if self.feedback_system:
+                self.feedback_system.record_feedback(fake_feedback)  # persisted in background
             print(f"📊 Rating salvato per {self.current_joke_data['comedian']}: {rating}")
             
         except Exception as e:
             print(f"⚠️ Errore salvataggio feedback: {e}")
         
         if success:
+            # The running show's adaptive system got the vote as an event: re-analyze that
+            # comedian only, on the background writer rather than the Tk thread
+            if self.club and self.club.adaptive_system:
+                adaptive_system = self.club.adaptive_system
+                self.writer.submit(adaptive_system.process_pending, key=("adaptive", id(adaptive_system)))
+
             # Update rating status with more detailed feedback
             rating_text = {
                 'love': '😍 LOVED IT!',
@@ -1077,7 +1086,12 @@ def main():
     """Main function to run the GUI"""
     root = tk.Tk()
     app = ComedyClubGUI(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        app.writer.close()  # flush ratings and feedback still queued
+        if app.storage:
+            app.storage.close()  # only after the writer: queued writes still use it
 
 if __name__ == "__main__":
     main()
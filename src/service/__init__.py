@@ -0,0 +1,11 @@
+# Service module: Comedy Club via HTTP/WebSocket (richiede aiohttp)
+try:
+    from .comedy_service import ComedyService, run_service
+    SERVICE_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Servizio non disponibile: {e}")
+    SERVICE_AVAILABLE = False
+
+__all__ = []
+if SERVICE_AVAILABLE:
+    __all__.extend(['ComedyService', 'run_service'])
@@ -0,0 +1,346 @@
+"""
+Comedy Club come servizio HTTP/WebSocket: molte sessioni di pubblico servite da un solo
+ComedyClub (un modello di embedding, un indice RAG, un client Orfeo con connessioni in pool)
+"""
+
+import asyncio
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+try:
+    from aiohttp import web, WSMsgType
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+from src.core.show_pipeline import (Act, ROUND_START, JOKE, DEBATE_START, RESPONSE, DEBATE_END,
+                                    ERROR, SHOW_END, build_debate_prompt)
+
+RATINGS = ("hate", "dislike", "meh", "like", "love")
+
+
+@dataclass
+class AudienceSession:
+    """Stato di un pubblico collegato: tema, battute ascoltate e voti dati"""
+    session_id: str
+    topic: str
+    enhanced_tv_search: bool = False
+    history: List[Dict] = field(default_factory=list)  # atti (Act) già inviati
+    ratings: int = 0
+    created: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    show_running: bool = False
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def summary(self) -> Dict:
+        data = asdict(self)
+        data["jokes"] = sum(1 for act in self.history if act["kind"] in (JOKE, RESPONSE))
+        return data
+
+
+class ComedyService:
+    """Applicazione aiohttp sopra l'API async di ComedyClub
+
+    Endpoint:
+        GET    /health                        stato, sessioni attive, telemetria LLM
+        POST   /joke                          battuta singola senza sessione
+        POST   /sessions                      nuova sessione {"topic", "enhanced_tv_search"}
+        GET    /sessions/{id}                 stato della sessione
+        DELETE /sessions/{id}                 chiude la sessione
+        POST   /sessions/{id}/joke            battuta sul tema della sessione {"comedian"}
+        POST   /sessions/{id}/rate            voto {"joke", "comedian", "rating", "comment"}
+        GET    /sessions/{id}/show (WS)       spettacolo in streaming, un messaggio JSON per atto;
+                                              il client può votare con {"type": "rate", ...}
+
+    Le generazioni contemporanee sono limitate da max_inflight (le altre attendono);
+    le sessioni inattive oltre session_ttl vengono rimosse.
+    """
+
+    def __init__(self, club, max_inflight: int = 32, max_sessions: int = 1000,
+                 session_ttl: float = 1800.0):
+        """
+        Args:
+            club: ComedyClub condiviso da tutte le sessioni
+            max_inflight: battute/risposte generate contemporaneamente
+            max_sessions: sessioni aperte al massimo (oltre: 429)
+            session_ttl: secondi di inattività dopo cui una sessione viene rimossa
+        """
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("Il servizio richiede aiohttp: pip install aiohttp")
+        self.club = club
+        self.max_inflight = max_inflight
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.sessions: Dict[str, AudienceSession] = {}
+        self.started = time.time()
+        self.jokes_served = 0
+        self._inflight = None  # semaforo creato sull'event loop del servizio
+        self._rating_lock = None  # HumanRatingSystem non è thread-safe
+        self._resources = ExitStack()  # risorse del club tenute per tutta la vita del servizio
+
+    # --- applicazione ------------------------------------------------------
+
+    def make_app(self) -> "web.Application":
+        app = web.Application()
+        app.add_routes([
+            web.get("/health", self.health),
+            web.post("/joke", self.joke),
+            web.post("/sessions", self.create_session),
+            web.get("/sessions/{session_id}", self.get_session),
+            web.delete("/sessions/{session_id}", self.delete_session),
+            web.post("/sessions/{session_id}/joke", self.session_joke),
+            web.post("/sessions/{session_id}/rate", self.session_rate),
+            web.get("/sessions/{session_id}/show", self.show_stream),
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        self._inflight = asyncio.Semaphore(self.max_inflight)
+        self._rating_lock = asyncio.Lock()
+        # Sessioni persona aperte una volta per tutto il servizio (condivise con arun_show)
+        self._resources.enter_context(self.club.persona_sessions())
+
+    async def _on_cleanup(self, app):
+        self._resources.close()
+        await self.club.aclose()
+
+    # --- helper ------------------------------------------------------------
+
+    async def _read_json(self, request) -> Dict:
+        if not request.can_read_body:
+            return {}
+        try:
+            data = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="JSON non valido")
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest(text="Atteso un oggetto JSON")
+        return data
+
+    def _session(self, request) -> AudienceSession:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text="Sessione non trovata")
+        session.touch()
+        return session
+
+    def _comedian(self, name: Optional[str]) -> str:
+        if not name:
+            return random.choice(list(self.club.comedians))
+        name = name.strip().capitalize()
+        if name not in self.club.comedians:
+            raise web.HTTPBadRequest(text=f"Comico sconosciuto: {name}")
+        return name
+
+    def _expire_sessions(self):
+        cutoff = time.time() - self.session_ttl
+        for session_id in [s.session_id for s in self.sessions.values()
+                           if s.last_active < cutoff and not s.show_running]:
+            del self.sessions[session_id]
+
+    async def _generate(self, comedian: str, topic: str, enhanced_tv_search: bool) -> Dict:
+        async with self._inflight:
+            joke = await self.club.agenerate_joke(comedian, topic, enhanced_tv_search)
+            # Valutazione e feedback come get_joke (scrittura su disco fuori dall'event loop)
+            text = await asyncio.to_thread(self.club._present_joke, joke)
+        self.jokes_served += 1
+        return {
+            "comedian": joke.comedian,
+            "topic": joke.topic,
+            "joke": text,
+            "source": joke.source,
+            "score": joke.analysis.overall_score if joke.analysis else None
+        }
+
+    async def _debate_reply(self, comedian: str, topic: str, target: Dict) -> str:
+        profile = self.club.generation_profile("debate")
+        async with self._inflight:
+            return await self.club.async_client.agenerate(
+                build_debate_prompt(self.club, topic, comedian, target["joke"]),
+                max_tokens=profile.max_tokens, stop=profile.stop,
+                session=self.club.persona_session(comedian)
+            )
+
+    async def _rate(self, session: Optional[AudienceSession], data: Dict) -> bool:
+        rating = data.get("rating")
+        if rating not in RATINGS:
+            raise ValueError(f"rating deve essere uno tra {', '.join(RATINGS)}")
+        if not data.get("joke"):
+            raise ValueError("joke mancante")
+        comedian = self._comedian(data.get("comedian"))
+        topic = data.get("topic") or (session.topic if session else "general")
+        async with self._rating_lock:
+            ok = await asyncio.to_thread(self.club.rate_joke, data["joke"], comedian, topic,
+                                         rating, data.get("comment"))
+        if ok and session:
+            session.ratings += 1
+        return ok
+
+    # --- endpoint HTTP -----------------------------------------------------
+
+    async def health(self, request):
+        telemetry = getattr(self.club.client, "telemetry", None)
+        return web.json_response({
+            "status": "ok",
+            "uptime_s": time.time() - self.started,
+            "sessions": len(self.sessions),
+            "jokes_served": self.jokes_served,
+            "rag": bool(self.club.enhanced_rag),
+            "native_async_client": self.club.async_client.native,
+            "telemetry": telemetry.format_report() if telemetry and telemetry.calls else []
+        })
+
+    async def joke(self, request):
+        data = await self._read_json(request)
+        topic = data.get("topic") or random.choice(self.club.topics)
+        result = await self._generate(self._comedian(data.get("comedian")), topic,
+                                      bool(data.get("enhanced_tv_search")))
+        return web.json_response(result)
+
+    async def create_session(self, request):
+        data = await self._read_json(request)
+        self._expire_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            raise web.HTTPTooManyRequests(text="Troppe sessioni aperte")
+        session = AudienceSession(
+            session_id=uuid.uuid4().hex,
+            topic=data.get("topic") or random.choice(self.club.topics),
+            enhanced_tv_search=bool(data.get("enhanced_tv_search"))
+        )
+        self.sessions[session.session_id] = session
+        return web.json_response(session.summary(), status=201)
+
+    async def get_session(self, request):
+        return web.json_response(self._session(request).summary())
+
+    async def delete_session(self, request):
+        session = self._session(request)
+        self.sessions.pop(session.session_id, None)
+        return web.json_response({"deleted": session.session_id})
+
+    async def session_joke(self, request):
+        session = self._session(request)
+        data = await self._read_json(request)
+        result = await self._generate(self._comedian(data.get("comedian")), session.topic,
+                                      session.enhanced_tv_search)
+        session.history.append(asdict(Act(JOKE, 0, result["comedian"], result["joke"])))
+        return web.json_response(result)
+
+    async def session_rate(self, request):
+        session = self._session(request)
+        try:
+            ok = await self._rate(session, await self._read_json(request))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        return web.json_response({"rated": ok, "ratings": session.ratings})
+
+    # --- spettacolo in streaming -------------------------------------------
+
+    async def show_stream(self, request):
+        """WebSocket: invia gli atti dello spettacolo appena pronti, nell'ordine di scena
+
+        Query: rounds (default 2), debate (default 1). Tutte le battute di un round e poi
+        tutte le repliche del dibattito partono insieme; ogni atto viene inviato appena
+        pronto e quelli precedenti in scena sono già stati inviati.
+        """
+        session = self._session(request)
+        if session.show_running:
+            raise web.HTTPConflict(text="Spettacolo già in corso per questa sessione")
+        try:
+            rounds = max(1, min(10, int(request.query.get("rounds", 2))))
+        except ValueError:
+            raise web.HTTPBadRequest(text="rounds deve essere un intero")
+        debate = request.query.get("debate", "1") != "0"
+
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        reader = asyncio.create_task(self._read_show_messages(ws, session))
+        session.show_running = True
+        try:
+            for round_num in range(1, rounds + 1):
+                await self._send_act(ws, session, Act(ROUND_START, round_num, text=session.topic))
+                round_jokes = await self._stream_jokes(ws, session, round_num)
+                if debate and len(round_jokes) > 1:
+                    await self._stream_debate(ws, session, round_num, round_jokes)
+            await self._send_act(ws, session, Act(SHOW_END))
+        except ConnectionResetError:
+            pass  # il pubblico se n'è andato
+        finally:
+            session.show_running = False
+            session.touch()
+            reader.cancel()
+            await ws.close()
+        return ws
+
+    async def _send_act(self, ws, session: AudienceSession, act: Act):
+        message = asdict(act)
+        session.history.append(message)
+        await ws.send_json(message)
+
+    async def _stream_jokes(self, ws, session, round_num) -> List[Dict]:
+        order = list(self.club.comedians)
+        random.shuffle(order)
+        tasks = [asyncio.create_task(self._generate(c, session.topic, session.enhanced_tv_search))
+                 for c in order]
+        round_jokes = []
+        try:
+            for comedian, task in zip(order, tasks):
+                try:
+                    result = await task
+                    act = Act(JOKE, round_num, comedian, result["joke"])
+                    round_jokes.append({"comedian": comedian, "joke": result["joke"]})
+                except Exception as e:
+                    act = Act(ERROR, round_num, comedian, f"{comedian} had technical difficulties: {e}")
+                await self._send_act(ws, session, act)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return round_jokes
+
+    async def _stream_debate(self, ws, session, round_num, round_jokes):
+        pairs = []
+        for performer in round_jokes:
+            others = [j for j in round_jokes if j["comedian"] != performer["comedian"]]
+            pairs.append((performer["comedian"], random.choice(others)))
+        tasks = [asyncio.create_task(self._debate_reply(comedian, session.topic, target))
+                 for comedian, target in pairs]
+        try:
+            await self._send_act(ws, session, Act(DEBATE_START, round_num))
+            for (comedian, target), task in zip(pairs, tasks):
+                try:
+                    act = Act(RESPONSE, round_num, comedian, await task, responding_to=target["comedian"])
+                except Exception as e:
+                    act = Act(ERROR, round_num, comedian, f"{comedian} couldn't respond: {e}")
+                await self._send_act(ws, session, act)
+            await self._send_act(ws, session, Act(DEBATE_END, round_num))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _read_show_messages(self, ws, session):
+        """Voti inviati dal pubblico durante lo spettacolo"""
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = msg.json()
+                if data.get("type") != "rate":
+                    continue
+                ok = await self._rate(session, data)
+                await ws.send_json({"kind": "rated", "ok": ok, "ratings": session.ratings})
+            except (ValueError, web.HTTPException) as e:
+                await ws.send_json({"kind": "error", "text": getattr(e, "text", None) or str(e)})
+
+
+def run_service(club, host: str = "127.0.0.1", port: int = 8080, **kwargs):
+    """Avvia il servizio (bloccante) finché non viene interrotto"""
+    service = ComedyService(club, **kwargs)
+    web.run_app(service.make_app(), host=host, port=port, print=None)
@@ -2,12 +2,14 @@
 Adaptive Comedy System: Sistema di apprendimento per migliorare i comici
 """
 
-import json
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional
 from dataclasses import dataclass, asdict
-import os
+import heapq
+import threading
 import time
 
+from src.utils.storage import JsonlLog, RetentionPolicy, apply_retention, load_json_document
+
 @dataclass
 class ComedyImprovement:
     """Suggerimento di miglioramento per un comico"""
@@ -21,140 +23,276 @@ class ComedyImprovement:
 class AdaptiveComedySystem:
     """Sistema che apprende dai rating umani e migliora i prompt dei comici"""
     
-    def __init__(self, improvements_file: str = "logs/comedy_improvements.json"):
+    def __init__(self, improvements_file: str = "logs/comedy_improvements.jsonl",
+                 legacy_file: str = "logs/comedy_improvements.json", storage=None,
+                 writer=None, retention: Optional[RetentionPolicy] = RetentionPolicy(max_records=1000)):
+        """
+        Args:
+            improvements_file: log JSONL append-only dei miglioramenti
+            legacy_file: vecchio file JSON; i miglioramenti vengono importati se il log non
+                         esiste ancora, i pattern appresi vengono letti da qui
+            storage: ComedyDB SQLite al posto dei file (solo i nuovi miglioramenti vengono scritti)
+            writer: WriteBehindWriter per salvare in background (None = salvataggio sincrono)
+            retention: limiti del log; i miglioramenti più vecchi vanno in archivio JSONL
+                       (controllati al caricamento e dopo ogni scrittura)
+        """
         self.improvements_file = improvements_file
+        self.legacy_file = legacy_file
+        self.storage = storage
+        self.writer = writer
+        self.retention = None if storage else retention
+        self._lock = threading.RLock()
+        self._log = None if storage else JsonlLog(improvements_file)
+        self._unpersisted: List[Dict] = []  # miglioramenti in attesa del writer
         self.improvements: List[ComedyImprovement] = []
         self.learned_patterns: Dict[str, Dict[str, Any]] = {}
+        self.rating_system = None  # impostato da attach()
+        self._dirty = set()  # comici con rating non ancora analizzati
+        # Frammenti di prompt per comico: (id rating system, comico) -> (versione rating, testo)
+        self._prompt_cache: Dict[tuple, tuple] = {}
+        self.prompt_cache_hits = 0
+        self.prompt_cache_misses = 0
         self.load_data()
     
     def load_data(self):
         """Carica miglioramenti e pattern esistenti"""
         try:
-            if os.path.exists(self.improvements_file):
-                with open(self.improvements_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                self.improvements = [
-                    ComedyImprovement(**imp) for imp in data.get('improvements', [])
-                ]
-                self.learned_patterns = data.get('learned_patterns', {})
+            if self.storage:
+                self.improvements = [ComedyImprovement(**imp) for imp in self.storage.load_improvements()]
+                self.learned_patterns = self.storage.load_learned_patterns()
+                return
+            
+            legacy = (load_json_document(self.legacy_file) if self.legacy_file else None) or {}
+            self.learned_patterns = legacy.get('learned_patterns', {})
+            if not self._log.exists() and legacy.get('improvements'):
+                self._log.compact(imp for imp in legacy['improvements'] if isinstance(imp, dict))
+                print(f"📦 Migrati {len(legacy['improvements'])} miglioramenti da {self.legacy_file} "
+                      f"a {self.improvements_file}")
+            records = self._log.load()
+            kept = apply_retention(self.improvements_file, records, self.retention)
+            if self._log.skipped_lines or len(kept) != len(records):
+                self._log.compact(kept)
+            self.improvements = [ComedyImprovement(**imp) for imp in kept]
         except Exception as e:
             print(f"⚠️ Errore caricamento miglioramenti: {e}")
             self.improvements = []
             self.learned_patterns = {}
     
-    def save_data(self):
-        """Salva i dati"""
+    def _persist_unpersisted(self):
+        """Aggiunge in fondo al log i nuovi miglioramenti (nessuna riscrittura dello storico)"""
+        with self._lock:
+            records, self._unpersisted = self._unpersisted, []
         try:
-            os.makedirs(os.path.dirname(self.improvements_file), exist_ok=True)
-            
-            data = {
-                'improvements': [asdict(imp) for imp in self.improvements],
-                'learned_patterns': self.learned_patterns
-            }
-            
-            with open(self.improvements_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-                
+            self._log.extend(records)
+            if self._over_retention():
+                self._enforce_retention()
         except Exception as e:
             print(f"⚠️ Errore salvataggio miglioramenti: {e}")
     
-    def analyze_comedian_performance(self, rating_system) -> Dict[str, List[ComedyImprovement]]:
-        """Analizza le performance e genera miglioramenti"""
+    def _over_retention(self) -> bool:
+        if not self.retention:
+            return False
+        return bool((self.retention.max_records and len(self.improvements) > self.retention.max_records)
+                    or (self.retention.max_bytes and self._log.size() > self.retention.max_bytes))
+    
+    def _enforce_retention(self):
+        """Archivia i miglioramenti più vecchi e riscrive il log con i restanti"""
+        with self._lock:
+            records = [asdict(imp) for imp in self.improvements]
+            kept = apply_retention(self.improvements_file, records, self.retention)
+            self.improvements = self.improvements[len(records) - len(kept):]
+            self._log.compact(kept)
+            self._unpersisted = []  # già compresi nella riscrittura
+    
+    def close(self):
+        """Porta su disco i miglioramenti ancora in coda al writer"""
+        if self.writer:
+            self.writer.flush()
+        if self._log:
+            self._log.close()
+    
+    def attach(self, rating_system):
+        """Si iscrive agli eventi di rating: ogni voto segna il comico come da rianalizzare"""
+        self.rating_system = rating_system
+        rating_system.add_listener(self.on_rating)
+    
+    def detach(self):
+        """Smette di ricevere eventi (es. a fine spettacolo con un rating system condiviso)"""
+        if self.rating_system is not None:
+            self.rating_system.remove_listener(self.on_rating)
+    
+    def on_rating(self, rating):
+        """Evento di un nuovo rating umano"""
+        with self._lock:
+            self._dirty.add(rating.comedian)
+    
+    def process_pending(self) -> Dict[str, List[ComedyImprovement]]:
+        """Rianalizza e salva solo i comici che hanno ricevuto rating dall'ultima analisi"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty or self.rating_system is None:
+            return {}
+        return self.analyze_comedian_performance(self.rating_system, comedians=dirty)
+    
+    def analyze_comedian_performance(self, rating_system,
+                                     comedians: Optional[Iterable[str]] = None) -> Dict[str, List[ComedyImprovement]]:
+        """Analizza le performance e genera miglioramenti
+        
+        Args:
+            rating_system: HumanRatingSystem con i pattern appresi
+            comedians: comici da analizzare (None = tutti)
+        """
         
         improvements_by_comedian = {}
+        new_improvements = []
         
         # Controlla se il rating_system è disponibile
         if not rating_system or not hasattr(rating_system, 'patterns'):
             print("⚠️ Rating system non disponibile per l'analisi delle performance")
             return improvements_by_comedian
         
-        for comedian, pattern in rating_system.patterns.items():
-            improvements = []
-            
-            # Analisi rating medio
-            if pattern.avg_rating < -0.5:
-                improvements.append(ComedyImprovement(
-                    comedian=comedian,
-                    improvement_type='style',
-                    suggestion=f"Il tuo stile attuale non sta funzionando (rating medio: {pattern.avg_rating:.2f}). "
-                              f"Prova un approccio più leggero e evita: {', '.join(pattern.failed_elements[:3])}",
-                    confidence=0.8,
-                    based_on_ratings=pattern.total_ratings,
-                    timestamp=time.time()
-                ))
-            
-            elif pattern.avg_rating > 1.0:
-                improvements.append(ComedyImprovement(
-                    comedian=comedian,
-                    improvement_type='style',
-                    suggestion=f"Ottimo lavoro! (rating medio: {pattern.avg_rating:.2f}). "
-                              f"Continua con: {', '.join(pattern.successful_elements[:3])}",
-                    confidence=0.9,
-                    based_on_ratings=pattern.total_ratings,
-                    timestamp=time.time()
-                ))
-            
-            # Analisi topic
-            if pattern.preferred_topics:
-                improvements.append(ComedyImprovement(
-                    comedian=comedian,
-                    improvement_type='topic',
-                    suggestion=f"I tuoi topic di maggior successo sono: {', '.join(pattern.preferred_topics)}. "
-                              f"Concentrati su questi argomenti.",
-                    confidence=0.7,
-                    based_on_ratings=len([r for r in rating_system.ratings if r.comedian == comedian]),
-                    timestamp=time.time()
-                ))
-            
-            # Analisi struttura
-            successful_structures = [elem for elem in pattern.successful_elements 
-                                   if elem in ['setup_punchline', 'question_format', 'short_joke', 'long_joke']]
-            
-            if successful_structures:
-                improvements.append(ComedyImprovement(
-                    comedian=comedian,
-                    improvement_type='structure',
-                    suggestion=f"Le strutture che funzionano per te: {', '.join(successful_structures)}",
-                    confidence=0.6,
-                    based_on_ratings=pattern.total_ratings,
-                    timestamp=time.time()
-                ))
-            
+        if comedians is None:
+            comedians = list(rating_system.patterns)
+        
+        for comedian in comedians:
+            pattern = rating_system.patterns.get(comedian)
+            if pattern is None:
+                continue
+            improvements = self._improvements_for(comedian, pattern, rating_system)
             improvements_by_comedian[comedian] = improvements
             
             # Salva i miglioramenti
-            self.improvements.extend(improvements)
+            with self._lock:
+                self.improvements.extend(improvements)
+                if not self.storage:
+                    self._unpersisted.extend(asdict(imp) for imp in improvements)
+            new_improvements.extend(improvements)
+        
+        if not new_improvements:
+            return improvements_by_comedian
         
-        self.save_data()
+        if self.storage:
+            records, learned = [asdict(imp) for imp in new_improvements], dict(self.learned_patterns)
+            task, key = (lambda: self._persist_improvements(records, learned)), None
+        else:
+            # I nuovi miglioramenti in attesa vengono scritti insieme
+            task, key = self._persist_unpersisted, ("improvements", id(self))
+        if self.writer:
+            self.writer.submit(task, key=key)
+        else:
+            task()
         return improvements_by_comedian
     
+    def _improvements_for(self, comedian: str, pattern, rating_system) -> List[ComedyImprovement]:
+        """Miglioramenti per un singolo comico dal suo pattern"""
+        improvements = []
+        
+        # Analisi rating medio
+        if pattern.avg_rating < -0.5:
+            improvements.append(ComedyImprovement(
+                comedian=comedian,
+                improvement_type='style',
+                suggestion=f"Il tuo stile attuale non sta funzionando (rating medio: {pattern.avg_rating:.2f}). "
+                          f"Prova un approccio più leggero e evita: {', '.join(pattern.top_failed(3))}",
+                confidence=0.8,
+                based_on_ratings=pattern.total_ratings,
+                timestamp=time.time()
+            ))
+        
+        elif pattern.avg_rating > 1.0:
+            improvements.append(ComedyImprovement(
+                comedian=comedian,
+                improvement_type='style',
+                suggestion=f"Ottimo lavoro! (rating medio: {pattern.avg_rating:.2f}). "
+                          f"Continua con: {', '.join(pattern.top_successful(3))}",
+                confidence=0.9,
+                based_on_ratings=pattern.total_ratings,
+                timestamp=time.time()
+            ))
+        
+        # Analisi topic
+        if pattern.preferred_topics:
+            improvements.append(ComedyImprovement(
+                comedian=comedian,
+                improvement_type='topic',
+                suggestion=f"I tuoi topic di maggior successo sono: {', '.join(pattern.top_topics())}. "
+                          f"Concentrati su questi argomenti.",
+                confidence=0.7,
+                based_on_ratings=rating_system.comedian_totals[comedian].count
+                                 if comedian in rating_system.comedian_totals else 0,
+                timestamp=time.time()
+            ))
+        
+        # Analisi struttura
+        successful_structures = [elem for elem in pattern.top_successful() 
+                               if elem in ['setup_punchline', 'question_format', 'short_joke', 'long_joke']]
+        
+        if successful_structures:
+            improvements.append(ComedyImprovement(
+                comedian=comedian,
+                improvement_type='structure',
+                suggestion=f"Le strutture che funzionano per te: {', '.join(successful_structures)}",
+                confidence=0.6,
+                based_on_ratings=pattern.total_ratings,
+                timestamp=time.time()
+            ))
+        
+        return improvements
+    
+    def _persist_improvements(self, records: List[Dict], learned_patterns: Dict[str, Dict]):
+        try:
+            self.storage.add_improvements(records, learned_patterns)
+        except Exception as e:
+            print(f"⚠️ Errore salvataggio miglioramenti: {e}")
+    
     def get_enhanced_prompt(self, comedian: str, base_prompt: str, rating_system) -> str:
         """Migliora il prompt di un comico basandosi sui rating"""
+        fragment = self.get_adaptive_fragment(comedian, rating_system)
+        return f"{base_prompt}\n\n{fragment}" if fragment else base_prompt
+    
+    def get_adaptive_fragment(self, comedian: str, rating_system) -> str:
+        """Sezione di feedback dal pubblico per il prompt del comico ("" se non c'è nulla da dire)
         
+        Il testo cambia solo quando il comico riceve nuovi rating: resta in cache finché
+        la sua versione nel rating system non cambia.
+        """
         # Controlla se il rating_system è disponibile
         if not rating_system or not hasattr(rating_system, 'patterns'):
-            return base_prompt
-            
-        if comedian not in rating_system.patterns:
-            return base_prompt
+            return ""
+        
+        version = rating_system.rating_version(comedian)
+        key = (id(rating_system), comedian)
+        with self._lock:
+            cached = self._prompt_cache.get(key)
+            if cached and cached[0] == version:
+                self.prompt_cache_hits += 1
+                return cached[1]
+            self.prompt_cache_misses += 1
+        
+        fragment = self._build_adaptive_fragment(rating_system.patterns.get(comedian))
+        with self._lock:
+            self._prompt_cache[key] = (version, fragment)
+        return fragment
+    
+    def _build_adaptive_fragment(self, pattern) -> str:
+        if pattern is None:
+            return ""
         
-        pattern = rating_system.patterns[comedian]
         enhancements = []
         
         # Aggiungi elementi di successo
         if pattern.successful_elements:
-            successful = ', '.join(pattern.successful_elements[:3])
+            successful = ', '.join(pattern.top_successful(3))
             enhancements.append(f"ELEMENTI CHE FUNZIONANO: {successful}")
         
         # Evita elementi fallimentari
         if pattern.failed_elements:
-            failed = ', '.join(pattern.failed_elements[:3])
+            failed = ', '.join(pattern.top_failed(3))
             enhancements.append(f"EVITA ASSOLUTAMENTE: {failed}")
         
         # Topic preferiti
         if pattern.preferred_topics:
-            topics = ', '.join(pattern.preferred_topics[:2])
+            topics = ', '.join(pattern.top_topics(2))
             enhancements.append(f"TOPIC DI SUCCESSO: {topics}")
         
         # Rating feedback
@@ -164,15 +302,23 @@ class AdaptiveComedySystem:
             enhancements.append("Il pubblico non sta ridendo. Cambia approccio, sii più leggero.")
         
         if enhancements:
-            enhanced_prompt = f"{base_prompt}\n\n--- FEEDBACK DAL PUBBLICO ---\n" + "\n".join(enhancements)
-            return enhanced_prompt
-        
-        return base_prompt
+            return "--- FEEDBACK DAL PUBBLICO ---\n" + "\n".join(enhancements)
+        return ""
+    
+    def describe_prompt_cache(self) -> str:
+        """Riepilogo della cache dei frammenti di prompt"""
+        lookups = self.prompt_cache_hits + self.prompt_cache_misses
+        hit_rate = self.prompt_cache_hits / lookups * 100 if lookups else 0.0
+        return (f"{self.prompt_cache_hits} hit, {self.prompt_cache_misses} miss "
+                f"({hit_rate:.0f}% hit rate, {len(self._prompt_cache)} comici)")
     
     def get_comedian_insights(self, comedian: str) -> Dict[str, Any]:
         """Ottieni insights dettagliati su un comico"""
         
-        comedian_improvements = [imp for imp in self.improvements if imp.comedian == comedian]
+        if self.storage:
+            comedian_improvements = [ComedyImprovement(**imp) for imp in self.storage.load_improvements(comedian)]
+        else:
+            comedian_improvements = [imp for imp in self.improvements if imp.comedian == comedian]
         
         # Raggruppa per tipo
         insights = {
@@ -191,12 +337,8 @@ class AdaptiveComedySystem:
                 insights['by_type'][imp.improvement_type] = []
             insights['by_type'][imp.improvement_type].append(imp.suggestion)
         
-        # Ultime 3 suggestions
-        insights['latest_suggestions'] = sorted(
-            comedian_improvements, 
-            key=lambda x: x.timestamp, 
-            reverse=True
-        )[:3]
+        # Ultime 3 suggestions (selezione parziale, senza ordinare tutto lo storico)
+        insights['latest_suggestions'] = heapq.nlargest(3, comedian_improvements, key=lambda x: x.timestamp)
         
         # Confidence media
         insights['confidence_avg'] = sum(imp.confidence for imp in comedian_improvements) / len(comedian_improvements)
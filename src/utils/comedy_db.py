@@ -0,0 +1,258 @@
+"""
+Comedy DB: un unico database SQLite per feedback, rating umani e miglioramenti adattivi,
+con indici su comico, topic e timestamp e importazione dei vecchi file JSON/JSONL in logs/
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from src.utils.storage import JsonlLog, load_json_document
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    joke TEXT NOT NULL,
+    comedian TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    quality_score REAL NOT NULL,
+    audience_score REAL NOT NULL,
+    feedback_notes TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_comedian ON feedback (comedian, timestamp);
+CREATE INDEX IF NOT EXISTS idx_feedback_topic ON feedback (topic);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback (timestamp);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    joke TEXT NOT NULL,
+    comedian TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    rating_score REAL NOT NULL,
+    comment TEXT,
+    timestamp REAL NOT NULL,
+    context TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ratings_comedian ON ratings (comedian, timestamp);
+CREATE INDEX IF NOT EXISTS idx_ratings_topic ON ratings (topic);
+CREATE INDEX IF NOT EXISTS idx_ratings_timestamp ON ratings (timestamp);
+
+CREATE TABLE IF NOT EXISTS learning_patterns (
+    comedian TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS improvements (
+    id INTEGER PRIMARY KEY,
+    comedian TEXT NOT NULL,
+    improvement_type TEXT NOT NULL,
+    suggestion TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    based_on_ratings INTEGER NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_improvements_comedian ON improvements (comedian, timestamp);
+CREATE INDEX IF NOT EXISTS idx_improvements_timestamp ON improvements (timestamp);
+
+CREATE TABLE IF NOT EXISTS learned_patterns (
+    comedian TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+FEEDBACK_COLUMNS = ("joke", "comedian", "topic", "quality_score", "audience_score", "feedback_notes", "timestamp")
+RATING_COLUMNS = ("joke", "comedian", "topic", "rating", "rating_score", "comment", "timestamp", "context")
+IMPROVEMENT_COLUMNS = ("comedian", "improvement_type", "suggestion", "confidence", "based_on_ratings", "timestamp")
+JSON_COLUMNS = ("feedback_notes", "context")
+NUMERIC_COLUMNS = ("quality_score", "audience_score", "rating_score", "confidence", "based_on_ratings", "timestamp")
+
+
+def _row_values(record: Dict, columns) -> tuple:
+    """Valori di una riga; i campi mancanti nei record legacy prendono un default neutro"""
+    values = []
+    for column in columns:
+        value = record.get(column)
+        if column in JSON_COLUMNS:
+            value = json.dumps(value if value is not None else ([] if column == "feedback_notes" else {}),
+                               ensure_ascii=False)
+        elif value is None and column in NUMERIC_COLUMNS:
+            value = 0
+        elif value is None and column != "comment":
+            value = ""
+        values.append(value)
+    return tuple(values)
+
+
+def _row_record(row: sqlite3.Row) -> Dict:
+    record = dict(row)
+    record.pop("id", None)
+    for column in JSON_COLUMNS:
+        if column in record:
+            record[column] = json.loads(record[column])
+    return record
+
+
+class ComedyDB:
+    """Store SQLite condiviso da ComedyFeedbackSystem, HumanRatingSystem e AdaptiveComedySystem
+
+    Ogni nuovo record è un INSERT (costo indipendente dallo storico); le statistiche sono
+    servite dagli aggregati in memoria dei sistemi, ricostruiti all'avvio da load_feedback e
+    load_ratings. Una connessione sola, usabile da più thread, serializzata da un lock;
+    journal WAL per scritture brevi.
+    """
+
+    def __init__(self, path: str = "logs/comedy.db"):
+        """
+        Args:
+            path: file del database (":memory:" per un database temporaneo)
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and path != ":memory:":
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _insert_many(self, table: str, columns, records: Iterable[Dict]) -> int:
+        rows = [_row_values(record, columns) for record in records]
+        if not rows:
+            return 0
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+        return len(rows)
+
+    def count(self, table: str) -> int:
+        return self._query(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    # --- Feedback ---
+
+    def extend_feedback(self, records: Iterable[Dict]):
+        """Inserisce più feedback in una sola transazione"""
+        self._insert_many("feedback", FEEDBACK_COLUMNS, records)
+
+    def load_feedback(self) -> List[Dict]:
+        return [_row_record(row) for row in self._query("SELECT * FROM feedback ORDER BY id")]
+
+    # --- Rating umani ---
+
+    def add_rating(self, record: Dict, pattern: Optional[Dict] = None):
+        """Inserisce un rating e, nella stessa transazione, il pattern aggiornato del comico"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO ratings ({', '.join(RATING_COLUMNS)}) VALUES ({', '.join('?' for _ in RATING_COLUMNS)})",
+                _row_values(record, RATING_COLUMNS)
+            )
+            if pattern is not None:
+                self._upsert_pattern("learning_patterns", pattern["comedian"], pattern)
+
+    def load_ratings(self) -> List[Dict]:
+        return [_row_record(row) for row in self._query("SELECT * FROM ratings ORDER BY id")]
+
+    def _upsert_pattern(self, table: str, comedian: str, data: Dict):
+        self._conn.execute(f"INSERT INTO {table} (comedian, data) VALUES (?, ?) "
+                           f"ON CONFLICT(comedian) DO UPDATE SET data = excluded.data",
+                           (comedian, json.dumps(data, ensure_ascii=False)))
+
+    def save_learning_patterns(self, patterns: Dict[str, Dict]):
+        with self._lock, self._conn:
+            for comedian, data in patterns.items():
+                self._upsert_pattern("learning_patterns", comedian, data)
+
+    def load_learning_patterns(self) -> Dict[str, Dict]:
+        return {row["comedian"]: json.loads(row["data"])
+                for row in self._query("SELECT comedian, data FROM learning_patterns")}
+
+    # --- Miglioramenti adattivi ---
+
+    def add_improvements(self, records: Iterable[Dict], learned_patterns: Optional[Dict[str, Dict]] = None):
+        with self._lock:
+            self._insert_many("improvements", IMPROVEMENT_COLUMNS, records)
+            if learned_patterns:
+                with self._conn:
+                    for comedian, data in learned_patterns.items():
+                        self._upsert_pattern("learned_patterns", comedian, data)
+
+    def load_improvements(self, comedian: str = None) -> List[Dict]:
+        if comedian is None:
+            rows = self._query("SELECT * FROM improvements ORDER BY id")
+        else:
+            rows = self._query("SELECT * FROM improvements WHERE comedian = ? ORDER BY id", (comedian,))
+        return [_row_record(row) for row in rows]
+
+    def load_learned_patterns(self) -> Dict[str, Dict]:
+        return {row["comedian"]: json.loads(row["data"])
+                for row in self._query("SELECT comedian, data FROM learned_patterns")}
+
+    # --- Importazione ---
+
+    def import_json_logs(self, logs_dir: str = "logs") -> Dict[str, int]:
+        """Importa i file JSON/JSONL esistenti nelle tabelle ancora vuote
+
+        Idempotente: una tabella che contiene già dati non viene toccata, e i file
+        originali restano intatti. Restituisce il numero di record importati per tabella.
+        """
+        imported = {"feedback": 0, "ratings": 0, "improvements": 0}
+
+        if not self.count("feedback"):
+            log = JsonlLog(os.path.join(logs_dir, "comedy_feedback.jsonl"))
+            records = log.load() if log.exists() else load_json_document(
+                os.path.join(logs_dir, "comedy_feedback.json"), expected=list) or []
+            imported["feedback"] = self._insert_many(
+                "feedback", FEEDBACK_COLUMNS, (r for r in records if isinstance(r, dict)))
+
+        if not self.count("ratings"):
+            data = load_json_document(os.path.join(logs_dir, "human_ratings.json")) or {}
+            imported["ratings"] = self._insert_many("ratings", RATING_COLUMNS, data.get("ratings", []))
+            if data.get("patterns"):
+                self.save_learning_patterns(data["patterns"])
+
+        if not self.count("improvements"):
+            data = load_json_document(os.path.join(logs_dir, "comedy_improvements.json")) or {}
+            log = JsonlLog(os.path.join(logs_dir, "comedy_improvements.jsonl"))
+            records = log.load() if log.exists() else data.get("improvements", [])
+            self.add_improvements(records, data.get("learned_patterns"))
+            imported["improvements"] = self.count("improvements")
+
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_comedy_db(path: str, logs_dir: str = "logs") -> ComedyDB:
+    """Apre il database e importa alla prima apertura i log JSON esistenti"""
+    db = ComedyDB(path)
+    imported = db.import_json_logs(logs_dir)
+    if any(imported.values()):
+        print(f"📦 Importati in {path}: " + ", ".join(f"{n} {table}" for table, n in imported.items() if n))
+    return db
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Importa i log JSON del Comedy Club in SQLite')
+    parser.add_argument('--db', default='logs/comedy.db', help='File del database')
+    parser.add_argument('--logs', default='logs', help='Cartella dei log JSON/JSONL da importare')
+    args = parser.parse_args()
+
+    db = open_comedy_db(args.db, args.logs)
+    for table in ("feedback", "ratings", "improvements"):
+        print(f"   {table}: {db.count(table)} record")
+    db.close()
@@ -2,10 +2,14 @@
 Comedy Feedback System: Sistema di feedback iterativo per migliorare le battute
 """
 
-import json
+import threading
 import time
-from typing import List, Dict, Any
-from dataclasses import dataclass, asdict
+from collections import deque
+from typing import Deque, List, Dict, Any, Optional
+from dataclasses import dataclass, asdict, field
+
+from src.utils.storage import JsonlLog, RetentionPolicy, apply_retention, migrate_json_array
+from src.utils.tracing import span
 
 @dataclass
 class JokeFeedback:
@@ -17,33 +21,188 @@ class JokeFeedback:
     audience_score: float  # Simulato basato su parametri
     feedback_notes: List[str]
     timestamp: float
+
+@dataclass
+class FeedbackAggregate:
+    """Aggregati incrementali dei feedback di un comico (o di un topic)"""
+    count: int = 0
+    quality_sum: float = 0.0
+    audience_sum: float = 0.0
+    # Come audience_sum ma con 0.5 per i feedback legacy senza audience_score (bonus storico)
+    historical_audience_sum: float = 0.0
+    best_audience: float = float('-inf')
+    best_joke: str = ''
+    topic_counts: Dict[str, int] = field(default_factory=dict)
+    # Somme cumulative degli audience score in ordine di timestamp (trend a metà storico in O(1))
+    audience_prefix: List[float] = field(default_factory=lambda: [0.0])
+    recent: Deque[float] = field(default_factory=deque)  # ultimi audience score (finestra mobile)
+    
+    def add(self, entry: Dict):
+        quality = entry.get('quality_score', 0)
+        audience = entry.get('audience_score', 0)
+        self.count += 1
+        self.quality_sum += quality
+        self.audience_sum += audience
+        self.historical_audience_sum += entry.get('audience_score', 0.5)
+        if audience > self.best_audience:
+            self.best_audience = audience
+            self.best_joke = entry.get('joke', '')
+        topic = entry.get('topic', '')
+        self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+        self.audience_prefix.append(self.audience_prefix[-1] + audience)
+        self.recent.append(audience)
+    
+    @property
+    def average_quality(self) -> float:
+        return self.quality_sum / self.count if self.count else 0.0
+    
+    @property
+    def average_audience(self) -> float:
+        return self.audience_sum / self.count if self.count else 0.0
+    
+    @property
+    def historical_audience(self) -> float:
+        return self.historical_audience_sum / self.count if self.count else 0.0
+    
+    @property
+    def recent_average(self) -> float:
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
     
 class ComedyFeedbackSystem:
     """Sistema di feedback per migliorare le performance comiche"""
     
-    def __init__(self, feedback_file: str = "logs/comedy_feedback.json"):
+    def __init__(self, feedback_file: str = "logs/comedy_feedback.jsonl",
+                 legacy_file: str = "logs/comedy_feedback.json", storage=None,
+                 recent_window: int = 20, writer=None,
+                 retention: Optional[RetentionPolicy] = RetentionPolicy(max_bytes=5 * 1024 * 1024)):
+        """
+        Args:
+            feedback_file: log JSONL append-only dei feedback
+            legacy_file: vecchio storico JSON, importato se il log non esiste ancora
+            storage: ComedyDB SQLite al posto del log JSONL
+            recent_window: feedback più recenti considerati nelle medie "recenti"
+            writer: WriteBehindWriter che scrive i feedback in background (None = scrittura sincrona)
+            retention: limiti del log JSONL; oltre, i feedback più vecchi vanno in archivio
+                       (controllati al caricamento e dopo ogni scrittura), None = nessun limite
+        """
         self.feedback_file = feedback_file
-        self.feedback_history = self._load_feedback_history()
+        self.storage = storage
+        self.writer = writer
+        self.retention = None if storage else retention
+        self._unpersisted: List[Dict] = []  # feedback in attesa del writer
+        self.recent_window = max(1, recent_window)
+        self._lock = threading.RLock()  # scritture e letture degli aggregati da più thread
+        self._log = None if storage else JsonlLog(feedback_file)
+        self.feedback_history = self._load_feedback_history(legacy_file)
+        self.comedian_aggregates: Dict[str, FeedbackAggregate] = {}
+        self.topic_aggregates: Dict[str, FeedbackAggregate] = {}
+        self._rebuild_aggregates()
         self.audience_preferences = self._load_audience_preferences()
         
-    def _load_feedback_history(self) -> List[Dict]:
-        """Carica lo storico dei feedback"""
+    def _load_feedback_history(self, legacy_file: str = None) -> List[Dict]:
+        """Carica lo storico dei feedback (in streaming dal log JSONL o dal database)"""
         try:
-            with open(self.feedback_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
+            if self.storage:
+                return self.storage.load_feedback()
+            if legacy_file:
+                imported = migrate_json_array(legacy_file, self._log)
+                if imported:
+                    print(f"📦 Migrati {imported} feedback da {legacy_file} a {self.feedback_file}")
+            history = self._log.load()
+            if self._log.skipped_lines:
+                # Coda troncata da un'interruzione: riscrive il log con i soli record validi
+                print(f"⚠️ {self._log.skipped_lines} righe di feedback illeggibili ignorate, log compattato")
+                self._log.compact(history)
+            kept = apply_retention(self.feedback_file, history, self.retention)
+            if len(kept) != len(history):
+                self._log.compact(kept)
+            return kept
         except Exception as e:
             print(f"Errore caricamento feedback: {e}")
             return []
     
-    def _save_feedback_history(self):
-        """Salva lo storico dei feedback"""
-        try:
-            with open(self.feedback_file, 'w', encoding='utf-8') as f:
-                json.dump(self.feedback_history, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Errore salvataggio feedback: {e}")
+    def _new_aggregate(self) -> FeedbackAggregate:
+        return FeedbackAggregate(recent=deque(maxlen=self.recent_window))
+    
+    def _aggregate_entry(self, entry: Dict):
+        comedian = entry.get('comedian', 'Unknown')
+        if comedian not in self.comedian_aggregates:
+            self.comedian_aggregates[comedian] = self._new_aggregate()
+        self.comedian_aggregates[comedian].add(entry)
+        topic = entry.get('topic', '')
+        if topic not in self.topic_aggregates:
+            self.topic_aggregates[topic] = self._new_aggregate()
+        self.topic_aggregates[topic].add(entry)
+    
+    def _rebuild_aggregates(self):
+        """Ricalcola gli aggregati dallo storico caricato (in ordine di timestamp)"""
+        with self._lock:
+            self.comedian_aggregates = {}
+            self.topic_aggregates = {}
+            for entry in sorted(self.feedback_history, key=lambda f: f.get('timestamp', 0)):
+                self._aggregate_entry(entry)
+    
+    def record_feedback(self, feedback: JokeFeedback):
+        """Aggiunge un feedback allo storico: una riga in fondo al log, O(1) sullo storico
+
+        Con un writer la scrittura avviene in background: i feedback accumulati nel
+        frattempo vengono scritti insieme.
+        """
+        entry = asdict(feedback)
+        with self._lock:
+            self.feedback_history.append(entry)
+            self._aggregate_entry(entry)
+            if self.writer is None:
+                self._persist([entry])
+                return
+            self._unpersisted.append(entry)
+        self.writer.submit(self._persist_unpersisted, key=("feedback", id(self)))
+    
+    def _persist_unpersisted(self):
+        with self._lock:
+            entries, self._unpersisted = self._unpersisted, []
+        self._persist(entries)
+    
+    def _persist(self, entries: List[Dict]):
+        with span("feedback.persist", entries=len(entries)):
+            try:
+                if self.storage:
+                    self.storage.extend_feedback(entries)
+                else:
+                    self._log.extend(entries)
+                    if (self.retention and self.retention.max_bytes
+                            and self._log.size() > self.retention.max_bytes):
+                        self._enforce_retention()
+            except Exception as e:
+                print(f"Errore salvataggio feedback: {e}")
+    
+    def _enforce_retention(self):
+        """Archivia i feedback più vecchi e riscrive il log con i restanti
+        
+        Gli aggregati vengono ricalcolati sui feedback rimasti, come al prossimo caricamento:
+        le statistiche non cambiano dopo un riavvio. La compattazione scende a compact_ratio
+        del limite, quindi il ricalcolo non avviene a ogni scrittura.
+        """
+        with self._lock:
+            self.feedback_history = apply_retention(self.feedback_file, self.feedback_history, self.retention)
+            self._log.compact(self.feedback_history)
+            self._unpersisted = []  # già compresi nella riscrittura
+            self._rebuild_aggregates()
+    
+    def compact(self):
+        """Riscrive il log con lo storico in memoria (rimuove righe danneggiate)"""
+        if self.writer:
+            self.writer.flush()
+        with self._lock:
+            if self._log:
+                self._log.compact(self.feedback_history)
+    
+    def close(self):
+        """Porta su disco le ultime righe scritte (comprese quelle ancora in coda al writer)"""
+        if self.writer:
+            self.writer.flush()
+        if self._log:
+            self._log.close()
     
     def _load_audience_preferences(self) -> Dict[str, float]:
         """Carica le preferenze simulate del pubblico"""
@@ -92,13 +251,13 @@ class ComedyFeedbackSystem:
     
     def _get_comedian_historical_bonus(self, comedian: str) -> float:
         """Calcola bonus basato sulla performance storica del comico"""
-        comedian_history = [f for f in self.feedback_history if f.get('comedian') == comedian]
-        
-        if not comedian_history:
-            return 0.0
+        with self._lock:
+            aggregate = self.comedian_aggregates.get(comedian)
+            if not aggregate:
+                return 0.0
             
-        # Media degli score del pubblico per questo comico
-        avg_audience_score = sum(f.get('audience_score', 0.5) for f in comedian_history) / len(comedian_history)
+            # Media degli score del pubblico per questo comico (0.5 se mancante)
+            avg_audience_score = aggregate.historical_audience
         
         # Bonus/penalità basata sulla performance storica
         if avg_audience_score > 0.7:
@@ -130,8 +289,7 @@ class ComedyFeedbackSystem:
         )
         
         # Salva nel database di feedback
-        self.feedback_history.append(asdict(feedback))
-        self._save_feedback_history()
+        self.record_feedback(feedback)
         
         return feedback
     
@@ -177,47 +335,50 @@ class ComedyFeedbackSystem:
     
     def get_comedian_stats(self, comedian: str) -> Dict[str, Any]:
         """Ottieni statistiche per un comico specifico"""
-        comedian_jokes = [f for f in self.feedback_history if f.get('comedian') == comedian]
-        
-        if not comedian_jokes:
-            return {"message": f"Nessuna performance registrata per {comedian}"}
-        
-        avg_quality = sum(j.get('quality_score', 0) for j in comedian_jokes) / len(comedian_jokes)
-        avg_audience = sum(j.get('audience_score', 0) for j in comedian_jokes) / len(comedian_jokes)
-        
-        # Trova la battuta migliore
-        best_joke = max(comedian_jokes, key=lambda j: j.get('audience_score', 0))
-        
-        # Analizza i topic preferiti
-        topics = [j.get('topic', '') for j in comedian_jokes]
-        topic_counts = {}
-        for topic in topics:
-            topic_counts[topic] = topic_counts.get(topic, 0) + 1
-        
-        best_topic = max(topic_counts.items(), key=lambda x: x[1])[0] if topic_counts else "N/A"
-        
-        return {
-            "comedian": comedian,
-            "total_performances": len(comedian_jokes),
-            "average_quality": avg_quality,
-            "average_audience_score": avg_audience,
-            "best_joke": best_joke.get('joke', ''),
-            "best_topic": best_topic,
-            "improvement_trend": self._calculate_improvement_trend(comedian_jokes)
-        }
+        with self._lock:
+            aggregate = self.comedian_aggregates.get(comedian)
+            
+            if not aggregate:
+                return {"message": f"Nessuna performance registrata per {comedian}"}
+            
+            # Topic più frequente (a parità, il primo incontrato)
+            best_topic = max(aggregate.topic_counts.items(), key=lambda x: x[1])[0] if aggregate.topic_counts else "N/A"
+            
+            return {
+                "comedian": comedian,
+                "total_performances": aggregate.count,
+                "average_quality": aggregate.average_quality,
+                "average_audience_score": aggregate.average_audience,
+                "recent_audience_score": aggregate.recent_average,
+                "best_joke": aggregate.best_joke,
+                "best_topic": best_topic,
+                "improvement_trend": self._calculate_improvement_trend(aggregate)
+            }
     
-    def _calculate_improvement_trend(self, jokes: List[Dict]) -> str:
+    def get_topic_stats(self, topic: str) -> Optional[Dict[str, Any]]:
+        """Statistiche aggregate di un topic (None se mai usato)"""
+        with self._lock:
+            aggregate = self.topic_aggregates.get(topic)
+            if not aggregate:
+                return None
+            return {
+                "topic": topic,
+                "total_performances": aggregate.count,
+                "average_quality": aggregate.average_quality,
+                "average_audience_score": aggregate.average_audience,
+                "recent_audience_score": aggregate.recent_average
+            }
+    
+    def _calculate_improvement_trend(self, aggregate: FeedbackAggregate) -> str:
         """Calcola il trend di miglioramento di un comico"""
-        if len(jokes) < 3:
+        if aggregate.count < 3:
             return "Dati insufficienti"
         
-        # Ordina per timestamp
-        sorted_jokes = sorted(jokes, key=lambda j: j.get('timestamp', 0))
-        
-        # Confronta prima metà con seconda metà
-        mid = len(sorted_jokes) // 2
-        first_half_avg = sum(j.get('audience_score', 0) for j in sorted_jokes[:mid]) / mid
-        second_half_avg = sum(j.get('audience_score', 0) for j in sorted_jokes[mid:]) / (len(sorted_jokes) - mid)
+        # Confronta prima metà con seconda metà (somme cumulative in ordine di timestamp)
+        prefix = aggregate.audience_prefix
+        mid = aggregate.count // 2
+        first_half_avg = prefix[mid] / mid
+        second_half_avg = (prefix[-1] - prefix[mid]) / (aggregate.count - mid)
         
         if second_half_avg > first_half_avg + 0.1:
             return "📈 In miglioramento!"
@@ -228,23 +389,13 @@ class ComedyFeedbackSystem:
     
     def get_top_performers(self, limit: int = 3) -> List[Dict[str, Any]]:
         """Ottieni i migliori performer"""
-        comedian_stats = {}
-        
-        for feedback in self.feedback_history:
-            comedian = feedback.get('comedian', 'Unknown')
-            if comedian not in comedian_stats:
-                comedian_stats[comedian] = []
-            comedian_stats[comedian].append(feedback.get('audience_score', 0))
-        
-        # Calcola medie e ordina
-        averages = []
-        for comedian, scores in comedian_stats.items():
-            avg_score = sum(scores) / len(scores)
-            averages.append({
+        # Le battute di più richieste concorrenti aggiungono comici durante l'iterazione
+        with self._lock:
+            averages = [{
                 'comedian': comedian,
-                'average_score': avg_score,
-                'performances': len(scores)
-            })
+                'average_score': aggregate.average_audience,
+                'performances': aggregate.count
+            } for comedian, aggregate in self.comedian_aggregates.items()]
         
         return sorted(averages, key=lambda x: x['average_score'], reverse=True)[:limit]
 
@@ -274,9 +274,72 @@ class ComedyTools:
         
         return suggestions
 
+    def _get_personality_boost(self, comedian_name: str) -> str:
+        """Static personality amplifier for a comedian (part of the persona preamble)"""
+        
+        if 'Dave' in comedian_name:
+            return """
+  DAVE PERSONALITY AMPLIFIER:
+- Be EDGY and push boundaries (but stay clever)
+- Use unexpected perspectives that shock then make people think
+- Reference personal experiences with a dark twist
+- Master of the unexpected callback and misdirection
+- Don't just observe - JUDGE and be brutally honest about human nature
+"""
+        elif 'Sarah' in comedian_name:
+            return """
+  SARAH PERSONALITY AMPLIFIER:
+- Be RAZOR SHARP with wit - cut through BS instantly  
+- Use self-deprecating humor but from a position of strength
+- Master of one-liners that hit like a slap
+- Reference dating, relationships, patriarchy and modern life with brutal honesty
+- Don't just make jokes - make POINTS about society
+"""
+        elif 'Mike' in comedian_name:
+            return """
+  MIKE PERSONALITY AMPLIFIER:
+- Be the EVERYMAN but with surprising depth
+- Find the absurd in the mundane with perfect timing
+- Master of building tension then releasing it unexpectedly
+- Connect with the audience like you're talking to friends at a bar
+"""
+        elif 'Lisa' in comedian_name:
+            return """
+  LISA PERSONALITY AMPLIFIER:
+- Be INTELLECTUALLY TWISTED - smart humor with dark edges
+- Use scientific/academic references in unexpected ways
+- Master of wordplay and linguistic manipulation
+- Find humor in things others find disturbing or weird
+- Don't explain the joke - let smart people get it
+"""
+        return ""
+
+    def get_persona_preamble(self, style: str, comedian_persona: Dict) -> str:
+        """Static persona preamble, identical for every joke of the same comedian.
+        
+        Sent once as system prompt of a client session so the backend can reuse
+        its prefill; pair it with generate_comedy_prompt(..., include_persona=False).
+        """
+        
+        comedian_name = comedian_persona.get('name', 'Comedian')
+        return f"""
+ADVANCED COMEDY REASONING SYSTEM WITH PERSONALITY INJECTION
+
+PERSONA: {comedian_name} - {comedian_persona.get('tone', 'neutral')} comedian
+STYLE: {style}
+
+{self._get_personality_boost(comedian_name)}
+⚠️ CRITICAL: RESPOND ONLY IN ENGLISH. BE GENUINELY FUNNY, NOT JUST TRYING TO BE FUNNY.
+"""
+
     def generate_comedy_prompt(self, topic: str, style: str, comedian_persona: Dict, 
-                              tv_meme_context: Dict = None, adaptive_system=None) -> str:
-        """Generate an advanced prompt for joke creation with TV/meme context, strong personality, and adaptive learning"""
+                              tv_meme_context: Dict = None, adaptive_system=None,
+                              include_persona: bool = True) -> str:
+        """Generate an advanced prompt for joke creation with TV/meme context, strong personality, and adaptive learning
+        
+        With include_persona=False the static persona preamble (see get_persona_preamble)
+        is left out, because it is already the system prompt of the client session.
+        """
         
         # Select appropriate technique
         techniques = list(self.comedy_techniques.keys())
@@ -313,60 +376,21 @@ class ComedyTools:
 💡 USE THIS CONTEXT TO MAKE TIMELY, EDGY, RELEVANT JOKES ABOUT WHAT'S HAPPENING NOW!
 """
         
-        # Enhanced personality traits based on comedian
-        personality_boost = ""
         comedian_name = comedian_persona.get('name', 'Comedian')
         
-        if 'Dave' in comedian_name:
-            personality_boost = """
-  DAVE PERSONALITY AMPLIFIER:
-- Be EDGY and push boundaries (but stay clever)
-- Use unexpected perspectives that shock then make people think
-- Reference personal experiences with a dark twist
-- Master of the unexpected callback and misdirection
-- Don't just observe - JUDGE and be brutally honest about human nature
-"""
-        elif 'Sarah' in comedian_name:
-            personality_boost = """
-  SARAH PERSONALITY AMPLIFIER:
-- Be RAZOR SHARP with wit - cut through BS instantly  
-- Use self-deprecating humor but from a position of strength
-- Master of one-liners that hit like a slap
-- Reference dating, relationships, patriarchy and modern life with brutal honesty
-- Don't just make jokes - make POINTS about society
-"""
-        elif 'Mike' in comedian_name:
-            personality_boost = """
-  MIKE PERSONALITY AMPLIFIER:
-- Be the EVERYMAN but with surprising depth
-- Find the absurd in the mundane with perfect timing
-- Master of building tension then releasing it unexpectedly
-- Connect with the audience like you're talking to friends at a bar
-"""
-        elif 'Lisa' in comedian_name:
-            personality_boost = """
-  LISA PERSONALITY AMPLIFIER:
-- Be INTELLECTUALLY TWISTED - smart humor with dark edges
-- Use scientific/academic references in unexpected ways
-- Master of wordplay and linguistic manipulation
-- Find humor in things others find disturbing or weird
-- Don't explain the joke - let smart people get it
-"""
-        
         # Adaptive learning feedback section
         adaptive_feedback = ""
-        if adaptive_system and hasattr(adaptive_system, 'get_enhanced_prompt'):
-            # Use the adaptive system to get personalized feedback
-            base_for_feedback = f"You are {comedian_name}, performing {style} comedy about {topic}."
-            enhanced = adaptive_system.get_enhanced_prompt(comedian_name, base_for_feedback, adaptive_system.rating_system if hasattr(adaptive_system, 'rating_system') else None)
-            if enhanced != base_for_feedback:
+        if adaptive_system and hasattr(adaptive_system, 'get_adaptive_fragment'):
+            # Personalized feedback, cached per comedian until new ratings arrive
+            fragment = adaptive_system.get_adaptive_fragment(comedian_name, getattr(adaptive_system, 'rating_system', None))
+            if fragment:
                 adaptive_feedback = f"""
     AUDIENCE FEEDBACK & LEARNING:
-{enhanced.replace(base_for_feedback, '').strip()}
+{fragment}
 """
 
-        # Build advanced prompt with personality boost
-        prompt = f"""
+        if include_persona:
+            header = f"""
 ADVANCED COMEDY REASONING SYSTEM WITH PERSONALITY INJECTION
 
 PERSONA: {comedian_name} - {comedian_persona.get('tone', 'neutral')} comedian
@@ -374,8 +398,16 @@ STYLE: {style}
 TECHNIQUE: {chosen_technique} - {self.comedy_techniques[chosen_technique]}
 TOPIC: {topic}
 
-{personality_boost}
+{self._get_personality_boost(comedian_name)}
+"""
+        else:
+            header = f"""
+TECHNIQUE: {chosen_technique} - {self.comedy_techniques[chosen_technique]}
+TOPIC: {topic}
+"""
 
+        # Build advanced prompt with personality boost
+        prompt = f"""{header}
 {context_section}
 
 {adaptive_feedback}
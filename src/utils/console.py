@@ -0,0 +1,41 @@
+"""
+Output su console della pipeline delle battute, silenziabile per singola generazione
+(es. le battute preparate in background dal pool)
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+# Generazione silenziosa nel contesto corrente (ogni thread parte da un contesto normale)
+_quiet = contextvars.ContextVar("comedy_quiet_output", default=False)
+
+
+@contextmanager
+def quiet_output(enabled: bool = True):
+    """Silenzia log() nel contesto corrente (e nei task/thread che ne copiano il contesto)"""
+    token = _quiet.set(enabled)
+    try:
+        yield
+    finally:
+        _quiet.reset(token)
+
+
+def is_quiet() -> bool:
+    return _quiet.get()
+
+
+def log(*args, **kwargs):
+    """print() che tace durante le generazioni silenziose"""
+    if not _quiet.get():
+        print(*args, **kwargs)
+
+
+def bind_quiet(fn):
+    """fn da eseguire in un altro thread (executor) con lo stato silenzioso del chiamante"""
+    if not _quiet.get():
+        return fn
+
+    def run(*args, **kwargs):
+        with quiet_output():
+            return fn(*args, **kwargs)
+    return run
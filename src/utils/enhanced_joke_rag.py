@@ -9,6 +9,9 @@ import os
 import threading
 from typing import List, Dict, Optional
 
+from src.utils.console import log
+from src.utils.tracing import span
+
 class EnhancedJokeRAG:
     """Sistema RAG per recupero intelligente di jokes con ricerca web"""
     
@@ -72,21 +75,23 @@ class EnhancedJokeRAG:
         tv_meme_context = {}
         
         if use_web_search:
-            if enhanced_tv_search:
-                # Use specialized TV/meme search
-                tv_meme_context = self.search_tv_and_meme_context(topic)
-                # Combine all contexts for web_context
-                all_contexts = []
-                for context_type, content in tv_meme_context.items():
-                    if content:
-                        all_contexts.append(f"{context_type.upper()}: {content}")
-                web_context = " | ".join(all_contexts)
-            else:
-                # Use general web search
-                web_context = self._search_current_context(topic)
+            with span("rag.web_search", topic=topic, tv=enhanced_tv_search):
+                if enhanced_tv_search:
+                    # Use specialized TV/meme search
+                    tv_meme_context = self.search_tv_and_meme_context(topic)
+                    # Combine all contexts for web_context
+                    all_contexts = []
+                    for context_type, content in tv_meme_context.items():
+                        if content:
+                            all_contexts.append(f"{context_type.upper()}: {content}")
+                    web_context = " | ".join(all_contexts)
+                else:
+                    # Use general web search
+                    web_context = self._search_current_context(topic)
         
         # Crea query migliorata personalizzata per il comico
-        enhanced_query = self._create_personalized_query(humor_style, topic, web_context, comedian_name)
+        with span("rag.query"):
+            enhanced_query = self._create_personalized_query(humor_style, topic, web_context, comedian_name)
         
         # Recupera jokes rilevanti con filtri per personalità
         relevant_jokes = self._personality_filtered_search(enhanced_query, top_k, comedian_name)
@@ -111,7 +116,7 @@ class EnhancedJokeRAG:
         with self._search_lock:
             current_time = time.time()
             if current_time - self._last_search_time < 1.0:  # Minimo 1 secondo tra ricerche
-                print("Rate limiting: aspetto prima della prossima ricerca...")
+                log("Rate limiting: aspetto prima della prossima ricerca...")
                 time.sleep(1.0)
             self._last_search_time = time.time()
         
@@ -141,20 +146,20 @@ class EnhancedJokeRAG:
                             all_context_snippets.append(snippet)
                             
                 except Exception as e:
-                    print(f"Search query failed: {query} - {e}")
+                    log(f"Search query failed: {query} - {e}")
                     continue
                 
             # Limit total context length
             web_context = " | ".join(all_context_snippets[:6])  # Max 6 snippets
             self.search_cache[cache_key] = web_context
-            print(f"🌐 Enhanced context retrieved for '{topic}': {len(web_context)} chars")
+            log(f"🌐 Enhanced context retrieved for '{topic}': {len(web_context)} chars")
             return web_context
                 
         except ImportError:
-            print("duckduckgo-search not installed. Run: pip install duckduckgo-search")
+            log("duckduckgo-search not installed. Run: pip install duckduckgo-search")
             return ""
         except Exception as e:
-            print(f"Web search failed: {e}")
+            log(f"Web search failed: {e}")
             return ""
     
     def search_tv_and_meme_context(self, topic: str) -> Dict[str, str]:
@@ -164,7 +169,7 @@ class EnhancedJokeRAG:
         with self._search_lock:
             current_time = time.time()
             if current_time - self._last_search_time < 1.0:  # Minimo 1 secondo tra ricerche
-                print("Rate limiting: aspetto prima della prossima ricerca...")
+                log("Rate limiting: aspetto prima della prossima ricerca...")
                 time.sleep(1.0)
             self._last_search_time = time.time()
         
@@ -209,21 +214,21 @@ class EnhancedJokeRAG:
                         contexts[context_type] = " | ".join(snippets)
                         
                 except Exception as e:
-                    print(f"Failed to search {context_type}: {e}")
+                    log(f"Failed to search {context_type}: {e}")
                     continue
             
             # Print what we found for debugging
             found_contexts = [k for k, v in contexts.items() if v]
             if found_contexts:
-                print(f"🔍 Found context types: {', '.join(found_contexts)}")
+                log(f"🔍 Found context types: {', '.join(found_contexts)}")
             
             return contexts
             
         except ImportError:
-            print("duckduckgo-search not installed")
+            log("duckduckgo-search not installed")
             return {}
         except Exception as e:
-            print(f"TV/Meme search failed: {e}")
+            log(f"TV/Meme search failed: {e}")
             return {}
     
     def _create_enhanced_query(self, humor_style: str, topic: str, web_context: str) -> str:
@@ -251,10 +256,11 @@ class EnhancedJokeRAG:
         try:
             from sklearn.metrics.pairwise import cosine_similarity
         except ImportError:
-            print("⚠️ scikit-learn non disponibile. Installa: pip install scikit-learn")
+            log("⚠️ scikit-learn non disponibile. Installa: pip install scikit-learn")
             return []
         
-        query_embedding = self.model.encode([query])
+        with span("rag.embedding"):
+            query_embedding = self.model.encode([query])
         
         all_jokes = []
         all_embeddings = []
@@ -269,8 +275,9 @@ class EnhancedJokeRAG:
             return []
         
         # Calcola similarità
-        similarities = cosine_similarity(query_embedding, all_embeddings)[0]
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        with span("rag.similarity", candidates=len(all_embeddings)):
+            similarities = cosine_similarity(query_embedding, all_embeddings)[0]
+            top_indices = np.argsort(similarities)[-top_k:][::-1]
         
         # Restituisci dizionari con la struttura attesa
         selected_jokes = []
@@ -281,7 +288,7 @@ class EnhancedJokeRAG:
                 'similarity': float(similarities[i])
             })
             
-        print(f"🎯 Trovati {len(selected_jokes)} jokes rilevanti")
+        log(f"🎯 Trovati {len(selected_jokes)} jokes rilevanti")
         return selected_jokes
 
     def _create_personalized_query(self, humor_style: str, topic: str, web_context: str, comedian_name: str = None) -> str:
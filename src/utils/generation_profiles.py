@@ -0,0 +1,112 @@
+"""
+Generation Profiles: budget di token e stop sequence per tipo di prompt,
+con budget appresi dalle lunghezze osservate nei log di feedback
+"""
+
+import math
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+# Stima grossolana token/parola per l'inglese con il tokenizer di llama3
+TOKENS_PER_WORD = 1.3
+
+# Stop sequence sicure: scattano solo dopo una riga vuota, quando il modello passa
+# dalla battuta a spiegazioni, note o varianti (setup e punchline su righe diverse restano)
+JOKE_STOP = ["\n\nExplanation", "\n\nNote:", "\n\n(Note", "\n\nThis joke"]
+DEBATE_STOP = ["\n\nExplanation", "\n\nNote:", "\n\n(Note", "\n\n---"]
+
+
+@dataclass
+class GenerationProfile:
+    """Parametri di generazione per un tipo di prompt"""
+    name: str
+    max_tokens: int
+    stop: List[str] = field(default_factory=list)
+    min_tokens: int = 32  # limite inferiore del budget appreso
+    learned_from: int = 0  # campioni usati per il budget (0 = valore di default)
+
+
+DEFAULT_PROFILES = {
+    "rag_joke": GenerationProfile("rag_joke", max_tokens=200, stop=JOKE_STOP, min_tokens=48),
+    "fallback_joke": GenerationProfile("fallback_joke", max_tokens=80, stop=JOKE_STOP, min_tokens=40),
+    "refusal_retry": GenerationProfile("refusal_retry", max_tokens=200, stop=JOKE_STOP, min_tokens=48),
+    "debate": GenerationProfile("debate", max_tokens=100, stop=DEBATE_STOP, min_tokens=40),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima dei token di un testo dal numero di parole"""
+    return math.ceil(len(text.split()) * TOKENS_PER_WORD)
+
+
+def _field(entry, name):
+    """Campo di un record di log, sia dict (JSON) sia dataclass (HumanRating)"""
+    return entry.get(name) if isinstance(entry, dict) else getattr(entry, name, None)
+
+
+class GenerationProfiles:
+    """Profili di generazione con budget appresi dalle lunghezze delle risposte passate
+
+    Il budget appreso è il p95 delle lunghezze osservate più un margine, compreso tra
+    min_tokens e il default del profilo: si taglia la coda delle divagazioni senza
+    troncare le battute buone. Senza abbastanza campioni restano i default.
+    """
+
+    def __init__(self, min_samples: int = 20, percentile: float = 95.0, margin: float = 1.25):
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.margin = margin
+        self.profiles: Dict[str, GenerationProfile] = {
+            name: replace(profile, stop=list(profile.stop)) for name, profile in DEFAULT_PROFILES.items()
+        }
+
+    @classmethod
+    def from_history(cls, feedback_history: Optional[List[Dict]] = None,
+                     ratings: Optional[List] = None, **kwargs) -> "GenerationProfiles":
+        """Crea i profili imparando i budget da feedback (battute) e rating umani (battute e risposte)"""
+        profiles = cls(**kwargs)
+
+        joke_lengths, debate_lengths = [], []
+        for entry in feedback_history or []:
+            if _field(entry, "joke"):
+                joke_lengths.append(estimate_tokens(_field(entry, "joke")))
+        for rating in ratings or []:
+            text = _field(rating, "joke") or ""
+            # Nei rating il testo può avere il prefisso "Comico: "
+            if text.startswith(f"{_field(rating, 'comedian')}:"):
+                text = text.split(":", 1)[1]
+            if not text.strip():
+                continue
+            if (_field(rating, "context") or {}).get("is_response"):
+                debate_lengths.append(estimate_tokens(text))
+            else:
+                joke_lengths.append(estimate_tokens(text))
+
+        for name in ("rag_joke", "fallback_joke", "refusal_retry"):
+            profiles.learn(name, joke_lengths)
+        profiles.learn("debate", debate_lengths)
+        return profiles
+
+    def learn(self, name: str, lengths: List[int]):
+        """Aggiorna il budget del profilo dalle lunghezze osservate (in token)"""
+        if len(lengths) < self.min_samples:
+            return
+        default = DEFAULT_PROFILES[name]
+        ordered = sorted(lengths)
+        index = min(len(ordered) - 1, max(0, math.ceil(self.percentile / 100.0 * len(ordered)) - 1))
+        budget = math.ceil(ordered[index] * self.margin)
+        profile = self.profiles[name]
+        profile.max_tokens = max(default.min_tokens, min(default.max_tokens, budget))
+        profile.learned_from = len(lengths)
+
+    def get(self, name: str) -> GenerationProfile:
+        """Profilo per tipo di prompt (default di rag_joke per tipi sconosciuti)"""
+        return self.profiles.get(name) or self.profiles["rag_joke"]
+
+    def describe(self) -> List[str]:
+        lines = []
+        for profile in self.profiles.values():
+            source = f"appreso da {profile.learned_from} risposte" if profile.learned_from else "default"
+            lines.append(f"{profile.name}: max_tokens {profile.max_tokens} ({source}), "
+                         f"{len(profile.stop)} stop sequence")
+        return lines
@@ -2,11 +2,15 @@
 Human Rating System: Sistema di rating umano per battute con apprendimento
 """
 
-import json
+import heapq
+import itertools
+import threading
 import time
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import Callable, List, Dict, Any, Optional
 from dataclasses import dataclass, asdict
-import os
+
+from src.utils.storage import RetentionPolicy, archive_records, atomic_write_json, load_json_document
 
 @dataclass
 class HumanRating:
@@ -22,58 +26,170 @@ class HumanRating:
 
 @dataclass
 class LearningPattern:
-    """Pattern appreso dai rating umani"""
+    """Pattern appreso dai rating umani
+
+    Elementi e topic sono contatori (elemento -> occorrenze): l'aggiornamento è O(1) e la
+    frequenza pesa cosa conta di più; a parità di conteggio vale l'ordine di comparsa.
+    Serializzati come dizionari compatti; i vecchi file con liste vengono convertiti.
+    """
     comedian: str
-    successful_elements: List[str]  # Elementi che funzionano
-    failed_elements: List[str]      # Elementi che non funzionano
-    preferred_topics: List[str]
+    successful_elements: Dict[str, int]  # Elementi che funzionano
+    failed_elements: Dict[str, int]      # Elementi che non funzionano
+    preferred_topics: Dict[str, int]
     avg_rating: float
     total_ratings: int
     last_updated: float
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LearningPattern':
+        data = dict(data)
+        for name in ('successful_elements', 'failed_elements', 'preferred_topics'):
+            value = data.get(name) or {}
+            data[name] = dict(value) if isinstance(value, dict) else {item: 1 for item in value}
+        return cls(**data)
+    
+    @staticmethod
+    def _top(counts: Dict[str, int], limit: Optional[int]) -> List[str]:
+        ranked = sorted(counts, key=counts.get, reverse=True)  # stabile: a parità, ordine di comparsa
+        return ranked if limit is None else ranked[:limit]
+    
+    def top_successful(self, limit: Optional[int] = None) -> List[str]:
+        return self._top(self.successful_elements, limit)
+    
+    def top_failed(self, limit: Optional[int] = None) -> List[str]:
+        return self._top(self.failed_elements, limit)
+    
+    def top_topics(self, limit: Optional[int] = None) -> List[str]:
+        return self._top(self.preferred_topics, limit)
+
+@dataclass
+class RatingTotals:
+    """Conteggio e somma dei punteggi, aggiornati a ogni rating"""
+    count: int = 0
+    score_sum: float = 0.0
+    
+    def add(self, score: float):
+        self.count += 1
+        self.score_sum += score
+    
+    @property
+    def avg(self) -> float:
+        return self.score_sum / self.count if self.count else 0.0
 
 class HumanRatingSystem:
     """Sistema per raccogliere e analizzare rating umani delle battute"""
     
-    def __init__(self, data_file: str = "logs/human_ratings.json"):
+    def __init__(self, data_file: str = "logs/human_ratings.json", storage=None, writer=None,
+                 retention: Optional[RetentionPolicy] = RetentionPolicy(max_records=5000),
+                 recent_capacity: int = 100, top_k: int = 5):
+        """
+        Args:
+            data_file: file JSON con rating e pattern
+            storage: ComedyDB SQLite al posto del file JSON (un INSERT per rating)
+            writer: WriteBehindWriter per salvare in background (None = salvataggio sincrono);
+                    i salvataggi del file JSON ancora in coda si fondono in uno
+            retention: limiti del file JSON; i rating più vecchi vanno in archivio JSONL
+                       (i pattern appresi restano), None = nessun limite
+            recent_capacity: rating tenuti nel buffer circolare dei più recenti
+            top_k: migliori battute indicizzate per comico
+        """
         self.data_file = data_file
+        self.recent_capacity = recent_capacity
+        self.top_k = top_k
+        self.storage = storage
+        self.writer = writer
+        self.retention = retention
+        self._lock = threading.RLock()  # add_rating (es. thread Tk) e salvataggi del writer
         self.ratings: List[HumanRating] = []
         self.patterns: Dict[str, LearningPattern] = {}
+        self._listeners: List[Callable[[HumanRating], None]] = []
+        # Versione dei pattern per comico: cresce sempre, anche quando la retention riduce i totali
+        self._versions: Dict[str, int] = {}
         self.load_data()
     
     def load_data(self):
         """Carica dati esistenti"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
+            if self.storage:
+                self.ratings = [HumanRating(**rating) for rating in self.storage.load_ratings()]
+                self.patterns = {
+                    comedian: LearningPattern.from_dict(pattern_data)
+                    for comedian, pattern_data in self.storage.load_learning_patterns().items()
+                }
+            else:
+                data = load_json_document(self.data_file) or {}
+                
                 self.ratings = [HumanRating(**rating) for rating in data.get('ratings', [])]
                 
                 patterns_data = data.get('patterns', {})
                 self.patterns = {
-                    comedian: LearningPattern(**pattern_data)
+                    comedian: LearningPattern.from_dict(pattern_data)
                     for comedian, pattern_data in patterns_data.items()
                 }
         except Exception as e:
             print(f"⚠️ Errore caricamento dati rating: {e}")
             self.ratings = []
             self.patterns = {}
+        with self._lock:
+            self._rebuild_totals()
+            for comedian in set(self._versions) | set(self.patterns):
+                self._versions[comedian] = self._versions.get(comedian, 0) + 1
+    
+    def _rebuild_totals(self):
+        """Ricalcola totali, buffer dei recenti e top-k per comico dai rating caricati"""
+        self.global_totals = RatingTotals()
+        self.comedian_totals: Dict[str, RatingTotals] = {}
+        self.recent: deque = deque(maxlen=self.recent_capacity)
+        # Min-heap di (punteggio, timestamp, seq, rating) limitati a top_k: la radice è la prima a uscire
+        self.top_ratings: Dict[str, List[tuple]] = {}
+        self._seq = itertools.count()
+        for rating in sorted(self.ratings, key=lambda r: r.timestamp):
+            self._count_rating(rating)
+    
+    def _count_rating(self, rating: HumanRating):
+        self.global_totals.add(rating.rating_score)
+        if rating.comedian not in self.comedian_totals:
+            self.comedian_totals[rating.comedian] = RatingTotals()
+        self.comedian_totals[rating.comedian].add(rating.rating_score)
+        
+        self.recent.append(rating)
+        entry = (rating.rating_score, rating.timestamp, next(self._seq), rating)
+        heap = self.top_ratings.setdefault(rating.comedian, [])
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
     
     def save_data(self):
         """Salva i dati su file"""
         try:
-            os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+            if self.storage:
+                with self._lock:
+                    patterns = {comedian: asdict(pattern) for comedian, pattern in self.patterns.items()}
+                self.storage.save_learning_patterns(patterns)
+                return
             
-            data = {
-                'ratings': [asdict(rating) for rating in self.ratings],
-                'patterns': {
-                    comedian: asdict(pattern)
-                    for comedian, pattern in self.patterns.items()
+            # Fotografia coerente dei dati; la scrittura avviene fuori dal lock
+            with self._lock:
+                records, expired = [asdict(rating) for rating in self.ratings], []
+                if self.retention:
+                    records, expired = self.retention.split(records)
+                if expired:
+                    # Totali, recenti e top-k devono contare solo i rating rimasti nel file
+                    self.ratings = self.ratings[len(expired):]
+                    self._rebuild_totals()
+                data = {
+                    'ratings': records,
+                    'patterns': {
+                        comedian: asdict(pattern)
+                        for comedian, pattern in self.patterns.items()
+                    }
                 }
-            }
             
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            if expired:
+                archive = archive_records(self.data_file, expired, self.retention.keep_archives)
+                print(f"🗜️ {len(expired)} rating archiviati in {archive}")
+            atomic_write_json(self.data_file, data)
                 
         except Exception as e:
             print(f"⚠️ Errore salvataggio dati rating: {e}")
@@ -105,12 +221,52 @@ class HumanRatingSystem:
             context=context or {}
         )
         
-        self.ratings.append(new_rating)
-        self.update_learning_patterns(new_rating)
-        self.save_data()
+        with self._lock:
+            self.ratings.append(new_rating)
+            self.update_learning_patterns(new_rating)
+            self._count_rating(new_rating)
+            # Dopo i pattern: chi legge la nuova versione vede anche i pattern aggiornati
+            self._versions[comedian] = self._versions.get(comedian, 0) + 1
+            if self.storage:
+                # Solo il nuovo rating e il pattern del comico, nella stessa transazione
+                record, pattern = asdict(new_rating), asdict(self.patterns[comedian])
+        
+        if self.storage:
+            task, key = (lambda: self._persist_rating(record, pattern)), None
+        else:
+            task, key = self.save_data, ("ratings", self.data_file)
+        if self.writer:
+            self.writer.submit(task, key=key)
+        else:
+            task()
+        
+        for listener in list(self._listeners):
+            try:
+                listener(new_rating)
+            except Exception as e:
+                print(f"⚠️ Errore listener rating: {e}")
         
         return True
     
+    def add_listener(self, listener: Callable[[HumanRating], None]):
+        """Registra una callback chiamata con ogni nuovo rating (dopo l'aggiornamento dei pattern)"""
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[HumanRating], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def _persist_rating(self, record: Dict, pattern: Dict):
+        try:
+            self.storage.add_rating(record, pattern)
+        except Exception as e:
+            print(f"⚠️ Errore salvataggio dati rating: {e}")
+    
+    def flush(self):
+        """Attende che i salvataggi in background siano su disco"""
+        if self.writer:
+            self.writer.flush()
+    
     def update_learning_patterns(self, rating: HumanRating):
         """Aggiorna i pattern di apprendimento basati sul nuovo rating"""
         
@@ -119,9 +275,9 @@ class HumanRatingSystem:
         if comedian not in self.patterns:
             self.patterns[comedian] = LearningPattern(
                 comedian=comedian,
-                successful_elements=[],
-                failed_elements=[],
-                preferred_topics=[],
+                successful_elements={},
+                failed_elements={},
+                preferred_topics={},
                 avg_rating=0.0,
                 total_ratings=0,
                 last_updated=time.time()
@@ -139,20 +295,17 @@ class HumanRatingSystem:
         joke_elements = self.extract_joke_features(rating.joke)
         
         if rating.rating_score >= 1.0:  # Like o Love
-            # Aggiungi elementi di successo
+            # Conta elementi di successo
             for element in joke_elements:
-                if element not in pattern.successful_elements:
-                    pattern.successful_elements.append(element)
+                pattern.successful_elements[element] = pattern.successful_elements.get(element, 0) + 1
             
-            # Aggiungi topic preferito
-            if rating.topic not in pattern.preferred_topics:
-                pattern.preferred_topics.append(rating.topic)
+            # Conta topic preferito
+            pattern.preferred_topics[rating.topic] = pattern.preferred_topics.get(rating.topic, 0) + 1
                 
         elif rating.rating_score <= -1.0:  # Dislike o Hate
-            # Aggiungi elementi fallimentari
+            # Conta elementi fallimentari
             for element in joke_elements:
-                if element not in pattern.failed_elements:
-                    pattern.failed_elements.append(element)
+                pattern.failed_elements[element] = pattern.failed_elements.get(element, 0) + 1
     
     def extract_joke_features(self, joke: str) -> List[str]:
         """Estrae caratteristiche dalla battuta per l'apprendimento"""
@@ -204,26 +357,26 @@ class HumanRatingSystem:
         suggestions = {
             'avg_rating': pattern.avg_rating,
             'total_ratings': pattern.total_ratings,
-            'successful_elements': pattern.successful_elements[:5],  # Top 5
-            'failed_elements': pattern.failed_elements[:5],
-            'preferred_topics': pattern.preferred_topics[:3],
+            'successful_elements': pattern.top_successful(5),  # Top 5
+            'failed_elements': pattern.top_failed(5),
+            'preferred_topics': pattern.top_topics(3),
             'recommendations': []
         }
         
         # Genera raccomandazioni
         if pattern.avg_rating < 0:
             suggestions['recommendations'].append(
-                f"⚠️ Performance sotto la media. Evita: {', '.join(pattern.failed_elements[:3])}"
+                f"⚠️ Performance sotto la media. Evita: {', '.join(pattern.top_failed(3))}"
             )
         
         if pattern.successful_elements:
             suggestions['recommendations'].append(
-                f"✅ Continua a usare: {', '.join(pattern.successful_elements[:3])}"
+                f"✅ Continua a usare: {', '.join(pattern.top_successful(3))}"
             )
         
         if pattern.preferred_topics:
             suggestions['recommendations'].append(
-                f"🎯 Topic di successo: {', '.join(pattern.preferred_topics)}"
+                f"🎯 Topic di successo: {', '.join(pattern.top_topics())}"
             )
         
         return suggestions
@@ -234,29 +387,37 @@ class HumanRatingSystem:
         if not self.ratings:
             return {'total_ratings': 0}
         
-        # Calcola statistiche per comico
-        comedian_stats = {}
-        for rating in self.ratings:
-            if rating.comedian not in comedian_stats:
-                comedian_stats[rating.comedian] = {'ratings': [], 'avg': 0}
-            comedian_stats[rating.comedian]['ratings'].append(rating.rating_score)
-        
-        for comedian in comedian_stats:
-            ratings = comedian_stats[comedian]['ratings']
-            comedian_stats[comedian]['avg'] = sum(ratings) / len(ratings)
-            comedian_stats[comedian]['count'] = len(ratings)
+        # Totali mantenuti a ogni rating: costo indipendente dallo storico
+        comedian_stats = {
+            comedian: {'avg': totals.avg, 'count': totals.count}
+            for comedian, totals in self.comedian_totals.items()
+        }
         
         # Top performer
         best_comedian = max(comedian_stats.keys(), 
                           key=lambda c: comedian_stats[c]['avg']) if comedian_stats else None
         
         return {
-            'total_ratings': len(self.ratings),
+            'total_ratings': self.global_totals.count,
             'comedian_stats': comedian_stats,
             'best_performer': best_comedian,
-            'avg_global_rating': sum(r.rating_score for r in self.ratings) / len(self.ratings)
+            'avg_global_rating': self.global_totals.avg
         }
     
+    def rating_version(self, comedian: str) -> int:
+        """Cambia a ogni nuovo rating del comico: chiave per le cache derivate dai suoi pattern"""
+        return self._versions.get(comedian, 0)
+    
     def get_recent_ratings(self, limit: int = 10) -> List[HumanRating]:
-        """Ottieni i rating più recenti"""
-        return sorted(self.ratings, key=lambda r: r.timestamp, reverse=True)[:limit]
+        """Ottieni i rating più recenti (dal buffer circolare, senza ordinare lo storico)"""
+        with self._lock:
+            if limit <= len(self.recent) or len(self.recent) == len(self.ratings):
+                return list(itertools.islice(reversed(self.recent), limit))
+            # Oltre la capacità del buffer: selezione parziale invece dell'ordinamento completo
+            return heapq.nlargest(limit, self.ratings, key=lambda r: r.timestamp)
+    
+    def get_top_ratings(self, comedian: str, limit: Optional[int] = None) -> List[HumanRating]:
+        """Le battute più apprezzate di un comico (a parità di voto la più recente), al massimo top_k"""
+        with self._lock:
+            heap = self.top_ratings.get(comedian, [])
+            return [entry[-1] for entry in heapq.nlargest(limit or self.top_k, heap)]
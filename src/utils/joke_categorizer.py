@@ -5,10 +5,14 @@ Categorizes jokes from shortjokes.csv into different humor styles for agent trai
 
 import pandas as pd
 import re
-import json
+import os
+import sys
 from typing import Dict, List, Tuple
 import random
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.utils.storage import atomic_write_json
+
 class JokeCategorizer:
     def __init__(self, csv_file: str):
         print(f"Loading jokes from {csv_file}...")
@@ -127,8 +131,7 @@ class JokeCategorizer:
             'jokes': balanced
         }
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        atomic_write_json(output_file, result, backup=False)
         
         print(f"✅ Categorized jokes saved to {output_file}")
         print(f"📊 Categories distribution:")
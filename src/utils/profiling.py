@@ -0,0 +1,199 @@
+"""
+Profiling campionato per spettacoli reali: una battuta ogni N viene profilata con
+cProfile o con un campionatore statistico, e i risultati aggregati vengono salvati
+come stack collassati (flamegraph.pl, speedscope, inferno) e, con cProfile, come .prof
+"""
+
+import contextvars
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+
+from src.utils.storage import atomic_output, atomic_write_text
+
+MODES = ("sampler", "cprofile")
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame) -> str:
+    """Stack di un frame in formato collassato, dalla radice: "a.py:main;b.py:run;..." """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SampledProfiler:
+    """Profila una battuta ogni `every` e aggrega i risultati dell'intero spettacolo
+
+    - mode "sampler": un thread legge lo stack dei thread con una battuta campionata in
+      corso ogni `interval` secondi (sys._current_frames); overhead trascurabile, stack
+      completi, misura anche l'attesa sulla rete.
+    - mode "cprofile": cProfile deterministico sulla battuta campionata; tempi esatti per
+      funzione (.prof per pstats/snakeviz) ma solo coppie chiamante;chiamato nel .folded.
+
+    Le chiamate annidate (get_joke -> generate_joke) contano come una, anche tra
+    coroutine: la profondità segue il contesto (thread o task asyncio). Sull'event loop
+    il campionatore vede lo stack della coroutine in esecuzione in quel momento e
+    cProfile misura anche le altre coroutine del loop.
+    """
+
+    def __init__(self, every: int = 10, mode: str = "sampler", output: str = "logs/profile",
+                 interval: float = 0.005):
+        """
+        Args:
+            every: profila una battuta ogni `every` (1 = tutte)
+            mode: "sampler" o "cprofile"
+            output: prefisso dei file prodotti (<output>.folded, <output>.prof)
+            interval: periodo di campionamento in secondi (solo mode "sampler")
+        """
+        if mode not in MODES:
+            raise ValueError(f"Modalità di profiling non valida: {mode} (usa {', '.join(MODES)})")
+        self.every = max(1, every)
+        self.mode = mode
+        self.output = output
+        self.interval = interval
+
+        self.calls = 0
+        self.sampled = 0
+        self.samples = 0
+        self._stacks = Counter()  # stack collassato -> campioni
+        self._stats: Optional[pstats.Stats] = None
+        self._active = {}  # token della battuta in corso -> (thread id, etichetta)
+        self._depth = contextvars.ContextVar(f"profiler_depth_{id(self)}", default=0)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._sampler = None
+        self._cprofile_running = False  # cProfile: una battuta profilata alla volta
+
+    @contextmanager
+    def profile(self, label: str = "joke"):
+        """Profila il blocco se è la battuta campionata (ogni `every` chiamate)"""
+        if self._depth.get() or self._closed:
+            yield
+            return
+        with self._lock:
+            self.calls += 1
+            sampled = (self.calls - 1) % self.every == 0
+            if sampled and self.mode == "cprofile":
+                # Un solo profiler deterministico attivo nel processo
+                sampled = not self._cprofile_running
+                self._cprofile_running = sampled
+            if sampled:
+                self.sampled += 1
+
+        depth_token = self._depth.set(1)
+        try:
+            if not sampled:
+                yield
+            elif self.mode == "cprofile":
+                with self._cprofile():
+                    yield
+            else:
+                with self._sample(label):
+                    yield
+        finally:
+            self._depth.reset(depth_token)
+
+    @contextmanager
+    def _cprofile(self):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._cprofile_running = False
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+
+    @contextmanager
+    def _sample(self, label):
+        token = object()
+        with self._lock:
+            self._active[token] = (threading.get_ident(), label)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(token, None)
+
+    def _sample_loop(self):
+        while not self._closed:
+            with self._lock:
+                # Un campione per thread anche con più battute async sullo stesso loop
+                active = {tid: label for tid, label in self._active.values()}
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            stacks = [f"{label};{collapse_stack(frames[tid])}" for tid, label in active.items() if tid in frames]
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += len(stacks)
+            time.sleep(self.interval)
+
+    def folded(self) -> List[str]:
+        """Righe "stack conteggio" aggregate (per cProfile il peso è il tempo proprio in µs)"""
+        with self._lock:
+            if self.mode == "sampler":
+                return [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+            if self._stats is None:
+                return []
+            lines = []
+            for func, (_, _, _, _, callers) in self._stats.stats.items():
+                callee = f"{os.path.basename(func[0])}:{func[2]}"
+                for caller, (_, _, tottime, _) in callers.items():
+                    weight = int(tottime * 1e6)
+                    if weight > 0:
+                        lines.append(f"{os.path.basename(caller[0])}:{caller[2]};{callee} {weight}")
+            return lines
+
+    def dump(self) -> List[str]:
+        """Scrive i risultati aggregati finora; restituisce i file scritti"""
+        written = []
+        lines = self.folded()
+        if not lines:
+            return written
+        folded_path = f"{self.output}.folded"
+        atomic_write_text(folded_path, "\n".join(lines) + "\n")
+        written.append(folded_path)
+        with self._lock:
+            if self._stats is not None:
+                prof_path = f"{self.output}.prof"
+                with atomic_output(prof_path) as tmp_path:
+                    self._stats.dump_stats(tmp_path)
+                written.append(prof_path)
+        return written
+
+    def close(self) -> List[str]:
+        """Ferma il campionatore e scrive i risultati"""
+        self._closed = True
+        self._wake.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1.0)
+        return self.dump()
+
+    def describe(self) -> str:
+        unit = f"{self.samples} campioni" if self.mode == "sampler" else "cProfile"
+        return f"{self.sampled}/{self.calls} battute profilate ({self.mode}, {unit})"
@@ -0,0 +1,402 @@
+"""
+Storage per i log in logs/: scritture atomiche (file temporaneo + rename), file JSONL
+append-only con fsync a lotti, caricamento tollerante a code troncate e file danneggiati,
+compattazione e rotazione per dimensione/età e scritture write-behind in background
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+
+def _ensure_parent(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+@contextmanager
+def atomic_output(path: str):
+    """Percorso temporaneo su cui scrivere; a fine blocco sostituisce `path` con un rename atomico
+
+    Chi legge vede sempre la versione precedente completa o quella nuova completa, mai un
+    file a metà. Se il blocco solleva un'eccezione il file originale resta intatto.
+    """
+    _ensure_parent(path)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        yield tmp_path
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_text(path: str, text: str):
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = 2, backup: bool = True):
+    """Scrive un documento JSON in modo atomico
+
+    Con backup=True la versione precedente resta in `<path>.bak`: se il file principale
+    mancasse o risultasse illeggibile, load_json_document riparte da lì.
+    """
+    text = json.dumps(data, indent=indent, ensure_ascii=False)
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        if backup and os.path.exists(path) and os.path.getsize(path) > 0:
+            # Due rename: un'interruzione tra i due lascia solo il .bak, che il caricamento usa
+            os.replace(path, f"{path}.bak")
+
+
+def _read_json(path: str) -> Any:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_json_document(path: str, expected: type = dict) -> Optional[Any]:
+    """Documento JSON di tipo `expected`, recuperato dalle copie se il file è vuoto o troncato
+
+    Prova nell'ordine il file, la copia `<path>.bak` e i vecchi backup manuali
+    `<nome>_backup*.json` (dal più recente). None se nessuno è leggibile.
+    """
+    stem, ext = os.path.splitext(path)
+    legacy_backups = sorted(glob.glob(f"{glob.escape(stem)}_backup*{ext}"), key=os.path.getmtime, reverse=True)
+    candidates = [path, f"{path}.bak"] + legacy_backups
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+        data = _read_json(candidate)
+        if isinstance(data, expected):
+            if candidate != path:
+                print(f"♻️ {path} illeggibile o vuoto: recuperato da {candidate}")
+            return data
+        if candidate == path and os.path.getsize(path) > 0:
+            print(f"⚠️ {path} danneggiato, cerco una copia valida...")
+    return None
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Limiti di crescita di uno storico; oltre i limiti i record più vecchi vanno in archivio
+
+    Superato un limite lo storico viene compattato a `compact_ratio` del limite, così la
+    compattazione non si ripete a ogni nuovo record. Gli archivi sono file JSONL accanto
+    all'originale (`<nome>.archive-<data>.jsonl`), al massimo `keep_archives`.
+    """
+    max_records: Optional[int] = None
+    max_bytes: Optional[int] = None
+    max_age: Optional[float] = None  # secondi, sul campo "timestamp" dei record
+    keep_archives: int = 3
+    compact_ratio: float = 0.75
+
+    def split(self, records: List[Dict], now: float = None) -> Tuple[List[Dict], List[Dict]]:
+        """(record da tenere, record da archiviare), mantenendo l'ordine dello storico"""
+        start = 0
+        if self.max_age is not None:
+            cutoff = (now or time.time()) - self.max_age
+            while start < len(records) and records[start].get('timestamp', cutoff) < cutoff:
+                start += 1
+        if self.max_records is not None and len(records) - start > self.max_records:
+            start = len(records) - int(self.max_records * self.compact_ratio)
+        if self.max_bytes is not None:
+            sizes = [len(json.dumps(r, ensure_ascii=False).encode('utf-8')) + 1 for r in records[start:]]
+            if sum(sizes) > self.max_bytes:
+                budget, keep = self.max_bytes * self.compact_ratio, 0
+                for size in reversed(sizes):
+                    if budget - size < 0:
+                        break
+                    budget -= size
+                    keep += 1
+                start = len(records) - keep
+        return records[start:], records[:start]
+
+
+def archive_records(path: str, records: List[Dict], keep_archives: int = 3) -> Optional[str]:
+    """Scrive i record in un nuovo archivio JSONL accanto a `path` ed elimina gli archivi in eccesso"""
+    if not records:
+        return None
+    stem = os.path.splitext(path)[0]
+    archive = f"{stem}.archive-{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    suffix = 1
+    while os.path.exists(archive):
+        archive = f"{stem}.archive-{time.strftime('%Y%m%d_%H%M%S')}-{suffix}.jsonl"
+        suffix += 1
+    atomic_write_text(archive, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+    archives = sorted(glob.glob(f"{glob.escape(stem)}.archive-*.jsonl"), key=os.path.getmtime)
+    for old in archives[:max(0, len(archives) - keep_archives)]:
+        os.remove(old)
+    return archive
+
+
+def apply_retention(path: str, records: List[Dict], policy: Optional[RetentionPolicy]) -> List[Dict]:
+    """Archivia i record oltre i limiti della policy e restituisce quelli da tenere"""
+    if policy is None:
+        return records
+    kept, expired = policy.split(records)
+    if expired:
+        archive = archive_records(path, expired, policy.keep_archives)
+        print(f"🗜️ {path}: {len(expired)} record archiviati in {archive}, {len(kept)} mantenuti")
+    return kept
+
+
+class JsonlLog:
+    """Log append-only di record JSON, uno per riga
+
+    append scrive solo la nuova riga (costo indipendente dalla lunghezza dello storico):
+    la riga arriva subito al sistema operativo (flush), mentre l'fsync su disco è fatto
+    a lotti, ogni fsync_every record o fsync_interval secondi. Un'interruzione durante
+    la scrittura lascia al più un'ultima riga troncata, che il caricamento salta.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 20, fsync_interval: float = 2.0):
+        """
+        Args:
+            path: file .jsonl (creato alla prima scrittura)
+            fsync_every: record scritti tra due fsync
+            fsync_interval: secondi massimi tra una scrittura e il suo fsync
+        """
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.skipped_lines = 0  # righe illeggibili incontrate dall'ultimo caricamento
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.RLock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _open(self):
+        if self._file is None:
+            _ensure_parent(self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, record: Dict):
+        """Aggiunge un record in fondo al log"""
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict]):
+        """Aggiunge più record con una sola scrittura"""
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        if not data:
+            return
+        with self._lock:
+            f = self._open()
+            f.write(data)
+            f.flush()
+            self._unsynced += data.count("\n")
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_unlocked()
+
+    def _sync_unlocked(self):
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Forza su disco i record scritti e non ancora sincronizzati"""
+        with self._lock:
+            self._sync_unlocked()
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Legge i record in streaming, saltando le righe illeggibili (es. coda troncata)"""
+        self.skipped_lines = 0
+        if not self.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self.skipped_lines += 1
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    self.skipped_lines += 1
+
+    def load(self) -> List[Dict]:
+        return list(self.iter_records())
+
+    def compact(self, records: Iterable[Dict]):
+        """Riscrive il log con i soli record dati (file temporaneo + rename atomico)"""
+        with self._lock:
+            if self._file is not None:
+                self._sync_unlocked()
+                self._file.close()
+                self._file = None
+            with atomic_output(self.path) as tmp_path:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync_unlocked()
+                self._file.close()
+                self._file = None
+
+
+def migrate_json_array(json_path: str, log: JsonlLog) -> int:
+    """Importa nel log JSONL i record di un file JSON legacy (una lista), se il log non esiste
+
+    Il file legacy resta intatto; restituisce il numero di record importati.
+    """
+    if log.exists():
+        return 0
+    records = load_json_document(json_path, expected=list)
+    if not records:
+        return 0
+    log.compact(record for record in records if isinstance(record, dict))
+    return len(records)
+
+
+class WriteBehindWriter:
+    """Esegue le scritture su disco in un thread in background (write-behind)
+
+    Chi salva accoda una funzione con submit() e torna subito: il thread chiamante (es. il
+    main loop Tk) non tocca mai il disco. Le scritture con la stessa chiave si fondono
+    finché sono in attesa: dieci salvataggi dello stesso file diventano una sola
+    riscrittura. La coda è limitata a max_pending scritture distinte; oltre, submit
+    attende che il worker recuperi. flush() attende lo svuotamento della coda; close()
+    (chiamato anche all'uscita del processo) scrive tutto e ferma il thread, dopodiché
+    submit solleva RuntimeError: una scrittura dopo la chiusura è un errore di ordine di
+    spegnimento, non va eseguita di nascosto nel thread chiamante.
+    """
+
+    def __init__(self, max_pending: int = 1000, name: str = "storage-writer"):
+        """
+        Args:
+            max_pending: scritture distinte in attesa oltre le quali submit si blocca
+            name: nome del thread di scrittura
+        """
+        self.max_pending = max(1, max_pending)
+        self.name = name
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.errors = 0
+        self._pending: "OrderedDict[Hashable, Callable[[], None]]" = OrderedDict()
+        self._sequence = 0  # chiavi uniche per le scritture senza chiave
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        _writers.add(self)
+
+    def submit(self, task: Callable[[], None], key: Hashable = None):
+        """Accoda una scrittura; con una chiave già in attesa sostituisce quella precedente
+
+        Raises:
+            RuntimeError: se il writer è già stato chiuso
+        """
+        with self._cond:
+            while len(self._pending) >= self.max_pending and key not in self._pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError(f"{self.name}: scrittura dopo close()")
+            self.submitted += 1
+            if key is not None and key in self._pending:
+                self._pending[key] = task
+                self.coalesced += 1
+                return
+            if key is None:
+                self._sequence += 1
+                key = ("_unique", self._sequence)
+            self._pending[key] = task
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._busy = True
+                self._cond.notify_all()
+            for task in batch:
+                try:
+                    task()
+                    self.written += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️ Errore scrittura in background: {e}")
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending) + (1 if self._busy else 0)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Attende che tutte le scritture accodate siano eseguite; False se scade il timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Scrive le scritture in attesa e ferma il thread"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def describe(self) -> str:
+        return (f"{self.written} scritture ({self.coalesced} accorpate su {self.submitted} richieste, "
+                f"{self.errors} errori)")
+
+
+_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_writers_at_exit():
+    """Non perde le scritture accodate se il processo termina senza close()"""
+    for writer in list(_writers):
+        writer.close()
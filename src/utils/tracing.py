@@ -0,0 +1,193 @@
+"""
+Tracing leggero a span annidati per le fasi della pipeline delle battute,
+esportabile in formato Chrome trace (chrome://tracing o https://ui.perfetto.dev)
+"""
+
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.utils.storage import atomic_write_json
+
+# Span aperto nel contesto corrente (ogni thread parte da un contesto vuoto)
+_current_span = contextvars.ContextVar("comedy_trace_span", default=None)
+
+
+class _NullSpan:
+    """Restituito da span() a tracing disattivato: nessuna allocazione né misura"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NO_SPAN = _NullSpan()
+
+
+class _Span:
+    """Span in corso; alla chiusura diventa un evento completo ("ph": "X")"""
+
+    __slots__ = ("tracer", "name", "category", "args", "start_ns", "child_ns", "parent", "token")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.child_ns = 0
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        _current_span.reset(self.token)
+        if self.parent is not None:
+            self.parent.child_ns += duration_ns
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._finish(self, duration_ns)
+        return False
+
+    def set(self, **args):
+        """Aggiunge argomenti allo span (es. risultati noti solo alla fine)"""
+        self.args.update(args)
+
+
+class Tracer:
+    """Raccoglie gli span completati di tutti i thread
+
+    Gli span si annidano tramite contextvars; il tempo "self" di uno span esclude quello
+    dei figli, così il riepilogo mostra quale fase domina davvero. Oltre max_events gli
+    span vengono contati ma non conservati.
+    """
+
+    def __init__(self, max_events: int = 200000):
+        self.enabled = False
+        self.max_events = max_events
+        self.dropped = 0
+        self._events: List[Dict] = []
+        self._threads: Dict[int, str] = {}
+        self._stats: Dict[str, List[float]] = {}  # nome -> [conteggio, totale_ns, self_ns, max_ns]
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+            self._threads = {}
+            self._stats = {}
+            self.dropped = 0
+            self._origin_ns = time.perf_counter_ns()
+
+    def span(self, name: str, category: str = "comedy", **args):
+        """Context manager che misura una fase; no-op se il tracing è disattivato"""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, category, args)
+
+    def _finish(self, span: _Span, duration_ns: int):
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start_ns - self._origin_ns) / 1000.0,
+            "dur": duration_ns / 1000.0,
+            "pid": self._pid,
+            "tid": tid,
+            "args": span.args
+        }
+        with self._lock:
+            self._threads.setdefault(tid, thread.name)
+            stats = self._stats.setdefault(span.name, [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += duration_ns
+            stats[2] += duration_ns - span.child_ns
+            stats[3] = max(stats[3], duration_ns)
+            if len(self._events) < self.max_events:
+                self._events.append(event)
+            else:
+                self.dropped += 1
+
+    def export(self, path: str) -> int:
+        """Scrive gli span in formato Chrome trace; restituisce il numero di eventi"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        atomic_write_json(path, {"traceEvents": metadata + events, "displayTimeUnit": "ms"},
+                          indent=None, backup=False)
+        return len(events)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Statistiche per fase in secondi, ordinate per tempo self decrescente"""
+        with self._lock:
+            items = [(name, list(stats)) for name, stats in self._stats.items()]
+        items.sort(key=lambda item: item[1][2], reverse=True)
+        return {
+            name: {
+                "count": count,
+                "total_s": total_ns / 1e9,
+                "self_s": self_ns / 1e9,
+                "mean_s": total_ns / count / 1e9,
+                "max_s": max_ns / 1e9
+            }
+            for name, (count, total_ns, self_ns, max_ns) in items
+        }
+
+    def format_summary(self) -> List[str]:
+        lines = []
+        for name, stats in self.summary().items():
+            lines.append(f"{name}: {stats['count']}x, totale {stats['total_s']:.3f}s, "
+                         f"self {stats['self_s']:.3f}s, media {stats['mean_s'] * 1000:.1f}ms, "
+                         f"max {stats['max_s'] * 1000:.1f}ms")
+        if self.dropped:
+            lines.append(f"({self.dropped} span non conservati oltre il limite di {self.max_events})")
+        return lines
+
+
+# Tracer di processo usato dalla pipeline
+tracer = Tracer()
+
+
+def enable_tracing():
+    """Attiva il tracer di processo (azzerando gli span raccolti finora)"""
+    tracer.clear()
+    tracer.enable()
+    return tracer
+
+
+def span(name: str, category: str = "comedy", **args):
+    """Span sul tracer di processo: `with span("rag.embedding"): ...`"""
+    if not tracer.enabled:
+        return _NO_SPAN
+    return _Span(tracer, name, category, args)
+
+
+def current_span() -> Optional[_Span]:
+    """Span aperto nel contesto corrente, None se nessuno"""
+    return _current_span.get()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Launcher del Comedy Club come servizio HTTP/WebSocket locale
+"""
+
+import argparse
+import contextlib
+import sys
+import os
+
+# Aggiungi src al path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+sys.path.append(os.path.dirname(__file__))
+
+from config.orfeo_config_new import is_orfeo_available
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comedy Club AI - servizio HTTP/WebSocket')
+    parser.add_argument('--host', default='127.0.0.1', help='Indirizzo di ascolto')
+    parser.add_argument('--port', type=int, default=8080, help='Porta di ascolto')
+    parser.add_argument('--offline', action='store_true', help='Disabilita la ricerca web')
+    parser.add_argument('--no-rag', action='store_true', help='Non caricare indice e modello RAG')
+    parser.add_argument('--sessions', action='store_true',
+                        help='Persona come prefisso di sessione riusato da tutte le richieste')
+    parser.add_argument('--candidates', type=int, default=1, help='Candidate per battuta (best-of-n)')
+    parser.add_argument('--cache', choices=['off', 'read_through', 'replay'],
+                        help='Modalità cache risposte LLM')
+    parser.add_argument('--max-inflight', type=int, default=32,
+                        help='Generazioni contemporanee verso Orfeo (le altre attendono)')
+    parser.add_argument('--max-sessions', type=int, default=1000, help='Sessioni aperte al massimo')
+    parser.add_argument('--verbose', action='store_true', help="Mostra l'output di ogni generazione")
+    args = parser.parse_args()
+
+    if not is_orfeo_available() and args.cache != 'replay':
+        print("❌ Configurazione Orfeo non trovata!")
+        print("💡 Esegui prima: source config/set_env.sh")
+        return 1
+
+    try:
+        from src.service.comedy_service import run_service, AIOHTTP_AVAILABLE
+        from src.core.comedy_club_clean import ComedyClub
+    except ImportError as e:
+        print(f"❌ Errore import: {e}")
+        return 1
+    if not AIOHTTP_AVAILABLE:
+        print("❌ Il servizio richiede aiohttp: pip install aiohttp")
+        return 1
+
+    # Un solo club per tutte le sessioni: un modello, un indice, un client Orfeo
+    club = ComedyClub(use_web_search=not args.offline, use_rag=not args.no_rag, cache_mode=args.cache,
+                      num_candidates=args.candidates, use_sessions=args.sessions)
+    print(f"🎭 Comedy Club in servizio su http://{args.host}:{args.port} (Ctrl+C per fermare)")
+    print(f"   WebSocket spettacolo: ws://{args.host}:{args.port}/sessions/<id>/show")
+
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull) if not args.verbose else contextlib.nullcontext():
+        run_service(club, host=args.host, port=args.port, max_inflight=args.max_inflight,
+                    max_sessions=args.max_sessions)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
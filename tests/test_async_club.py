@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test dell'API async contro il server mock locale: AsyncOrfeoClient nativo (candidate,
+streaming, fallback Ollama), aget_joke e arun_show con profiling
+"""
+import sys
+import os
+import asyncio
+import time
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "scripts"))
+
+import pytest
+
+pytest.importorskip("config.orfeo_config_new", reason="configurazione Orfeo locale assente")
+pytest.importorskip("aiohttp")
+
+from mock_orfeo_server import MockOrfeoServer, MockSettings
+from src.core.async_orfeo_client import AsyncOrfeoClient
+from src.core.comedy_club_clean import ComedyClub
+from src.core.orfeo_client_new import OrfeoClient
+from src.utils.profiling import SampledProfiler
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**settings):
+        server = MockOrfeoServer(settings=MockSettings(
+            latency_dist="fixed", latency_ms=settings.pop("latency_ms", 0), tokens_per_sec=0, **settings)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+async def _with_client(llm, coro):
+    try:
+        return await coro
+    finally:
+        await llm.aclose()
+
+
+def test_async_client_candidates_and_stream(mock_server):
+    """Candidate in una richiesta nativa; in streaming il time-to-first-token è misurato"""
+    server = mock_server()
+    client = OrfeoClient(cache_mode="off", config=server.client_config())
+    llm = AsyncOrfeoClient(client)
+    assert llm.native
+
+    candidates = asyncio.run(_with_client(llm, llm.agenerate_candidates("Tell me a joke", n=3)))
+    assert len(candidates) == 3 and server.stats()["requests"] == 1
+
+    client.stream = True
+    text = asyncio.run(_with_client(llm, llm.agenerate("Tell me a joke", max_tokens=20)))
+    record = client.telemetry.recent[-1]
+    assert text and record.ttft_s is not None and record.completion_tokens == len(text.split())
+
+
+def test_async_client_ollama_fallback(mock_server):
+    """Senza chat completions la richiesta passa all'endpoint Ollama e conta un retry"""
+    server = mock_server(disable_chat=True)
+    client = OrfeoClient(cache_mode="off", config=server.client_config())
+    llm = AsyncOrfeoClient(client)
+
+    text = asyncio.run(_with_client(llm, llm.agenerate("Tell me a joke")))
+    record = client.telemetry.recent[-1]
+    assert text and record.endpoint.endswith("/generate") and record.retries == 1
+
+
+def test_arun_show_generates_round_together_and_profiles_each_joke(mock_server, tmp_path, monkeypatch):
+    """I comici di un round generano insieme sull'event loop; ogni battuta profilata una volta"""
+    monkeypatch.chdir(tmp_path)  # feedback scritto in logs/ relativo
+    (tmp_path / "logs").mkdir()
+    server = mock_server(latency_ms=300)
+    profiler = SampledProfiler(every=1, output=str(tmp_path / "profile"), interval=0.01)
+    club = ComedyClub(use_web_search=False, use_rag=False, use_rating=False,
+                      client=OrfeoClient(cache_mode="off", config=server.client_config()), profiler=profiler)
+
+    async def show():
+        try:
+            start = time.perf_counter()
+            await club.arun_show(rounds=1)
+            elapsed = time.perf_counter() - start
+            joke = await club.aget_joke("Dave", "coffee")
+            return elapsed, joke
+        finally:
+            await club.aclose()
+
+    elapsed, joke = asyncio.run(show())
+    comedians = len(club.comedians)
+    assert server.stats()["requests"] == comedians + 1
+    assert elapsed < 0.3 * comedians - 0.3  # non una battuta dopo l'altra
+    assert joke.startswith("Dave: ")
+    # get_joke -> generate_joke annidati contano come una battuta anche tra coroutine
+    assert (profiler.calls, profiler.sampled) == (comedians + 1, comedians + 1)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test della ripresa del batch runner: le chiavi completate vengono saltate, quelle in
+errore o troncate rigenerate
+"""
+import sys
+import os
+import io
+import json
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.batch_runner import BatchRunner, batch_key, load_completed_keys
+
+
+class FakeClub:
+    """Club finto: registra le battute richieste, può fallire per alcuni comici"""
+
+    def __init__(self, failing=()):
+        self.topics = ["coffee", "work"]
+        self.comedians = {"Dave": {}, "Sarah": {}}
+        self.failing = set(failing)
+        self.client = SimpleNamespace()  # senza telemetria
+        self.feedback_system = None
+        self.generated = []
+
+    def generate_joke(self, comedian, topic, enhanced_tv_search=False):
+        if comedian in self.failing:
+            raise RuntimeError("backend non disponibile")
+        self.generated.append(batch_key(1, topic, comedian))
+        return SimpleNamespace(text=f"{comedian} on {topic}", topic=topic, source="generated",
+                               analysis=None, comedian=comedian)
+
+    def _is_ai_refusal(self, text):
+        return False
+
+
+def test_resume_skips_completed_and_retries_errors(tmp_path):
+    """Un secondo lancio genera solo le chiavi fallite; le completate non si ripetono"""
+    output = str(tmp_path / "batch.jsonl")
+    first = BatchRunner(FakeClub(failing={"Sarah"}), output, concurrency=2).run(progress=io.StringIO())
+    assert (first["ok"], first["errors"], first["skipped"]) == (2, 2, 0)
+    assert load_completed_keys(output) == {batch_key(1, "coffee", "Dave"), batch_key(1, "work", "Dave")}
+
+    club = FakeClub()
+    second = BatchRunner(club, output, concurrency=2).run(progress=io.StringIO())
+    assert (second["ok"], second["errors"], second["skipped"]) == (2, 0, 2)
+    assert sorted(club.generated) == [batch_key(1, "coffee", "Sarah"), batch_key(1, "work", "Sarah")]
+    assert len(load_completed_keys(output)) == 4
+
+    third = BatchRunner(FakeClub(), output).run(progress=io.StringIO())
+    assert (third["ok"], third["skipped"]) == (0, 4)
+
+
+def test_resume_after_truncated_line(tmp_path):
+    """Una riga scritta a metà non viene contata e non corrompe la riga aggiunta dopo"""
+    output = tmp_path / "batch.jsonl"
+    done = json.dumps({"key": batch_key(1, "coffee", "Dave"), "error": None})
+    output.write_text(done + "\n" + '{"key": "1|coffee|Sarah", "jo', encoding="utf-8")
+
+    club = FakeClub()
+    BatchRunner(club, str(output), topics=["coffee"]).run(progress=io.StringIO())
+    assert club.generated == [batch_key(1, "coffee", "Sarah")]
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1])["key"] == batch_key(1, "coffee", "Sarah")
+    assert load_completed_keys(str(output)) == {batch_key(1, "coffee", "Dave"), batch_key(1, "coffee", "Sarah")}
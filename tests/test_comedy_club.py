@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test del ComedyClub con un client LLM finto (nessun backend necessario)
+"""
+import sys
+import os
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("config.orfeo_config_new", reason="configurazione Orfeo locale assente")
+
+from src.core.comedy_club_clean import ComedyClub
+from src.utils.human_rating import HumanRatingSystem
+
+REFUSAL = "I'm sorry, but I can't create jokes about that topic."
+
+
+class StubClient:
+    """Client LLM finto: risposte fisse, latenza per comico, registra le richieste ricevute"""
+
+    def __init__(self, responses=None, latencies=None):
+        self.responses = responses or ["Coffee is just anxiety you can drink, and I drink a lot."]
+        self.latencies = latencies or {}  # nome del comico nel prompt -> secondi
+        self.requests = []
+
+    def generate(self, prompt, max_tokens=None, temperature=None, session=None, stop=None):
+        return self.generate_candidates(prompt, n=1, session=session)[0]
+
+    def generate_candidates(self, prompt, n=3, max_tokens=None, temperature=None, session=None, stop=None):
+        self.requests.append({"prompt": prompt, "n": n, "session": session})
+        time.sleep(next((delay for name, delay in self.latencies.items() if f"You are {name}" in prompt), 0))
+        return [self.responses[i % len(self.responses)] for i in range(n)]
+
+
+@pytest.fixture
+def make_club(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # feedback e rating scritti in logs/ relativo
+    (tmp_path / "logs").mkdir()
+    clubs = []
+
+    def make(client=None, **kwargs):
+        club = ComedyClub(use_web_search=False, use_rag=False, use_rating=False,
+                          client=client or StubClient(), **kwargs)
+        clubs.append(club)
+        return club
+
+    yield make
+    for club in clubs:
+        club.close()
+
+
+def test_single_candidate_by_default(make_club):
+    """Di default una battuta costa una sola generazione"""
+    client = StubClient()
+    club = make_club(client)
+    club.get_joke("Dave", "coffee")
+    assert [r["n"] for r in client.requests] == [1]
+
+
+def test_best_candidate_skips_refusals(make_club):
+    """I rifiuti vengono scartati; se sono tutti rifiuti non c'è una battuta scelta"""
+    club = make_club()
+    joke = "My boss said think outside the box, so I quit and now I live in one."
+    best, analysis = club._select_best_candidate([REFUSAL, joke, ""])
+    assert best == joke and analysis is not None
+    assert club._select_best_candidate([REFUSAL, ""]) == (None, None)
+
+
+def test_quiet_generation_prints_nothing(make_club, capsys):
+    """generate_joke(quiet=True) non stampa i messaggi di avanzamento; senza quiet sì"""
+    club = make_club(StubClient(responses=[REFUSAL, "Coffee is just anxiety you can drink."]))
+    capsys.readouterr()
+
+    assert club.generate_joke("Dave", "coffee", quiet=True).text
+    assert capsys.readouterr().out == ""
+    club.generate_joke("Dave", "coffee")
+    assert "Dave" in capsys.readouterr().out
+
+
+def test_round_generates_concurrently_and_presents_in_stage_order(make_club, monkeypatch):
+    """Il round dura quanto il comico più lento; la presentazione segue l'ordine di scena
+    ed è tutta sul thread chiamante"""
+    latencies = {"Dave": 0.4, "Sarah": 0.1, "Mike": 0.3, "Lisa": 0.2}
+    club = make_club(StubClient(latencies=latencies))
+    monkeypatch.setattr(random, "shuffle", lambda order: order.reverse())  # Lisa, Mike, Sarah, Dave
+
+    presented = []
+    present = club._present_joke
+    monkeypatch.setattr(club, "_present_joke", lambda joke: presented.append(
+        (joke.comedian, threading.current_thread() is threading.main_thread())) or present(joke))
+
+    start = time.perf_counter()
+    club._run_rounds(rounds=1, concurrency=4, pause=0.0)
+    wall_time = time.perf_counter() - start
+
+    assert presented == [("Lisa", True), ("Mike", True), ("Sarah", True), ("Dave", True)]
+    assert max(latencies.values()) <= wall_time < sum(latencies.values()) - 0.2
+
+
+class SessionStubClient(StubClient):
+    """StubClient con sessioni persona e API async"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.open_sessions = set()
+
+    def open_session(self, session_id, system_prompt, keep_alive=None):
+        self.open_sessions.add(session_id)
+
+    def close_session(self, session_id):
+        self.open_sessions.discard(session_id)
+
+    async def agenerate_candidates(self, prompt, n=3, max_tokens=None, temperature=None, session=None,
+                                   stop=None):
+        return self.generate_candidates(prompt, n=n, session=session)
+
+
+def test_persona_sessions_outlive_overlapping_show(make_club):
+    """Uno spettacolo async che termina non chiude le sessioni di chi le usa ancora"""
+    client = SessionStubClient()
+    club = make_club(client, use_sessions=True)
+    club._async_client = client
+
+    with club.persona_sessions():  # es. il servizio aperto
+        asyncio.run(club.arun_show(rounds=1))
+        assert club.persona_session("Dave") is not None
+        assert len(client.open_sessions) == len(club.comedians)
+    assert club.persona_session("Dave") is None and not client.open_sessions
+
+
+def test_adaptive_prompts_only_when_enabled(make_club, tmp_path):
+    """Il feedback appreso dai rating entra nei prompt solo con adaptive_prompts=True"""
+    ratings = HumanRatingSystem(str(tmp_path / "human_ratings.json"))
+    ratings.add_rating("Why is coffee so bitter?", "Dave", "coffee", "love")
+    no_rag = SimpleNamespace(retrieve_jokes_with_context=lambda *args, **kwargs: {"jokes": [], "web_context": ""})
+
+    prompts = []
+    for enabled in (False, True):
+        club = make_club(rating_system=ratings, adaptive_prompts=enabled)
+        if club.comedy_tools is None:
+            pytest.skip("ComedyTools non disponibile")
+        club.enhanced_rag = no_rag
+        prompts.append(club._build_rag_prompt("Dave", "coffee", False, None))
+    assert "FEEDBACK DAL PUBBLICO" not in prompts[0]
+    assert "FEEDBACK DAL PUBBLICO" in prompts[1]
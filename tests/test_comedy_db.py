@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test per lo store SQLite di feedback, rating e miglioramenti
+"""
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.comedy_db import ComedyDB
+from src.utils.comedy_feedback import ComedyFeedbackSystem, JokeFeedback
+from src.utils.human_rating import HumanRatingSystem
+from src.utils.adaptive_comedy import AdaptiveComedySystem
+
+
+def test_import_json_logs_is_idempotent(tmp_path):
+    """I log JSON esistenti vengono importati una sola volta"""
+    (tmp_path / "comedy_feedback.jsonl").write_text(
+        json.dumps({"joke": "a", "comedian": "Dave", "topic": "coffee", "quality_score": 0.5,
+                    "audience_score": 0.8, "feedback_notes": ["ok"], "timestamp": 1.0}) + "\n")
+    (tmp_path / "human_ratings.json").write_text(json.dumps({
+        "ratings": [{"joke": "b", "comedian": "Mike", "topic": "work", "rating": "love", "rating_score": 2.0,
+                     "comment": None, "timestamp": 2.0, "context": {}}],
+        "patterns": {"Mike": {"comedian": "Mike", "successful_elements": ["short_joke"], "failed_elements": [],
+                              "preferred_topics": ["work"], "avg_rating": 2.0, "total_ratings": 1,
+                              "last_updated": 2.0}}
+    }))
+    (tmp_path / "comedy_improvements.json").write_text("")  # file vuoto: ignorato
+
+    db = ComedyDB(str(tmp_path / "comedy.db"))
+    assert db.import_json_logs(str(tmp_path)) == {"feedback": 1, "ratings": 1, "improvements": 0}
+    assert db.import_json_logs(str(tmp_path)) == {"feedback": 0, "ratings": 0, "improvements": 0}
+    assert db.load_feedback()[0]["feedback_notes"] == ["ok"]
+
+    ratings = HumanRatingSystem(storage=db)
+    assert ratings.patterns["Mike"].top_topics() == ["work"]  # liste legacy convertite in contatori
+    db.close()
+
+
+def test_systems_on_sqlite_storage(tmp_path):
+    """Feedback, rating e miglioramenti scritti e interrogati tramite il database"""
+    path = str(tmp_path / "comedy.db")
+    db = ComedyDB(path)
+    feedback = ComedyFeedbackSystem(storage=db)
+    for i, (comedian, score) in enumerate([("Dave", 0.9), ("Dave", 0.7), ("Sarah", 0.3)]):
+        feedback.record_feedback(JokeFeedback(joke=f"joke {i}", comedian=comedian, topic="coffee",
+                                              quality_score=0.5, audience_score=score,
+                                              feedback_notes=[], timestamp=float(i)))
+    stats = feedback.get_comedian_stats("Dave")
+    assert stats["total_performances"] == 2 and stats["best_joke"] == "joke 0"
+    assert abs(stats["average_audience_score"] - 0.8) < 1e-9
+    assert [p["comedian"] for p in feedback.get_top_performers()] == ["Dave", "Sarah"]
+    assert feedback._get_comedian_historical_bonus("Dave") == 0.1
+
+    ratings = HumanRatingSystem(storage=db)
+    adaptive = AdaptiveComedySystem(storage=db)
+    assert ratings.add_rating("Why? Because.", "Lisa", "cats", "love")
+    adaptive.analyze_comedian_performance(ratings)
+    db.close()
+
+    db = ComedyDB(path)
+    assert len(ComedyFeedbackSystem(storage=db).feedback_history) == 3
+    reloaded = HumanRatingSystem(storage=db)
+    assert reloaded.get_global_stats()["comedian_stats"]["Lisa"] == {"avg": 2.0, "count": 1}
+    assert reloaded.patterns["Lisa"].preferred_topics == {"cats": 1}
+    assert AdaptiveComedySystem(storage=db).get_comedian_insights("Lisa")["total_improvements"] > 0
+    db.close()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test di fumo del servizio HTTP/WebSocket con il test client di aiohttp e un club finto
+"""
+import sys
+import os
+import asyncio
+from contextlib import contextmanager
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.core.show_pipeline import SHOW_END, JOKE, RESPONSE
+from src.service.comedy_service import ComedyService
+
+COMEDIANS = ["Dave", "Sarah", "Mike"]
+
+
+class FakeClub:
+    """Club finto con l'API async usata dal servizio"""
+
+    def __init__(self):
+        self.comedians = {name: {"style": "observational humor"} for name in COMEDIANS}
+        self.topics = ["coffee", "work"]
+        self.enhanced_rag = None
+        self.client = SimpleNamespace(telemetry=None)
+        self.async_client = SimpleNamespace(native=False, agenerate=self._reply)
+        self.ratings = []
+        self.session_users = 0
+        self.closed = False
+
+    async def agenerate_joke(self, comedian, topic, enhanced_tv_search=False):
+        return SimpleNamespace(comedian=comedian, topic=topic, text=f"joke about {topic}",
+                               source="fallback", analysis=None)
+
+    def _present_joke(self, joke):
+        return f"{joke.comedian}: {joke.text}"
+
+    async def _reply(self, prompt, max_tokens=None, stop=None, session=None):
+        return "Nice try."
+
+    def generation_profile(self, prompt_type):
+        return SimpleNamespace(max_tokens=80, stop=None)
+
+    def persona_session(self, comedian):
+        return None
+
+    @contextmanager
+    def persona_sessions(self):
+        self.session_users += 1
+        try:
+            yield
+        finally:
+            self.session_users -= 1
+
+    def rate_joke(self, joke, comedian, topic, rating, comment=None):
+        self.ratings.append((comedian, topic, rating))
+        return True
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def _run(club, scenario):
+    client = TestClient(TestServer(ComedyService(club).make_app()))
+    await client.start_server()
+    try:
+        return await scenario(client)
+    finally:
+        await client.close()
+
+
+def test_service_session_show_and_rating():
+    """Sessione, battuta, spettacolo in streaming, voto e chiusura delle risorse"""
+    club = FakeClub()
+
+    async def scenario(client):
+        assert (await client.get("/health")).status == 200
+        assert club.session_users == 1  # sessioni persona aperte per tutto il servizio
+
+        response = await client.post("/sessions", json={"topic": "coffee"})
+        assert response.status == 201
+        session_id = (await response.json())["session_id"]
+
+        joke = await (await client.post(f"/sessions/{session_id}/joke", json={"comedian": "dave"})).json()
+        assert joke["joke"] == "Dave: joke about coffee"
+
+        acts = []
+        async with client.ws_connect(f"/sessions/{session_id}/show?rounds=1") as ws:
+            async for msg in ws:
+                acts.append(msg.json())
+                if acts[-1]["kind"] == SHOW_END:
+                    break
+        kinds = [act["kind"] for act in acts]
+        assert kinds.count(JOKE) == len(COMEDIANS) and kinds.count(RESPONSE) == len(COMEDIANS)
+
+        rated = await client.post(f"/sessions/{session_id}/rate",
+                                  json={"joke": joke["joke"], "comedian": "Dave", "rating": "love"})
+        assert (await rated.json()) == {"rated": True, "ratings": 1}
+        bad_rating = await client.post(f"/sessions/{session_id}/rate", json={"joke": "x", "rating": "wow"})
+        assert bad_rating.status == 400
+
+    asyncio.run(_run(club, scenario))
+    assert club.ratings == [("Dave", "coffee", "love")]
+    assert club.session_users == 0 and club.closed
+
+
+def test_show_rejects_non_numeric_rounds():
+    """rounds non numerico è un errore del client (400), non del server"""
+    club = FakeClub()
+
+    async def scenario(client):
+        session_id = (await (await client.post("/sessions", json={})).json())["session_id"]
+        response = await client.get(f"/sessions/{session_id}/show?rounds=abc")
+        assert response.status == 400
+        # La sessione resta utilizzabile
+        assert (await (await client.get(f"/sessions/{session_id}")).json())["show_running"] is False
+        assert (await client.get("/sessions/missing")).status == 404
+
+    asyncio.run(_run(club, scenario))
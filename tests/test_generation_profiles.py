@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test per i profili di generazione (budget di token e stop sequence)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.generation_profiles import GenerationProfiles, DEFAULT_PROFILES
+
+
+def test_defaults_without_enough_samples():
+    """Con pochi campioni restano i budget di default"""
+    profiles = GenerationProfiles.from_history([{"joke": "short joke"}] * 5)
+    for name, default in DEFAULT_PROFILES.items():
+        assert profiles.get(name).max_tokens == default.max_tokens
+        assert profiles.get(name).learned_from == 0
+
+
+def test_budget_learned_and_clamped():
+    """Il budget segue il p95 osservato, entro minimo e default del profilo"""
+    history = [{"joke": " ".join(["word"] * 20)} for _ in range(30)]
+    profiles = GenerationProfiles.from_history(history)
+    # 20 parole -> 26 token, x1.25 -> 33, sotto il minimo di rag_joke (48)
+    assert profiles.get("rag_joke").max_tokens == DEFAULT_PROFILES["rag_joke"].min_tokens
+
+    history = [{"joke": " ".join(["word"] * 50)} for _ in range(30)]
+    profiles = GenerationProfiles.from_history(history)
+    # 50 parole -> 65 token, x1.25 -> 82: ridotto per rag_joke, limitato al default per fallback_joke
+    assert profiles.get("rag_joke").max_tokens == 82
+    assert profiles.get("fallback_joke").max_tokens == DEFAULT_PROFILES["fallback_joke"].max_tokens
+    # Nessuna risposta ai dibattiti nei log: default
+    assert profiles.get("debate").learned_from == 0
+
+
+def test_responses_learned_from_ratings():
+    """Le risposte dei dibattiti nei rating alimentano il profilo debate"""
+    ratings = [{"joke": "Dave: " + " ".join(["word"] * 40), "comedian": "Dave",
+                "context": {"is_response": True}} for _ in range(25)]
+    profiles = GenerationProfiles.from_history([], ratings)
+    assert profiles.get("debate").learned_from == 25
+    assert profiles.get("debate").max_tokens == 65  # 40 parole -> 52 token x1.25
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test per il sistema di rating umano: pattern con contatori, statistiche incrementali
+e analisi adattiva guidata dagli eventi, con cache dei frammenti di prompt
+"""
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.human_rating import HumanRatingSystem
+from src.utils.storage import RetentionPolicy
+from src.utils.adaptive_comedy import AdaptiveComedySystem
+
+
+def test_counted_patterns_and_incremental_stats(tmp_path):
+    """Elementi e topic pesati per frequenza; statistiche globali uguali dopo il ricaricamento"""
+    data_file = str(tmp_path / "human_ratings.json")
+    ratings = HumanRatingSystem(data_file)
+    ratings.add_rating("Why is coffee so bitter?", "Dave", "coffee", "love")
+    ratings.add_rating("A short one", "Dave", "work", "like")
+    ratings.add_rating("Another short one", "Dave", "work", "like")
+    ratings.add_rating("Bad joke", "Mike", "cats", "hate")
+
+    pattern = ratings.patterns["Dave"]
+    assert pattern.top_topics() == ["work", "coffee"]
+    assert pattern.successful_elements["short_joke"] == 3
+    assert ratings.patterns["Mike"].top_failed(1) == ["short_joke"]
+
+    stats = ratings.get_global_stats()
+    assert stats["total_ratings"] == 4 and stats["best_performer"] == "Dave"
+    assert stats["comedian_stats"]["Mike"] == {"avg": -2.0, "count": 1}
+    assert abs(stats["avg_global_rating"] - 0.5) < 1e-9
+
+    with open(data_file, encoding='utf-8') as f:
+        assert json.load(f)["patterns"]["Dave"]["preferred_topics"] == {"coffee": 1, "work": 2}
+    assert HumanRatingSystem(data_file).get_global_stats() == stats
+
+
+def test_recent_buffer_and_top_k(tmp_path):
+    """Recenti dal buffer circolare e migliori battute per comico, anche dopo il ricaricamento"""
+    data_file = str(tmp_path / "human_ratings.json")
+    ratings = HumanRatingSystem(data_file, recent_capacity=3, top_k=2)
+    for i, vote in enumerate(["meh", "love", "like", "love", "hate"]):
+        ratings.add_rating(f"joke {i}", "Dave", "coffee", vote)
+
+    assert [r.joke for r in ratings.get_recent_ratings(2)] == ["joke 4", "joke 3"]
+    assert [r.joke for r in ratings.get_recent_ratings(10)] == [f"joke {i}" for i in range(4, -1, -1)]
+    assert [r.joke for r in ratings.get_top_ratings("Dave")] == ["joke 3", "joke 1"]
+    assert ratings.get_top_ratings("Mike") == []
+
+    reloaded = HumanRatingSystem(data_file, recent_capacity=3, top_k=2)
+    assert [r.joke for r in reloaded.get_recent_ratings(3)] == ["joke 4", "joke 3", "joke 2"]
+    assert [r.joke for r in reloaded.get_top_ratings("Dave", 1)] == ["joke 3"]
+
+
+def test_totals_follow_retention(tmp_path):
+    """Oltre il limite di retention totali, recenti e top-k contano solo i rating rimasti nel file"""
+    data_file = str(tmp_path / "human_ratings.json")
+    ratings = HumanRatingSystem(data_file, retention=RetentionPolicy(max_records=4), top_k=2)
+    versions = []
+    for i, vote in enumerate(["love", "love", "meh", "like", "meh"]):
+        ratings.add_rating(f"joke {i}", "Dave", "coffee", vote)
+        versions.append(ratings.rating_version("Dave"))
+
+    assert len(ratings.ratings) == 3  # compattato a 0.75 del limite
+    stats = ratings.get_global_stats()
+    assert stats["total_ratings"] == len(ratings.ratings)
+    assert stats["comedian_stats"]["Dave"]["count"] == len(ratings.ratings)
+    assert [r.joke for r in ratings.get_recent_ratings(10)] == ["joke 4", "joke 3", "joke 2"]
+    assert [r.joke for r in ratings.get_top_ratings("Dave")] == ["joke 3", "joke 4"]
+    assert versions == sorted(set(versions))  # la versione non torna mai indietro
+
+    reloaded = HumanRatingSystem(data_file, retention=RetentionPolicy(max_records=4), top_k=2)
+    assert reloaded.get_global_stats() == stats
+
+
+def _improvement_files(tmp_path):
+    return str(tmp_path / "comedy_improvements.jsonl"), str(tmp_path / "comedy_improvements.json")
+
+
+def test_adaptive_system_reanalyzes_only_rated_comedians(tmp_path):
+    """Gli eventi di rating segnano i comici: process_pending analizza e salva solo quelli"""
+    ratings = HumanRatingSystem(str(tmp_path / "human_ratings.json"))
+    ratings.add_rating("Why is coffee so bitter?", "Dave", "coffee", "love")
+    adaptive = AdaptiveComedySystem(*_improvement_files(tmp_path))
+    adaptive.attach(ratings)
+    assert adaptive.process_pending() == {}
+
+    ratings.add_rating("Bad joke", "Mike", "cats", "hate")
+    ratings.add_rating("Worse joke", "Mike", "cats", "hate")
+    result = adaptive.process_pending()
+    assert list(result) == ["Mike"] and result["Mike"][0].improvement_type == "style"
+    assert {imp.comedian for imp in adaptive.improvements} == {"Mike"}
+    assert AdaptiveComedySystem(*_improvement_files(tmp_path)).improvements == adaptive.improvements
+
+    adaptive.detach()
+    ratings.add_rating("Another one", "Dave", "work", "like")
+    assert adaptive.process_pending() == {}
+
+
+def test_adaptive_prompt_fragment_cached_per_rating_version(tmp_path):
+    """Il frammento di prompt si ricalcola solo quando il comico riceve nuovi rating"""
+    ratings = HumanRatingSystem(str(tmp_path / "human_ratings.json"))
+    adaptive = AdaptiveComedySystem(*_improvement_files(tmp_path))
+    adaptive.attach(ratings)
+    assert adaptive.get_enhanced_prompt("Dave", "base", ratings) == "base"
+
+    ratings.add_rating("Why is coffee so bitter?", "Dave", "coffee", "love")
+    first = adaptive.get_adaptive_fragment("Dave", ratings)
+    assert "TOPIC DI SUCCESSO: coffee" in first
+    assert adaptive.get_enhanced_prompt("Dave", "base", ratings) == f"base\n\n{first}"
+    assert (adaptive.prompt_cache_hits, adaptive.prompt_cache_misses) == (1, 2)
+
+    ratings.add_rating("Bad joke about work", "Mike", "work", "hate")
+    assert adaptive.get_adaptive_fragment("Dave", ratings) == first  # altro comico: ancora in cache
+    ratings.add_rating("A short one", "Dave", "work", "like")
+    assert "TOPIC DI SUCCESSO: coffee, work" in adaptive.get_adaptive_fragment("Dave", ratings)
+    assert (adaptive.prompt_cache_hits, adaptive.prompt_cache_misses) == (2, 3)
+
+
+def test_improvements_appended_to_log_and_legacy_migrated(tmp_path):
+    """I nuovi miglioramenti vanno in fondo al log JSONL; il vecchio JSON viene solo letto"""
+    log_file, legacy_file = _improvement_files(tmp_path)
+    legacy = json.dumps({
+        "improvements": [{"comedian": "Lisa", "improvement_type": "topic", "suggestion": "s",
+                          "confidence": 0.7, "based_on_ratings": 3, "timestamp": 1.0}],
+        "learned_patterns": {"Lisa": {"favourite": "science"}}
+    })
+    (tmp_path / "comedy_improvements.json").write_text(legacy)
+
+    ratings = HumanRatingSystem(str(tmp_path / "human_ratings.json"))
+    adaptive = AdaptiveComedySystem(log_file, legacy_file)
+    assert [imp.comedian for imp in adaptive.improvements] == ["Lisa"]
+    assert adaptive.learned_patterns == {"Lisa": {"favourite": "science"}}
+    adaptive.attach(ratings)
+
+    ratings.add_rating("Bad joke", "Mike", "cats", "hate")
+    adaptive.process_pending()
+    with open(log_file, encoding="utf-8") as f:
+        first_lines = f.readlines()
+    ratings.add_rating("Great joke", "Dave", "coffee", "love")
+    adaptive.process_pending()
+    adaptive.close()
+
+    with open(log_file, encoding="utf-8") as f:
+        lines = f.readlines()
+    assert lines[:len(first_lines)] == first_lines and len(lines) > len(first_lines)  # solo append
+    assert (tmp_path / "comedy_improvements.json").read_text() == legacy
+    assert AdaptiveComedySystem(log_file, legacy_file).improvements == adaptive.improvements
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test del pool di battute pronte con un club finto: consumo e riempimento, invalidazione
+al cambio di tema, scarto dei rifiuti e generazione silenziosa senza toccare sys.stdout
+"""
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.joke_pool import JokePool
+from src.utils.console import log, quiet_output
+
+REFUSAL = "I'm sorry, but I can't create jokes about that topic."
+
+
+class FakeClub:
+    """Club finto: battute numerate per (comico, tema), latenza e rifiuti configurabili"""
+
+    def __init__(self, latency=0.0, refuse=()):
+        self.comedians = {"Dave": {}, "Sarah": {}}
+        self.latency = latency
+        self.refuse = set(refuse)  # comici che rispondono sempre con un rifiuto
+        self.calls = []
+        self.quiet_calls = 0  # generazioni richieste con quiet=True
+        self._lock = threading.Lock()
+
+    def generate_joke(self, comedian, topic, enhanced_tv_search=False, quiet=False):
+        time.sleep(self.latency)
+        with quiet_output(quiet):
+            log(f"🎭 {comedian} genera in background")
+        with self._lock:
+            self.calls.append((comedian, topic))
+            self.quiet_calls += quiet
+            number = len(self.calls)
+        text = REFUSAL if comedian in self.refuse else f"{comedian} #{number} on {topic}"
+        return SimpleNamespace(comedian=comedian, topic=topic, text=text)
+
+    def _is_ai_refusal(self, text):
+        return text == REFUSAL
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not condition():
+        time.sleep(0.01)
+    return condition()
+
+
+def test_take_serves_ready_jokes_and_refills():
+    """Le battute pronte vengono servite subito e il buffer torna pieno in background"""
+    club = FakeClub()
+    pool = JokePool(club, size=2, workers=2)
+    pool.set_topic("coffee")
+    assert wait_until(lambda: pool.ready() == 4)
+
+    joke = pool.take("Dave", "coffee")
+    assert joke.topic == "coffee" and joke.comedian == "Dave"
+    assert wait_until(lambda: pool.ready("Dave") == 2)
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["discarded"]) == (1, 0, 0)
+    assert len(club.calls) == 5
+    pool.close()
+
+
+def test_topic_change_invalidates_pool():
+    """Un tema nuovo scarta le battute pronte e quelle ancora in preparazione"""
+    club = FakeClub(latency=0.05)
+    pool = JokePool(club, size=1, workers=2)
+    pool.set_topic("coffee")
+    assert wait_until(lambda: pool.ready() == 2)
+
+    joke = pool.take("Sarah", "work")
+    assert joke.topic == "work"
+    assert pool.stats()["topic"] == "work"
+    assert wait_until(lambda: pool.ready("Sarah") == 1)
+    assert pool.ready("Dave") == 0  # solo il comico richiesto viene riempito
+    assert all(j.topic == "work" for buffer in pool._buffers.values() for j in buffer)
+    assert pool.stats()["discarded"] == 2  # le due battute sul caffè
+    pool.close()
+
+
+def test_refusals_are_discarded():
+    """I rifiuti del modello non entrano nel pool: take restituisce None"""
+    pool = JokePool(FakeClub(refuse={"Dave"}), size=1, workers=1, wait_timeout=1.0)
+    assert pool.take("Dave", "coffee") is None
+    stats = pool.stats()
+    assert stats["misses"] == 1 and stats["discarded"] >= 1
+    assert pool.ready("Dave") == 0
+    pool.close()
+
+
+def test_quiet_refill_leaves_stdout_alone(capsys):
+    """Le generazioni in background sono silenziose tramite quiet, senza sostituire sys.stdout"""
+    stdout = sys.stdout
+    club = FakeClub(latency=0.05)
+    pool = JokePool(club, size=1, workers=2)
+    pool.set_topic("coffee")
+    assert sys.stdout is stdout
+    assert wait_until(lambda: pool.ready() == 2)
+    print("primo piano")  # il thread chiamante stampa normalmente
+    pool.close()
+
+    assert club.quiet_calls == 2
+    output = capsys.readouterr().out
+    assert "primo piano" in output and "background" not in output
+    assert sys.stdout is stdout
+
+
+def test_loud_pool_prints_refill_progress(capsys):
+    """Con quiet=False i messaggi delle generazioni in background restano visibili"""
+    pool = JokePool(FakeClub(), size=1, workers=1, quiet=False)
+    pool.set_topic("coffee")
+    assert wait_until(lambda: pool.ready() == 2)
+    pool.close()
+    assert "background" in capsys.readouterr().out
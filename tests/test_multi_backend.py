@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test del client multi-backend contro due server mock locali: scelta del backend meno
+carico, failover dopo un errore e richieste hedged
+"""
+import sys
+import os
+import time
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "scripts"))
+
+import pytest
+
+pytest.importorskip("config.orfeo_config_new", reason="configurazione Orfeo locale assente")
+
+from mock_orfeo_server import MockOrfeoServer, MockSettings
+from src.core.orfeo_multi_client import MultiBackendOrfeoClient
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(**settings):
+        server = MockOrfeoServer(settings=MockSettings(latency_dist="fixed", tokens_per_sec=0, **settings)).start()
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+def make_client(*servers, **kwargs):
+    return MultiBackendOrfeoClient(cache_mode="off", configs=[s.client_config() for s in servers], **kwargs)
+
+
+def test_least_outstanding_backend_is_picked(servers):
+    """Il backend con meno richieste in corso riceve le nuove richieste"""
+    client = make_client(servers(latency_ms=0), servers(latency_ms=0))
+    busy, idle = client.backends
+    busy.outstanding = 2
+
+    assert client._pick_backend() is idle
+    assert client._pick_backend() is idle
+    assert idle.outstanding == 2
+    assert client._pick_backend(exclude=(idle,)) is busy
+
+
+def test_failover_after_backend_error(servers):
+    """Un backend in errore viene scavalcato da un solo failover sull'altro"""
+    broken, healthy = servers(latency_ms=0, error_rate=1.0), servers(latency_ms=0)
+    client = make_client(broken, healthy)
+    bad, good = client.backends
+    good.outstanding = 1  # la prima richiesta va al backend rotto
+
+    assert client.generate("Tell me a joke")
+    good.outstanding -= 1
+    assert bad.failures == 1 and good.completed == 1
+    assert bad.outstanding == 0 and good.outstanding == 0
+    assert client.telemetry.summary()["retries"] == 1
+    assert healthy.stats()["requests"] == 1
+
+
+def test_hedge_wins_and_loser_is_not_counted(servers):
+    """La richiesta lenta viene duplicata: vince l'hedge, il perdente non sporca le statistiche"""
+    slow, fast = servers(latency_ms=1500), servers(latency_ms=50)
+    client = make_client(slow, fast, hedge=True, hedge_min_samples=5)
+    slow_backend, fast_backend = client.backends
+    client._latencies.extend([0.1] * 5)  # soglia di hedge: 0.1s
+    fast_backend.outstanding = 1  # la prima richiesta va al backend lento
+
+    start = time.perf_counter()
+    assert client.generate("Tell me a joke")
+    assert time.perf_counter() - start < 1.0
+    fast_backend.outstanding -= 1
+
+    assert client.hedges_sent == 1 and client.hedges_won == 1
+    assert fast_backend.completed == 1
+    assert client.telemetry.summary()["retries"] == 1
+
+    # Il tentativo perdente termina senza contare come completato, errore o latenza
+    deadline = time.time() + 5
+    while slow_backend.outstanding and time.time() < deadline:
+        time.sleep(0.05)
+    assert slow_backend.outstanding == 0
+    assert slow_backend.completed == 0 and slow_backend.failures == 0
+    assert max(client._latencies) < 1.0
+
+
+def test_failover_skips_every_backend_already_tried(servers):
+    """Se falliscono sia il primario sia l'hedge, il failover va su un backend non ancora provato"""
+    client = make_client(servers(latency_ms=0), servers(latency_ms=0), servers(latency_ms=0),
+                         hedge=True, hedge_min_samples=5)
+    primary, hedge, spare = client.backends
+    client._latencies.extend([0.1] * 5)  # soglia di hedge: 0.1s
+    hedge.outstanding, spare.outstanding = 1, 2  # primario, poi hedge sul secondo backend
+    used = []
+
+    def fake_request(config, *args, **kwargs):
+        used.append(config)
+        if config is primary.config:
+            time.sleep(0.3)
+            raise Exception("primario in errore")
+        if config is hedge.config:
+            raise Exception("hedge in errore")
+        return ["Battuta dal backend di riserva"]
+
+    client._request = fake_request
+    assert client.generate("Tell me a joke") == "Battuta dal backend di riserva"
+    assert used == [primary.config, hedge.config, spare.config]
+    assert primary.failures == 1 and hedge.failures == 1 and spare.completed == 1
+
+
+def test_queued_attempt_does_not_trigger_hedge(servers):
+    """Il tempo in coda nell'executor non consuma la soglia di hedge"""
+    client = make_client(servers(latency_ms=0), servers(latency_ms=0), hedge=True,
+                         hedge_min_samples=5, max_workers=1)
+    client._latencies.extend([0.1] * 5)  # soglia di hedge: 0.1s
+    client._executor.submit(time.sleep, 0.3)  # unico worker occupato
+
+    assert client.generate("Tell me a joke")
+    assert client.hedges_sent == 0
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test di OrfeoClient contro il server mock locale
+"""
+import sys
+import os
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+sys.path.append(os.path.join(REPO_ROOT, "scripts"))
+
+import pytest
+
+pytest.importorskip("config.orfeo_config_new", reason="configurazione Orfeo locale assente")
+
+from mock_orfeo_server import MockOrfeoServer, MockSettings
+from src.core.orfeo_client_new import OrfeoClient
+
+
+@pytest.fixture
+def mock_server():
+    server = MockOrfeoServer(settings=MockSettings(latency_dist="fixed", latency_ms=0, tokens_per_sec=0)).start()
+    yield server
+    server.stop()
+
+
+def test_candidates_in_one_request(mock_server):
+    """n candidate arrivano da una sola richiesta al backend"""
+    client = OrfeoClient(cache_mode="off", config=mock_server.client_config())
+    candidates = client.generate_candidates("Tell me a joke", n=3)
+
+    assert len(candidates) == 3
+    assert mock_server.stats()["requests"] == 1
+    assert client.telemetry.summary()["calls"] == 1
+
+
+RECORDING_CONFIG = {"model": "mock-llama3.3", "base_url": "http://orfeo.invalid", "api_key": "token"}
+
+
+class RecordingHTTP:
+    """Sessione HTTP finta: registra i payload; /chat/completions può essere disattivato"""
+
+    def __init__(self, chat_available=True):
+        self.chat_available = chat_available
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, timeout=None, stream=False):
+        self.posts.append((url.rsplit("/", 1)[-1], json))
+        if url.endswith("/chat/completions"):
+            if not self.chat_available:
+                return FakeResponse(404, {"error": "not found"})
+            return FakeResponse(200, {"choices": [{"message": {"content": "A joke"}}],
+                                      "usage": {"prompt_tokens": 10, "completion_tokens": 3}})
+        return FakeResponse(200, {"response": "OK", "context": [7, 8, 9], "eval_count": 1})
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        return self.payload
+
+    def close(self):
+        pass
+
+
+def test_persona_session_prefix_reused():
+    """Con una sessione aperta ogni richiesta porta lo stesso messaggio di sistema"""
+    client = OrfeoClient(cache_mode="off", config=RECORDING_CONFIG)
+    client._session = http = RecordingHTTP()
+    client.open_session("Dave-1", "You are Dave, a brutally honest comedian.")
+
+    client.generate("Joke about coffee", session="Dave-1")
+    client.generate("Joke about work", session="Dave-1")
+
+    first, second = (payload["messages"] for _, payload in http.posts)
+    assert first[0] == second[0] == {"role": "system", "content": "You are Dave, a brutally honest comedian."}
+    assert (first[1]["content"], second[1]["content"]) == ("Joke about coffee", "Joke about work")
+    assert all(payload["keep_alive"] == client.keep_alive for _, payload in http.posts)
+
+
+def test_ollama_session_context_primed_once():
+    """Sul fallback Ollama il prefisso viene elaborato una volta e il context riusato"""
+    client = OrfeoClient(cache_mode="off", config=RECORDING_CONFIG)
+    client._session = http = RecordingHTTP(chat_available=False)
+    client.open_session("Lisa-1", "You are Lisa, a mad scientist comic.")
+
+    client.generate("Joke about coffee", session="Lisa-1")
+    client.generate("Joke about work", session="Lisa-1")
+
+    generates = [payload for endpoint, payload in http.posts if endpoint == "generate"]
+    primes = [payload for payload in generates if payload.get("system")]
+    jokes = [payload for payload in generates if "context" in payload]
+    assert len(primes) == 1 and primes[0]["system"] == "You are Lisa, a mad scientist comic."
+    assert [payload["prompt"] for payload in jokes] == ["Joke about coffee", "Joke about work"]
+    assert all(payload["context"] == [7, 8, 9] for payload in jokes)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Test per il profiling campionato delle battute
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.profiling import SampledProfiler
+
+
+def _busy_joke(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_one_in_n_and_nested_calls_count_once(tmp_path):
+    """Una battuta ogni N, e get_joke -> generate_joke conta come una sola battuta"""
+    profiler = SampledProfiler(every=2, mode="sampler", output=str(tmp_path / "prof"), interval=0.001)
+    for _ in range(4):
+        with profiler.profile("Dave"):
+            with profiler.profile("Dave"):
+                _busy_joke(0.03)
+    written = profiler.close()
+    assert (profiler.calls, profiler.sampled) == (4, 2)
+    assert written == [str(tmp_path / "prof.folded")]
+    lines = (tmp_path / "prof.folded").read_text().splitlines()
+    assert any(line.startswith("Dave;") and "test_profiling.py:_busy_joke" in line for line in lines)
+
+
+def test_cprofile_mode_writes_prof_and_folded(tmp_path):
+    """In modalità cProfile vengono scritti sia il .prof sia le coppie chiamante;chiamato"""
+    profiler = SampledProfiler(every=1, mode="cprofile", output=str(tmp_path / "prof"))
+    with profiler.profile():
+        _busy_joke(0.01)
+    written = profiler.close()
+    assert sorted(written) == [str(tmp_path / "prof.folded"), str(tmp_path / "prof.prof")]
+    assert "_busy_joke" in (tmp_path / "prof.folded").read_text()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Test per la cache content-addressed delle risposte LLM
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.core.response_cache import ResponseCache, CacheMiss
+
+
+def test_key_depends_on_generation_params():
+    """La chiave cambia con modello, prompt, temperature e max_tokens"""
+    base = ResponseCache.make_key("llama3.3", "joke", 0.7, 150)
+    assert base == ResponseCache.make_key("llama3.3", "joke", 0.7, 150)
+    assert base != ResponseCache.make_key("llama3.3", "joke", 0.8, 150)
+    assert base != ResponseCache.make_key("llama3.3", "joke", 0.7, 80)
+    assert base != ResponseCache.make_key("other", "joke", 0.7, 150)
+    # Parametri extra vuoti non cambiano la chiave
+    assert base == ResponseCache.make_key("llama3.3", "joke", 0.7, 150, stop=None)
+
+
+def test_read_through_then_replay(tmp_path):
+    """Una risposta salvata in read_through viene servita in replay"""
+    key = ResponseCache.make_key("llama3.3", "joke", 0.7, 150)
+
+    writer = ResponseCache(cache_dir=str(tmp_path), mode="read_through")
+    assert writer.get(key) is None
+    writer.put(key, "Why did the GPU cry? Too many layers.")
+
+    replay = ResponseCache(cache_dir=str(tmp_path), mode="replay")
+    assert replay.get(key) == "Why did the GPU cry? Too many layers."
+    assert replay.stats()["hits"] == 1
+
+    with pytest.raises(CacheMiss):
+        replay.get(ResponseCache.make_key("llama3.3", "other", 0.7, 150))
+
+
+def test_off_mode_never_touches_disk(tmp_path):
+    """In modalità off la cache non legge né scrive"""
+    cache = ResponseCache(cache_dir=str(tmp_path / "cache"), mode="off")
+    cache.put("abc", "response")
+    assert cache.get("abc") is None
+    assert not (tmp_path / "cache").exists()
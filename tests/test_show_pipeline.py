@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test della pipeline dello spettacolo con un club finto: ordine degli atti, look-ahead
+limitato e arresto del produttore
+"""
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import show_pipeline
+from src.core.show_pipeline import ShowPipeline
+
+COMEDIANS = ["Dave", "Sarah", "Mike"]
+
+
+class FakeClub:
+    """Club finto: battute e repliche con latenza configurabile, conta le generazioni"""
+
+    def __init__(self, joke_latency=0.0, reply_latencies=None):
+        self.comedians = {name: {"style": "observational humor"} for name in COMEDIANS}
+        self.joke_latency = joke_latency
+        self.reply_latencies = reply_latencies or {}
+        self.jokes_generated = 0
+        self.client = SimpleNamespace(generate=self._reply)
+        self._lock = threading.Lock()
+
+    def get_joke(self, comedian, topic, enhanced_tv_search=False):
+        time.sleep(self.joke_latency)
+        with self._lock:
+            self.jokes_generated += 1
+        return f"{comedian}: joke about {topic}"
+
+    def _reply(self, prompt, max_tokens=None, stop=None, session=None):
+        time.sleep(self.reply_latencies.get(session, 0.0))
+        return f"{session} replies"
+
+    def generation_profile(self, prompt_type):
+        return SimpleNamespace(max_tokens=80, stop=None)
+
+    def persona_session(self, comedian):
+        return comedian  # la replica sa quale comico la sta generando
+
+
+def drain(pipeline, timeout=5.0):
+    acts, deadline = [], time.time() + timeout
+    while time.time() < deadline:
+        act = pipeline.next_act()
+        if act is None:
+            continue
+        acts.append(act)
+        if act.kind == show_pipeline.SHOW_END:
+            break
+    return acts
+
+
+def test_acts_come_out_in_stage_order():
+    """Round, battute nell'ordine di scena, dibattito e fine spettacolo"""
+    pipeline = ShowPipeline(FakeClub(), "coffee", COMEDIANS, rounds=2, depth=2, debate=False).start()
+    acts = drain(pipeline)
+
+    round_acts = [show_pipeline.ROUND_START] + [show_pipeline.JOKE] * 3
+    assert [act.kind for act in acts] == round_acts * 2 + [show_pipeline.SHOW_END]
+    assert [act.comedian for act in acts if act.kind == show_pipeline.JOKE] == COMEDIANS * 2
+    assert [act.round_num for act in acts if act.kind == show_pipeline.ROUND_START] == [1, 2]
+
+
+def test_lookahead_is_bounded_and_stop_ends_producer():
+    """Il produttore non va oltre depth atti pronti; stop() lo termina anche a coda piena"""
+    club = FakeClub(joke_latency=0.01)
+    pipeline = ShowPipeline(club, "coffee", COMEDIANS, rounds=3, depth=2, debate=False).start()
+    time.sleep(0.3)  # nessun consumo: la coda si riempie e il produttore si blocca
+
+    assert pipeline.ready == 2
+    assert club.jokes_generated == 2  # ROUND_START e una battuta in coda, la seconda attende
+    assert pipeline.next_act().kind == show_pipeline.ROUND_START
+
+    pipeline.stop()
+    generated = club.jokes_generated
+    assert not pipeline._thread.is_alive()
+    assert pipeline.ready == 0
+    time.sleep(0.1)
+    assert club.jokes_generated == generated
+
+
+def test_debate_replies_concurrent_and_queued_in_pair_order():
+    """Le repliche partono insieme ma arrivano sul palco nell'ordine delle coppie"""
+    reply_latencies = {"Dave": 0.3, "Sarah": 0.1, "Mike": 0.2}
+    pipeline = ShowPipeline(FakeClub(reply_latencies=reply_latencies), "coffee", COMEDIANS,
+                            rounds=1, depth=8).start()
+    acts = drain(pipeline)
+
+    kinds = [act.kind for act in acts]
+    debate = acts[kinds.index(show_pipeline.DEBATE_START) + 1:kinds.index(show_pipeline.DEBATE_END)]
+    assert [act.kind for act in debate] == [show_pipeline.RESPONSE] * 3
+    assert [act.comedian for act in debate] == COMEDIANS
+    assert all(act.text == f"{act.comedian} replies" for act in debate)
+    assert all(act.responding_to in COMEDIANS and act.responding_to != act.comedian for act in debate)
+    # Generate insieme: il dibattito dura quanto la replica più lenta, non la somma
+    assert debate[-1].timestamp - acts[kinds.index(show_pipeline.DEBATE_START)].timestamp < 0.45
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test per lo storage dei log: JSONL append-only, aggregati, scritture in background,
+scritture atomiche con recupero e compattazione
+"""
+import sys
+import os
+import json
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.utils.storage import (JsonlLog, RetentionPolicy, WriteBehindWriter, atomic_write_json,
+                               load_json_document, migrate_json_array)
+from src.utils.human_rating import HumanRatingSystem
+from src.utils.adaptive_comedy import AdaptiveComedySystem
+from src.utils.comedy_feedback import ComedyFeedbackSystem, JokeFeedback
+
+
+def _feedback(i):
+    return JokeFeedback(joke=f"joke {i}", comedian="Dave", topic="coffee", quality_score=0.5,
+                        audience_score=0.6, feedback_notes=[], timestamp=float(i))
+
+
+def test_append_and_truncated_tail_is_skipped(tmp_path):
+    """Una riga troncata in coda viene saltata al caricamento"""
+    log = JsonlLog(str(tmp_path / "log.jsonl"), fsync_every=2)
+    for i in range(3):
+        log.append({"i": i})
+    log.close()
+    with open(log.path, 'a', encoding='utf-8') as f:
+        f.write('{"i": 3, "jok')  # scrittura interrotta
+
+    assert [r["i"] for r in log.iter_records()] == [0, 1, 2]
+    assert log.skipped_lines == 1
+    log.compact(log.load())
+    assert JsonlLog(log.path).load() == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert not os.path.exists(log.path + ".tmp")
+
+
+def test_feedback_migrated_from_legacy_json_and_appended(tmp_path):
+    """Lo storico JSON legacy viene importato una volta, poi i feedback sono solo appesi"""
+    legacy = tmp_path / "comedy_feedback.json"
+    legacy.write_text(json.dumps([{"joke": "old", "comedian": "Mike", "audience_score": 0.4}]))
+    feedback_file = str(tmp_path / "comedy_feedback.jsonl")
+
+    system = ComedyFeedbackSystem(feedback_file, legacy_file=str(legacy))
+    system.record_feedback(_feedback(1))
+    system.close()
+    assert migrate_json_array(str(legacy), JsonlLog(feedback_file)) == 0  # già migrato
+
+    reloaded = ComedyFeedbackSystem(feedback_file, legacy_file=str(legacy))
+    assert [f["joke"] for f in reloaded.feedback_history] == ["old", "joke 1"]
+    with open(feedback_file, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+
+
+def test_feedback_aggregates_incremental_and_rebuilt(tmp_path):
+    """Gli aggregati per comico/topic aggiornati in append coincidono con quelli ricostruiti al caricamento"""
+    feedback_file = str(tmp_path / "comedy_feedback.jsonl")
+    system = ComedyFeedbackSystem(feedback_file, legacy_file=None, recent_window=2)
+    scores = [0.2, 0.3, 0.9, 0.8]
+    for i, score in enumerate(scores):
+        system.record_feedback(JokeFeedback(joke=f"joke {i}", comedian="Dave", topic="coffee" if i else "work",
+                                            quality_score=0.5, audience_score=score,
+                                            feedback_notes=[], timestamp=float(i)))
+    system.close()
+
+    stats = system.get_comedian_stats("Dave")
+    assert stats["total_performances"] == 4
+    assert abs(stats["average_audience_score"] - sum(scores) / 4) < 1e-9
+    assert abs(stats["recent_audience_score"] - 0.85) < 1e-9
+    assert stats["best_joke"] == "joke 2" and stats["best_topic"] == "coffee"
+    assert stats["improvement_trend"] == "📈 In miglioramento!"
+    assert system.get_topic_stats("work")["total_performances"] == 1
+    assert system._get_comedian_historical_bonus("Dave") == 0.0
+
+    reloaded = ComedyFeedbackSystem(feedback_file, legacy_file=None, recent_window=2)
+    assert reloaded.get_comedian_stats("Dave") == stats
+    assert reloaded.get_top_performers() == system.get_top_performers()
+
+
+def test_historical_bonus_counts_missing_audience_as_neutral(tmp_path):
+    """Nel bonus storico i feedback legacy senza audience_score valgono 0.5, come in origine"""
+    feedback_file = tmp_path / "comedy_feedback.jsonl"
+    legacy = [{"joke": f"joke {i}", "comedian": "Dave", "topic": "coffee", "quality_score": 0.5,
+               "timestamp": float(i)} for i in range(2)]
+    legacy.append({"joke": "joke 2", "comedian": "Dave", "topic": "coffee", "quality_score": 0.5,
+                   "audience_score": 0.9, "timestamp": 2.0})
+    feedback_file.write_text("".join(json.dumps(entry) + "\n" for entry in legacy))
+
+    system = ComedyFeedbackSystem(str(feedback_file), legacy_file=None)
+    assert system._get_comedian_historical_bonus("Dave") == 0.0  # media (0.5 + 0.5 + 0.9) / 3
+    assert abs(system.get_comedian_stats("Dave")["average_audience_score"] - 0.3) < 1e-9
+    system.close()
+
+
+def test_feedback_stats_match_after_reload_with_retention(tmp_path):
+    """Con la retention attiva le statistiche in memoria coincidono con quelle dopo un riavvio"""
+    feedback_file = str(tmp_path / "comedy_feedback.jsonl")
+    retention = RetentionPolicy(max_bytes=2000)
+    system = ComedyFeedbackSystem(feedback_file, legacy_file=None, recent_window=3, retention=retention)
+    for i in range(30):
+        system.record_feedback(JokeFeedback(joke=f"joke {i} " + "x" * 50, comedian="Dave",
+                                            topic=["coffee", "work"][i % 2], quality_score=0.5,
+                                            audience_score=i / 30, feedback_notes=[], timestamp=float(i)))
+    system.close()
+    assert len(system.feedback_history) < 30  # la retention ha archiviato i più vecchi
+
+    reloaded = ComedyFeedbackSystem(feedback_file, legacy_file=None, recent_window=3, retention=retention)
+    assert len(reloaded.feedback_history) == len(system.feedback_history)
+    assert system.get_comedian_stats("Dave") == reloaded.get_comedian_stats("Dave")
+    assert system.get_topic_stats("coffee") == reloaded.get_topic_stats("coffee")
+    assert system.get_comedian_stats("Dave")["total_performances"] == len(system.feedback_history)
+
+
+def test_feedback_readers_safe_with_concurrent_new_comedians(tmp_path):
+    """Le letture degli aggregati non falliscono mentre altri thread aggiungono comici nuovi"""
+    system = ComedyFeedbackSystem(str(tmp_path / "comedy_feedback.jsonl"), legacy_file=None)
+    errors = []
+
+    def record(worker):
+        for i in range(100):
+            system.record_feedback(JokeFeedback(joke="joke", comedian=f"Comico {worker}-{i}", topic="coffee",
+                                                quality_score=0.5, audience_score=0.6,
+                                                feedback_notes=[], timestamp=float(i)))
+
+    writers = [threading.Thread(target=record, args=(w,)) for w in range(4)]
+    for thread in writers:
+        thread.start()
+    while any(thread.is_alive() for thread in writers):
+        try:
+            system.get_top_performers()
+            system._get_comedian_historical_bonus("Comico 0-0")
+        except RuntimeError as e:
+            errors.append(e)
+    for thread in writers:
+        thread.join()
+    system.close()
+
+    assert not errors
+    assert len(system.get_top_performers(limit=1000)) == 400
+
+
+def test_write_behind_coalesces_and_flushes(tmp_path):
+    """Le scritture con la stessa chiave in coda si fondono; flush e close le portano su disco"""
+    writer = WriteBehindWriter()
+    gate = threading.Event()
+    writer.submit(gate.wait)  # tiene occupato il worker mentre si accodano i salvataggi
+    data_file = str(tmp_path / "human_ratings.json")
+    ratings = HumanRatingSystem(data_file, writer=writer)
+    for rating in ("love", "like", "meh"):
+        assert ratings.add_rating("Why? Because.", "Lisa", "cats", rating)
+    assert not os.path.exists(data_file)  # nessuna scrittura nel thread chiamante
+    gate.set()
+    assert writer.flush(timeout=5)
+    assert writer.coalesced == 2
+    with open(data_file, encoding='utf-8') as f:
+        assert len(json.load(f)["ratings"]) == 3
+
+    feedback_file = str(tmp_path / "comedy_feedback.jsonl")
+    system = ComedyFeedbackSystem(feedback_file, legacy_file=None, writer=writer)
+    system.record_feedback(_feedback(1))
+    writer.close()
+    system.close()
+    assert [f["joke"] for f in JsonlLog(feedback_file).load()] == ["joke 1"]
+    with pytest.raises(RuntimeError):  # writer chiuso: nessuna scrittura nascosta nel chiamante
+        writer.submit(lambda: None)
+
+
+def test_atomic_json_recovers_empty_file_from_backups(tmp_path):
+    """Un file vuoto (riscrittura interrotta) viene recuperato dal .bak o dai vecchi backup"""
+    path = str(tmp_path / "comedy_improvements.json")
+    (tmp_path / "comedy_improvements_backup_20250727_183339.json").write_text(json.dumps(
+        {"improvements": [{"comedian": "Mike", "improvement_type": "topic", "suggestion": "s",
+                           "confidence": 0.7, "based_on_ratings": 3, "timestamp": 1.0}],
+         "learned_patterns": {}}))
+    open(path, 'w').close()
+
+    adaptive = AdaptiveComedySystem(str(tmp_path / "comedy_improvements.jsonl"), legacy_file=path)
+    assert [imp.comedian for imp in adaptive.improvements] == ["Mike"]
+
+    atomic_write_json(path, {"v": 1})
+    atomic_write_json(path, {"v": 2})
+    with open(path, 'w') as f:
+        f.write('{"v": 3, "trunc')  # file troncato
+    assert load_json_document(path) == {"v": 1}  # copia .bak della versione precedente
+    assert not [name for name in os.listdir(tmp_path) if ".tmp." in name]
+
+
+def test_retention_archives_oldest_records(tmp_path):
+    """Oltre il limite i record più vecchi finiscono in un archivio JSONL e il file resta limitato"""
+    data_file = str(tmp_path / "human_ratings.json")
+    ratings = HumanRatingSystem(data_file, retention=RetentionPolicy(max_records=4, keep_archives=1))
+    for i in range(5):
+        ratings.add_rating(f"joke {i}", "Dave", "coffee", "like")
+    assert [r.joke for r in ratings.ratings] == ["joke 2", "joke 3", "joke 4"]
+    assert ratings.patterns["Dave"].total_ratings == 5  # i pattern appresi restano
+    archives = [name for name in os.listdir(tmp_path) if ".archive-" in name]
+    assert len(archives) == 1
+    assert [r["joke"] for r in JsonlLog(str(tmp_path / archives[0])).load()] == ["joke 0", "joke 1"]
+
+    feedback_file = str(tmp_path / "comedy_feedback.jsonl")
+    JsonlLog(feedback_file).compact({"joke": "x" * 100, "comedian": "Dave", "timestamp": float(i)} for i in range(20))
+    system = ComedyFeedbackSystem(feedback_file, legacy_file=None, retention=RetentionPolicy(max_bytes=1000))
+    assert 0 < len(system.feedback_history) < 20
+    assert os.path.getsize(feedback_file) <= 1000
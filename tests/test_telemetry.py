@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test per la telemetria delle chiamate LLM: percentili degli istogrammi e conteggio token
+"""
+import sys
+import os
+import json
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.telemetry import CallRecord, ClientTelemetry, Histogram
+
+
+def test_histogram_percentiles_use_bucket_bounds():
+    """Il percentile è il limite del bucket che lo contiene, mai oltre il massimo osservato"""
+    histogram = Histogram(1.0, factor=2.0, buckets=4)  # limiti 1, 2, 4, 8
+    for value in [0.5, 1.5, 3.0, 3.0, 7.0]:
+        histogram.observe(value)
+
+    assert histogram.percentile(20) == 1.0
+    assert histogram.percentile(50) == 4.0
+    assert histogram.percentile(100) == 7.0
+    histogram.observe(100.0)  # bucket di overflow
+    assert histogram.percentile(100) == 100.0
+    assert Histogram(1.0).percentile(50) is None
+
+
+def test_token_accounting_and_atomic_dump(tmp_path):
+    """Token sommati solo per le chiamate reali; le chiamate catturate restano per thread"""
+    telemetry = ClientTelemetry()
+    with telemetry.capture() as captured:
+        telemetry.record(CallRecord(endpoint="chat", latency_s=0.2, prompt_tokens=30, completion_tokens=12))
+        telemetry.record(CallRecord(endpoint="chat", latency_s=0.4, prompt_tokens=20, completion_tokens=None,
+                                    retries=1, success=False))
+        # Una chiamata di un altro thread non finisce nella cattura di questo
+        other = threading.Thread(target=telemetry.record,
+                                 args=(CallRecord(endpoint="generate", latency_s=0.1, completion_tokens=5),))
+        other.start()
+        other.join()
+    telemetry.record(CallRecord(endpoint="cache", latency_s=0.0, prompt_tokens=99, cached=True))
+
+    assert len(captured) == 2
+    summary = telemetry.summary()
+    assert (summary["calls"], summary["failures"], summary["cache_hits"], summary["retries"]) == (4, 1, 1, 1)
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (50, 17)
+    assert summary["by_endpoint"] == {"chat": 2, "generate": 1}
+    assert summary["histograms"]["completion_tokens"]["count"] == 2
+
+    path = tmp_path / "telemetry.json"
+    telemetry.dump(str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data["completion_tokens"] == 17 and len(data["recent_calls"]) == 4
+    assert os.listdir(tmp_path) == ["telemetry.json"]  # nessun file temporaneo o .bak
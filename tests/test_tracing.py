@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test per il tracing a span annidati (formato Chrome trace)
+"""
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.tracing import Tracer
+
+
+def test_disabled_tracer_records_nothing():
+    """A tracing disattivato gli span sono no-op"""
+    tracer = Tracer()
+    with tracer.span("get_joke") as s:
+        s.set(comedian="Dave")
+    assert tracer.summary() == {}
+
+
+def test_nested_spans_export_and_self_time(tmp_path):
+    """Gli span annidati finiscono nella traccia e il tempo self esclude i figli"""
+    tracer = Tracer()
+    tracer.enable()
+    with tracer.span("get_joke", comedian="Dave"):
+        with tracer.span("llm.generate"):
+            time.sleep(0.02)
+        time.sleep(0.005)
+
+    summary = tracer.summary()
+    assert list(summary) == ["llm.generate", "get_joke"]  # ordinati per tempo self
+    assert summary["get_joke"]["self_s"] < summary["llm.generate"]["self_s"]
+    assert summary["get_joke"]["total_s"] >= summary["llm.generate"]["total_s"]
+
+    path = tmp_path / "trace.json"
+    assert tracer.export(str(path)) == 2
+    events = [e for e in json.loads(path.read_text())["traceEvents"] if e["ph"] == "X"]
+    outer = next(e for e in events if e["name"] == "get_joke")
+    inner = next(e for e in events if e["name"] == "llm.generate")
+    assert outer["args"] == {"comedian": "Dave"}
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_span_records_exception():
+    """Uno span chiuso da un'eccezione la riporta negli argomenti"""
+    tracer = Tracer()
+    tracer.enable()
+    try:
+        with tracer.span("rag.web_search"):
+            raise TimeoutError()
+    except TimeoutError:
+        pass
+    assert tracer._events[0]["args"]["error"] == "TimeoutError"